@@ -1,11 +1,55 @@
-from . import main_susquehanna
-from . import problem_formulation_euclidean
-from . import smash
-from . import problem_formulation_gini
-from . import problem_formulation_original
-from . import problem_formulation_euclidean
-from . import susquehanna_model
-from . import utils
-from . import rbf
-from . import lake_problem
-from . import susquehanna
+"""
+The Susquehanna river model, its problem formulations and optimisation
+scripts.
+
+Submodules are imported on first access, e.g. susquehanna.susquehanna_model,
+so that importing the package does not pull in platypus, pandas, scipy and
+numba. The modules import their siblings by their plain names and therefore
+expect this directory on the path, as when running the scripts from it.
+"""
+import importlib
+
+__all__ = [
+    "accumulators",
+    "benchmark_pickling",
+    "benchmark_startup",
+    "compiled_rbf_functions",
+    "data_cache",
+    "evaluation_cache",
+    "evaluation_store",
+    "evaluators",
+    "hydropower",
+    "kernels",
+    "lookup_tables",
+    "metrics",
+    "main_susquehanna",
+    "main_susquehanna_euclidean_all",
+    "main_susquehanna_gini_all",
+    "problem_formulation",
+    "problem_formulation_euclidean",
+    "problem_formulation_gini",
+    "problem_formulation_original",
+    "quantiles",
+    "racing",
+    "rbf_functions",
+    "shared_data",
+    "simulation_kernel",
+    "smash",
+    "surrogate",
+    "susquehanna_model",
+    "tabulated_policy",
+    "utils",
+    "workspace",
+]
+
+
+def __getattr__(name):
+    if name in __all__:
+        module = importlib.import_module(f".{name}", __name__)
+        globals()[name] = module
+        return module
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,214 @@
+"""
+Online accumulation of the objectives of SusquehannaModel.simulate.
+
+simulate used to keep every daily release, storage and hydropower value of
+the horizon and reduce them at the end. An ObjectiveAccumulator instead
+folds each simulated day into fixed-size state: running sums for the
+reliabilities and the revenue, a count of the days below the recreation
+target, and per-month sums of the daily reliabilities that the monthly
+equity objectives compare. Memory no longer grows with the number of
+simulated years. The same state with a leading policy axis serves
+SusquehannaModel.simulate_batch.
+"""
+import numpy as np
+
+import metrics
+
+N_MONTHS = 12
+
+
+class ObjectiveAccumulator:
+    """
+    Running state of the 13 objectives of one simulation, or of a population
+    of simulations advancing together
+
+    Parameters
+    ----------
+    w_atomic, w_baltimore, w_chester : numpy array
+                                       daily demands (365,)
+    min_flow : numpy array
+               daily environmental flow target (365,)
+    h_ref_rec : numpy array
+                daily recreation storage target (365,)
+    q_target_daily : float
+                     daily hydropower target (kWh/day), see
+                     SusquehannaModel.j_hydro_reliability_energy
+    n_days_in_year : int, optional
+    n_policies : int, optional
+                 if given, every value passed to add_day and returned by
+                 objectives has a leading policy axis of this length
+    """
+
+    def __init__(self, w_atomic, w_baltimore, w_chester, min_flow, h_ref_rec,
+                 q_target_daily, n_days_in_year=365, n_policies=None):
+        self.demands = np.stack([w_atomic, w_baltimore, w_chester])
+        self.min_flow = np.asarray(min_flow)
+        self.h_ref_rec = np.asarray(h_ref_rec)
+        self.q_target_daily = q_target_daily
+        self.n_days_in_year = n_days_in_year
+        self.n_target_days = np.sum(self.h_ref_rec > 0)
+
+        self.shape = () if n_policies is None else (n_policies,)
+        self.revenue = np.zeros(self.shape)
+        self.volumetric_sum = np.zeros(self.shape + (3,))
+        self.shortage_sum = np.zeros(self.shape)
+        self.hydro_reliability_sum = np.zeros(self.shape)
+        self.below_target = np.zeros(self.shape, dtype=int)
+        self.monthly_sum = np.zeros(self.shape + (5, N_MONTHS))
+        self.monthly_count = np.zeros(N_MONTHS)
+        self.reset(0.0)
+
+    def reset(self, storage, monthly=True):
+        """
+        Start a new simulation
+
+        Parameters
+        ----------
+        storage : float or numpy array
+                  initial storage of Conowingo
+        monthly : bool, optional
+                  if false, the monthly equity inputs are not accumulated
+        """
+        self.monthly = monthly
+        self.n_days = 0
+        self.revenue[...] = 0.0
+        self.volumetric_sum[...] = 0.0
+        self.shortage_sum[...] = 0.0
+        self.hydro_reliability_sum[...] = 0.0
+        self.monthly_sum[...] = 0.0
+        self.monthly_count[:] = 0.0
+        self.below_target[...] = storage < self.h_ref_rec[0]
+
+    def add_day(self, releases, storage, production, revenue):
+        """
+        Fold one simulated day into the state
+
+        Parameters
+        ----------
+        releases : numpy array
+                   average releases of the day to Atomic power plant,
+                   Baltimore, Chester and downstream, last axis (4,)
+        storage : float or numpy array
+                  storage of Conowingo at the end of the day
+        production : float or numpy array
+                     hydropower production of Conowingo per decision step
+                     (kWh), averaged over the day
+        revenue : float or numpy array
+                  hydropower revenue of Conowingo over the day ($)
+        """
+        t = self.n_days
+        day_of_year = t % self.n_days_in_year
+        min_flow = self.min_flow[day_of_year]
+
+        # volumetric reliability and shortage index, see g_vol_rel and
+        # g_shortage_index_daily
+        self.volumetric_sum += releases[..., :3] / self.demands[:, day_of_year]
+        shortage = np.maximum(min_flow - releases[..., 3], 0) / min_flow
+        self.shortage_sum += np.square(shortage)
+
+        # storage reliability, see g_storagereliability
+        self.below_target += (
+            storage < self.h_ref_rec[(t + 1) % self.n_days_in_year]
+        )
+
+        hydro_reliability = np.divide(production, self.q_target_daily)
+        self.hydro_reliability_sum += hydro_reliability
+        self.revenue += revenue
+
+        # daily reliabilities compare the release of the day with the
+        # demands of the whole year, see g_vol_rel_daily and
+        # g_shortage_index_daily
+        if self.monthly:
+            month = t % N_MONTHS
+            self.monthly_sum[..., :3, month] += np.mean(
+                releases[..., :3, np.newaxis] / self.demands, axis=-1
+            )
+            shortage = (
+                np.maximum(self.min_flow - releases[..., 3, np.newaxis], 0)
+                / self.min_flow
+            )
+            self.monthly_sum[..., 3, month] += np.mean(
+                np.square(shortage), axis=-1
+            )
+            self.monthly_sum[..., 4, month] += hydro_reliability
+            self.monthly_count[month] += 1
+
+        self.n_days = t + 1
+
+    def reliability_monthly(self, j_rec):
+        """
+        Monthly reliabilities of the six users, shape (..., 12, 6), in the
+        order atomic power plant, Baltimore, Chester, environment,
+        recreation and hydropower
+        """
+        averages = self.monthly_sum / self.monthly_count
+        return np.stack(
+            [
+                averages[..., 0, :],
+                averages[..., 1, :],
+                averages[..., 2, :],
+                averages[..., 3, :],
+                np.broadcast_to(
+                    np.asarray(j_rec)[..., np.newaxis], self.shape + (N_MONTHS,)
+                ),
+                averages[..., 4, :],
+            ],
+            axis=-1,
+        )
+
+    def objectives(self, n_years, compute):
+        """
+        The objectives of the accumulated days
+
+        Parameters
+        ----------
+        n_years : int
+        compute : numpy array
+                  SusquehannaModel.objective_mask, the other objectives
+                  are nan
+        Returns
+        -------
+        tuple
+        the 13 objectives in the order of SusquehannaModel.simulate, shape
+        (..., 13), and the monthly Gini and euclidean values, shape
+        (..., 12), nan if not computed
+        """
+        y = np.full(self.shape + (len(compute),), np.nan)
+        n_days = self.n_days
+
+        y[..., 0] = self.revenue / n_years / pow(10, 6)  # GWh/year (M$/year)
+        y[..., 1:4] = self.volumetric_sum / n_days
+        y[..., 4] = self.shortage_sum / n_days
+        y[..., 5] = 1 - self.below_target / (n_years * self.n_target_days)
+        y[..., 6] = self.hydro_reliability_sum / n_days
+
+        reliability_gini = np.full(self.shape + (N_MONTHS,), np.nan)
+        reliability_eucli = np.full(self.shape + (N_MONTHS,), np.nan)
+        if compute[9] or compute[10]:
+            gini, eucli = metrics.equity(self.reliability_monthly(y[..., 5]))
+            if compute[9]:
+                reliability_gini = gini
+                y[..., 9] = np.std(gini, axis=-1)
+            if compute[10]:
+                reliability_eucli = eucli
+                y[..., 10] = np.std(eucli, axis=-1)
+
+        gini_mean, eucli_mean = metrics.equity(y[..., 1:7])
+        if compute[7]:
+            y[..., 7] = gini_mean
+        if compute[8]:
+            y[..., 8] = eucli_mean
+        if compute[11]:
+            y[..., 11] = y[..., 9] / y[..., 7]
+        if compute[12]:
+            y[..., 12] = y[..., 10] / y[..., 8]
+
+        y[..., :7][..., ~np.asarray(compute[:7])] = np.nan
+        return y, reliability_gini, reliability_eucli
+
+    def nbytes(self):
+        """Size of the state in bytes, independent of the horizon"""
+        return sum(
+            value.nbytes for value in vars(self).values()
+            if isinstance(value, np.ndarray)
+        )
@@ -0,0 +1,86 @@
+"""
+Bytes pickled per evaluation by the ProcessPoolEvaluator.
+
+Every evaluation job sent to a worker carries the solution, and with it the
+problem and its SusquehannaModel; the evaluated job is sent back the same
+way. This script reports the size of such a job with the full model state,
+as was pickled before SusquehannaModel.__reduce__, with the lean pickling,
+and with the lean pickling on top of shared model data.
+"""
+import copyreg
+import io
+import pickle
+import random
+import time
+
+from platypus import RandomGenerator
+from platypus.core import EvaluateSolution
+
+import rbf_functions
+from problem_formulation_euclidean import CombinedTraditionalEuclideanMean
+from problem_formulation_gini import CombinedTraditionalGiniMean
+from problem_formulation_original import TraditionalPrinciple
+from susquehanna_model import SusquehannaModel
+
+
+def full_state(obj):
+    return copyreg.__newobj__, (type(obj),), obj.__dict__.copy()
+
+
+def pickled_size(obj, full=False):
+    """Size in bytes of obj pickled, with full model and rbf state if full"""
+    buffer = io.BytesIO()
+    pickler = pickle.Pickler(buffer, protocol=pickle.HIGHEST_PROTOCOL)
+    if full:
+        pickler.dispatch_table = copyreg.dispatch_table.copy()
+        pickler.dispatch_table[SusquehannaModel] = full_state
+        pickler.dispatch_table[rbf_functions.RBF] = full_state
+    pickler.dump(obj)
+    return buffer.tell()
+
+
+def evaluation_job(problem):
+    """Job of a random, evaluated solution of problem"""
+    solution = RandomGenerator().generate(problem)
+    problem.evaluate(solution)
+    return EvaluateSolution(solution)
+
+
+def unpickle_time(job, repeats=20):
+    data = pickle.dumps(job, protocol=pickle.HIGHEST_PROTOCOL)
+    pickle.loads(data)  # builds the resident model
+    start = time.perf_counter()
+    for _ in range(repeats):
+        pickle.loads(data)
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    random.seed(10)
+    n_years = 1
+    rbf = rbf_functions.RBF(4, 2, 4, rbf_function=rbf_functions.original_rbf)
+    n_decision_vars = len(rbf.platypus_types)
+
+    problems = [
+        TraditionalPrinciple(n_decision_vars, 6, n_years, rbf),
+        CombinedTraditionalGiniMean(n_decision_vars, 7, n_years, rbf),
+        CombinedTraditionalEuclideanMean(n_decision_vars, 7, n_years, rbf),
+    ]
+
+    print(f"{'problem':35s} {'full':>10s} {'lean':>10s} {'shared':>10s} "
+          f"{'unpickle':>10s}")
+    for problem in problems:
+        problem.susquehanna_river.set_log(False)
+        job = evaluation_job(problem)
+        full = pickled_size(job, full=True)
+        lean = pickled_size(job)
+        with problem.susquehanna_river.publish_shared_data():
+            shared = pickled_size(job)
+            seconds = unpickle_time(job)
+        print(f"{problem.__class__.__name__:35s} {full:10d} {lean:10d} "
+              f"{shared:10d} {seconds * 1e3:8.2f}ms")
+    print("sizes in bytes per job, each job is pickled to the worker and back")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Start-up cost of a fresh worker process.
+
+Every worker of a ProcessPoolEvaluator or WorkerPool imports the problem
+formulation it unpickles, and with it the model, before it evaluates
+anything. This script measures, in fresh interpreters, the import time of
+the modules on that path with ``python -X importtime``, lists the heaviest
+third party packages they load, and times a complete cold start: import,
+unpickling a problem and the first evaluation, with the compiled kernels
+loaded from the on-disk cache (see kernels).
+"""
+import os
+import subprocess
+import sys
+
+here = os.path.dirname(os.path.realpath(__file__))
+
+# modules a worker imports, the problem formulations import all others
+worker_modules = [
+    "evaluators",
+    "simulation_kernel",
+    "susquehanna_model",
+    "problem_formulation_original",
+    "problem_formulation_gini",
+    "problem_formulation_euclidean",
+]
+
+# packages a worker should not need
+heavy_packages = ["pandas", "scipy.spatial", "matplotlib"]
+
+cold_start = """
+import pickle, sys, time
+start = time.perf_counter()
+import rbf_functions
+from problem_formulation_original import TraditionalPrinciple
+from evaluators import evaluate_chunk
+imported = time.perf_counter()
+problem = pickle.loads(sys.stdin.buffer.read())
+x = [(t.min_value + t.max_value) / 2 for t in problem.types]
+import numpy as np
+evaluate_chunk(problem, np.asarray([x]))
+print(imported - start, time.perf_counter() - start)
+"""
+
+
+def run_python(args, stdin=None):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [here] + [p for p in [env.get("PYTHONPATH")] if p]
+    )
+    return subprocess.run(
+        [sys.executable] + args, cwd=here, env=env, input=stdin,
+        capture_output=True, check=True,
+    )
+
+
+def import_times(module):
+    """
+    Cumulative import time in seconds of every module imported by a fresh
+    interpreter that imports module, see python -X importtime
+    """
+    process = run_python(["-X", "importtime", "-c", f"import {module}"])
+    times = {}
+    for line in process.stderr.decode().splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        try:
+            times[name.strip()] = int(cumulative) * 1e-6
+        except ValueError:
+            pass  # the header line
+    return times
+
+
+def import_time(module, repeats=3):
+    """Fastest of repeats import times of module in seconds, and its modules"""
+    runs = [import_times(module) for _ in range(repeats)]
+    best = min(runs, key=lambda times: times[module])
+    return best[module], best
+
+
+def cold_start_time(problem, repeats=3):
+    """
+    Fastest of repeats seconds for a fresh interpreter to import the worker
+    modules, and to import, unpickle and evaluate problem once
+    """
+    import pickle
+
+    data = pickle.dumps(problem)
+    runs = []
+    for _ in range(repeats):
+        output = run_python(["-c", cold_start], stdin=data).stdout.decode()
+        runs.append(tuple(float(v) for v in output.split()[-2:]))
+    return min(runs, key=lambda run: run[1])
+
+
+def main():
+    import rbf_functions
+    from problem_formulation_original import TraditionalPrinciple
+
+    print(f"{'module':32s} {'import':>9s}  heavy packages loaded")
+    for module in worker_modules:
+        seconds, modules = import_time(module)
+        heavy = ", ".join(
+            f"{p} {modules[p] * 1e3:.0f}ms" for p in heavy_packages if p in modules
+        )
+        print(f"{module:32s} {seconds * 1e3:7.0f}ms  {heavy or '-'}")
+
+    seconds, modules = import_time(worker_modules[-1])
+    top = sorted(
+        (
+            (t, name) for name, t in modules.items()
+            if "." not in name
+            and not os.path.exists(os.path.join(here, name + ".py"))
+        ),
+        reverse=True,
+    )[:8]
+    print("heaviest packages: " + ", ".join(
+        f"{name} {t * 1e3:.0f}ms" for t, name in top
+    ))
+
+    rbf = rbf_functions.RBF(4, 2, 4, rbf_function=rbf_functions.original_rbf)
+    problem = TraditionalPrinciple(len(rbf.platypus_types), 6, 1, rbf)
+    imported, total = cold_start_time(problem)
+    print(f"worker cold start: import {imported:.2f}s, "
+          f"first evaluation after {total:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
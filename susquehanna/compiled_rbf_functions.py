@@ -0,0 +1,320 @@
+"""
+Compiled counterparts of the rbf functions in rbf_functions.
+
+Most rbf functions call scipy.spatial.distance.cdist for a single input
+against a handful of centers, where the overhead of the call dominates the
+arithmetic. The functions below compute the same quantities in the same
+order with explicit loops, have the same signature, and can be passed to
+other compiled functions such as simulation_kernel.simulate.
+"""
+import numpy as np
+
+from kernels import kernel, matrix, vector
+
+SQRT3 = np.sqrt(3)
+SQRT5 = np.sqrt(5)
+
+
+@kernel((vector, matrix))
+def euclidean_distances(rbf_input, centers):
+    """
+    Euclidean distance between the input and each center, as computed by
+    cdist(rbf_input[np.newaxis, :], centers)
+
+    Returns
+    -------
+    numpy array
+    1-D, shape is (n_rbfs,)
+    """
+    n_rbfs, n_inputs = centers.shape
+    distances = np.empty(n_rbfs)
+    for i in range(n_rbfs):
+        d = 0.0
+        for j in range(n_inputs):
+            a = rbf_input[j] - centers[i, j]
+            d += a * a
+        distances[i] = np.sqrt(d)
+    return distances
+
+
+@kernel((vector, matrix))
+def weighted_sum(rbf_scores, weights):
+    """Sum of the weights of each rbf times its score"""
+    n_rbfs, n_outputs = weights.shape
+    output = np.zeros(n_outputs)
+    for i in range(n_rbfs):
+        for k in range(n_outputs):
+            output[k] += weights[i, k] * rbf_scores[i]
+    return output
+
+
+@kernel((vector, matrix, matrix, matrix))
+def original_rbf(rbf_input, centers, radii, weights):
+    """
+    Compiled counterpart of rbf_functions.original_rbf
+
+    Parameters
+    ----------
+    rbf_input : numpy array
+                1-D, shape is (n_inputs,)
+    centers :   numpy array
+                2-D, shape is (n_rbfs X n_inputs)
+    radii :     2-D, shape is (n_rbfs X n_inputs)
+    weights :   2-D, shape is (n_rbfs X n_outputs)
+    Returns
+    -------
+    numpy array
+    """
+    n_rbfs, n_inputs = centers.shape
+    output = np.zeros(weights.shape[1])
+    for i in range(n_rbfs):
+        q = 0.0
+        for j in range(n_inputs):
+            a = rbf_input[j] - centers[i, j]
+            q += a ** 2 / radii[i, j] ** 2
+        score = np.exp(-q)
+        for k in range(weights.shape[1]):
+            output[k] += weights[i, k] * score
+    return output
+
+
+@kernel((vector, matrix, matrix, matrix))
+def squared_exponential_rbf(rbf_input, centers, radii, weights):
+    """Compiled counterpart of rbf_functions.squared_exponential_rbf"""
+    distances = euclidean_distances(rbf_input, centers)
+    n_rbfs, n_inputs = radii.shape
+    rbf_scores = np.empty(n_rbfs)
+    for i in range(n_rbfs):
+        b = distances[i] ** 2
+        q = 0.0
+        for j in range(n_inputs):
+            q += b / (2 * radii[i, j] ** 2)
+        rbf_scores[i] = np.exp(-q)
+    return weighted_sum(rbf_scores, weights)
+
+
+@kernel((vector, matrix, matrix, matrix))
+def gaussian_rbf(rbf_input, centers, radii, weights):
+    """Compiled counterpart of rbf_functions.gaussian_rbf"""
+    n_rbfs, n_inputs = centers.shape
+    rbf_scores = np.empty(n_rbfs)
+    for i in range(n_rbfs):
+        q = 0.0
+        for j in range(n_inputs):
+            n = (rbf_input[j] - centers[i, j]) / radii[i, j]
+            q += n ** 2
+        rbf_scores[i] = np.exp(-1 * q)
+    return weighted_sum(rbf_scores, weights)
+
+
+@kernel((vector, matrix, matrix, matrix))
+def gaussian_rbf_lit(rbf_input, centers, radii, weights):
+    """Compiled counterpart of rbf_functions.gaussian_rbf_lit"""
+    distances = euclidean_distances(rbf_input, centers)
+    n_rbfs, n_inputs = radii.shape
+    rbf_scores = np.empty(n_rbfs)
+    for i in range(n_rbfs):
+        q = 0.0
+        for j in range(n_inputs):
+            q += (distances[i] * radii[i, j]) ** 2
+        rbf_scores[i] = np.exp(-1 * q)
+    return weighted_sum(rbf_scores, weights)
+
+
+@kernel((vector, matrix, matrix, matrix))
+def inverse_quadratic_rbf(rbf_input, centers, radii, weights):
+    """Compiled counterpart of rbf_functions.inverse_quadratic_rbf"""
+    distances = euclidean_distances(rbf_input, centers)
+    n_rbfs, n_inputs = radii.shape
+    rbf_scores = np.empty(n_rbfs)
+    for i in range(n_rbfs):
+        d = 0.0
+        for j in range(n_inputs):
+            d += (distances[i] / radii[i, j]) ** 2
+        rbf_scores[i] = 1 / (1 + d)
+    return weighted_sum(rbf_scores, weights)
+
+
+@kernel((vector, matrix, matrix, matrix))
+def inverse_quadratic_rbf_lit(rbf_input, centers, radii, weights):
+    """Compiled counterpart of rbf_functions.inverse_quadratic_rbf_lit"""
+    distances = euclidean_distances(rbf_input, centers)
+    n_rbfs, n_inputs = radii.shape
+    rbf_scores = np.empty(n_rbfs)
+    for i in range(n_rbfs):
+        d = 0.0
+        for j in range(n_inputs):
+            d += (distances[i] * radii[i, j]) ** 2
+        rbf_scores[i] = 1 / (1 + d)
+    return weighted_sum(rbf_scores, weights)
+
+
+@kernel((vector, matrix, matrix, matrix))
+def inverse_multiquadric_rbf(rbf_input, centers, radii, weights):
+    """Compiled counterpart of rbf_functions.inverse_multiquadric_rbf"""
+    distances = euclidean_distances(rbf_input, centers)
+    n_rbfs, n_inputs = radii.shape
+    rbf_scores = np.empty(n_rbfs)
+    for i in range(n_rbfs):
+        b = 0.0
+        for j in range(n_inputs):
+            b += (distances[i] / radii[i, j]) ** 2
+        rbf_scores[i] = 1 / np.sqrt(1 + b)
+    return weighted_sum(rbf_scores, weights)
+
+
+@kernel((vector, matrix, matrix, matrix))
+def inverse_multiquadric_rbf_lit(rbf_input, centers, radii, weights):
+    """Compiled counterpart of rbf_functions.inverse_multiquadric_rbf_lit"""
+    distances = euclidean_distances(rbf_input, centers)
+    n_rbfs, n_inputs = radii.shape
+    rbf_scores = np.empty(n_rbfs)
+    for i in range(n_rbfs):
+        b = 0.0
+        for j in range(n_inputs):
+            b += (distances[i] * radii[i, j]) ** 2
+        rbf_scores[i] = 1 / np.sqrt(1 + b)
+    return weighted_sum(rbf_scores, weights)
+
+
+@kernel((vector, matrix, matrix, matrix))
+def exponential_rbf(rbf_input, centers, radii, weights):
+    """Compiled counterpart of rbf_functions.exponential_rbf"""
+    distances = euclidean_distances(rbf_input, centers)
+    n_rbfs, n_inputs = radii.shape
+    rbf_scores = np.empty(n_rbfs)
+    for i in range(n_rbfs):
+        b = 0.0
+        for j in range(n_inputs):
+            b += distances[i] / radii[i, j]
+        rbf_scores[i] = np.exp(-1 * b)
+    return weighted_sum(rbf_scores, weights)
+
+
+@kernel((vector, matrix, matrix, matrix))
+def matern32_rbf(rbf_input, centers, radii, weights):
+    """Compiled counterpart of rbf_functions.matern32_rbf"""
+    distances = euclidean_distances(rbf_input, centers)
+    n_rbfs, n_inputs = radii.shape
+    rbf_scores = np.empty(n_rbfs)
+    for i in range(n_rbfs):
+        b = 0.0
+        for j in range(n_inputs):
+            b += distances[i] / radii[i, j]
+        sqrt = SQRT3 * b
+        rbf_scores[i] = (1 + sqrt) * (np.exp(-sqrt))
+    return weighted_sum(rbf_scores, weights)
+
+
+@kernel((vector, matrix, matrix, matrix))
+def matern52_rbf(rbf_input, centers, radii, weights):
+    """Compiled counterpart of rbf_functions.matern52_rbf"""
+    distances = euclidean_distances(rbf_input, centers)
+    n_rbfs, n_inputs = radii.shape
+    rbf_scores = np.empty(n_rbfs)
+    for i in range(n_rbfs):
+        b = 0.0
+        c = 0.0
+        for j in range(n_inputs):
+            b += distances[i] / radii[i, j]
+            c += distances[i] ** 2 / 3 * radii[i, j] ** 2
+        sqrt = SQRT5 * b
+        sq = 5 * c
+        rbf_scores[i] = (1 + sqrt + sq) * (np.exp(-sqrt))
+    return weighted_sum(rbf_scores, weights)
+
+
+@kernel()
+def apply_rbf(rbf_id, rbf_input, centers, radii, weights):
+    """
+    Apply the compiled rbf function with the given id, see rbf_ids
+
+    Compiled functions that take an rbf function as argument are not loaded
+    from the on-disk cache, so the kernels select the rbf function by id.
+    """
+    if rbf_id == 0:
+        return original_rbf(rbf_input, centers, radii, weights)
+    elif rbf_id == 1:
+        return squared_exponential_rbf(rbf_input, centers, radii, weights)
+    elif rbf_id == 2:
+        return gaussian_rbf(rbf_input, centers, radii, weights)
+    elif rbf_id == 3:
+        return gaussian_rbf_lit(rbf_input, centers, radii, weights)
+    elif rbf_id == 4:
+        return inverse_quadratic_rbf(rbf_input, centers, radii, weights)
+    elif rbf_id == 5:
+        return inverse_quadratic_rbf_lit(rbf_input, centers, radii, weights)
+    elif rbf_id == 6:
+        return inverse_multiquadric_rbf(rbf_input, centers, radii, weights)
+    elif rbf_id == 7:
+        return inverse_multiquadric_rbf_lit(rbf_input, centers, radii, weights)
+    elif rbf_id == 8:
+        return exponential_rbf(rbf_input, centers, radii, weights)
+    elif rbf_id == 9:
+        return matern32_rbf(rbf_input, centers, radii, weights)
+    elif rbf_id == 10:
+        return matern52_rbf(rbf_input, centers, radii, weights)
+    raise ValueError("unknown rbf id")
+
+
+@kernel()
+def apply_rbf_rows(rbf_id, rbf_inputs, centers, radii, weights):
+    """
+    Apply a compiled rbf function to each row of a matrix of inputs
+
+    Parameters
+    ----------
+    rbf_id : int
+             id of the compiled rbf function, see rbf_ids
+    rbf_inputs : numpy array
+                 2-D, shape is (n_samples X n_inputs)
+    centers, radii, weights : numpy arrays
+                              2-D, as taken by the rbf function
+    Returns
+    -------
+    numpy array
+    2-D, shape is (n_samples X n_outputs)
+    """
+    output = np.empty((rbf_inputs.shape[0], weights.shape[1]))
+    for n in range(rbf_inputs.shape[0]):
+        output[n] = apply_rbf(rbf_id, rbf_inputs[n], centers, radii, weights)
+    return output
+
+
+# compiled counterparts of the functions in rbf_functions, by name, in the
+# order of their ids
+compiled_rbfs = {
+    rbf.__name__: rbf
+    for rbf in (
+        original_rbf,
+        squared_exponential_rbf,
+        gaussian_rbf,
+        gaussian_rbf_lit,
+        inverse_quadratic_rbf,
+        inverse_quadratic_rbf_lit,
+        inverse_multiquadric_rbf,
+        inverse_multiquadric_rbf_lit,
+        exponential_rbf,
+        matern32_rbf,
+        matern52_rbf,
+    )
+}
+
+# ids of the compiled rbf functions as taken by apply_rbf, by name
+rbf_ids = {name: i for i, name in enumerate(compiled_rbfs)}
+
+
+def get_compiled_rbf(rbf_function):
+    """
+    Return the compiled counterpart of an rbf function from rbf_functions,
+    or None if there is none.
+    """
+    return compiled_rbfs.get(getattr(rbf_function, "__name__", None))
+
+
+def get_rbf_id(rbf_function):
+    """
+    Return the id of the compiled counterpart of an rbf function from
+    rbf_functions, or None if there is none.
+    """
+    return rbf_ids.get(getattr(rbf_function, "__name__", None))
@@ -0,0 +1,117 @@
+"""
+Binary cache of the model input data.
+
+SusquehannaModel parses its text input files on every construction, in
+every problem formulation and in every worker process. The loaders in this
+module wrap the ones in utils: the first call parses the text file and
+writes the result as a .npy snapshot, later calls memory-map the snapshot
+instead of parsing again. Snapshots are keyed by the content hash of the
+source file, the loader, its arguments and CACHE_VERSION, so an edited data
+file or a changed loader is never served from a stale snapshot.
+
+The cache directory is MUSEH2O_DATA_CACHE if set, and .data_cache next to
+this module otherwise. Setting MUSEH2O_DATA_CACHE to an empty string
+disables the cache.
+"""
+import functools
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+import utils
+
+# increase whenever the parsing in utils changes its result
+CACHE_VERSION = 1
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".data_cache"
+)
+
+
+def cache_dir():
+    """Directory holding the snapshots, or None if caching is disabled"""
+    directory = os.environ.get("MUSEH2O_DATA_CACHE", DEFAULT_CACHE_DIR)
+    return directory or None
+
+
+def snapshot_key(loader, file_name, args):
+    """
+    Hash of the content of file_name, the loader and its arguments
+
+    Returns
+    -------
+    str
+    """
+    digest = hashlib.sha1()
+    with open(file_name, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    digest.update(repr((CACHE_VERSION, loader.__name__, args)).encode())
+    return digest.hexdigest()
+
+
+def load(loader, file_name, *args):
+    """
+    Load file_name with loader(file_name, *args) through the cache
+
+    Returns
+    -------
+    numpy array
+    read-only array backed by a memory map of the snapshot if one exists,
+    the parsed array otherwise
+    """
+    directory = cache_dir()
+    if directory is None:
+        return loader(file_name, *args)
+
+    key = snapshot_key(loader, file_name, args)
+    stem = os.path.splitext(os.path.basename(file_name))[0]
+    path = os.path.join(directory, f"{stem}-{key[:20]}.npy")
+    try:
+        # a plain ndarray view, indexing an np.memmap element by element is
+        # several times slower
+        return np.asarray(np.load(path, mmap_mode="r"))
+    except (OSError, ValueError):
+        pass
+
+    data = np.asarray(loader(file_name, *args), dtype=float)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        # write under a temporary name, so that concurrent workers never
+        # read a partial snapshot
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, data)
+        os.replace(tmp_path, path)
+    except OSError:
+        # a read-only cache directory only costs the speed up
+        pass
+    return data
+
+
+def cached(loader):
+    """Version of loader that goes through the cache"""
+
+    @functools.wraps(loader)
+    def cached_loader(file_name, *args):
+        return load(loader, file_name, *args)
+
+    return cached_loader
+
+
+def clear():
+    """Remove all snapshots from the cache directory"""
+    directory = cache_dir()
+    if directory is None or not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.endswith(".npy"):
+            os.remove(os.path.join(directory, name))
+
+
+loadMatrix = cached(utils.loadMatrix)
+loadVector = cached(utils.loadVector)
+loadMultiVector = cached(utils.loadMultiVector)
+loadArrangeMatrix = cached(utils.loadArrangeMatrix)
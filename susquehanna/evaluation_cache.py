@@ -0,0 +1,109 @@
+"""
+Memoisation of policy evaluations.
+
+EpsNSGAII regularly produces offspring identical, or nearly identical, to
+solutions it evaluated before. An EvaluationCache maps decision vectors to
+their objectives, so that SusquehannaModel.evaluate only simulates a
+policy once. Keys are the decision vector, optionally quantised to a
+resolution so that vectors closer than that share one evaluation, together
+with the policy type and the requested objectives. The cache holds at most
+maxsize evaluations and drops the least recently used one beyond that.
+
+Every process has its own cache by default. An EvaluationCacheManager
+holds a single cache in its server process instead, which all workers
+query through a proxy, see SusquehannaModel.share_evaluation_cache.
+"""
+from collections import OrderedDict
+from multiprocessing.managers import BaseManager
+
+import numpy as np
+
+
+class EvaluationCache:
+    """
+    Least recently used cache of evaluations by decision vector
+
+    Parameters
+    ----------
+    maxsize : int, optional
+              maximum number of evaluations kept
+    resolution : float, optional
+                 decision vectors are rounded to multiples of resolution
+                 before hashing, exact if None
+    """
+
+    def __init__(self, maxsize=1024, resolution=None):
+        if maxsize < 1:
+            raise ValueError("maxsize should be positive")
+        self.maxsize = maxsize
+        self.resolution = resolution
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, decision_vars, *context):
+        """
+        Hashable key of a decision vector, context distinguishes evaluations
+        of the same vector that are not interchangeable
+        """
+        x = np.asarray(decision_vars, dtype=float)
+        if self.resolution is not None:
+            x = np.round(x / self.resolution).astype(np.int64)
+        return (x.tobytes(),) + context
+
+    def get(self, key):
+        """
+        Cached result of key, or None counting a miss; the result is the
+        stored object itself and should not be modified
+        """
+        try:
+            self.results.move_to_end(key)
+        except KeyError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self.results[key]
+
+    def put(self, key, result):
+        self.results[key] = result
+        self.results.move_to_end(key)
+        if len(self.results) > self.maxsize:
+            self.results.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Drop all results, the counters are kept"""
+        self.results.clear()
+
+    def stats(self):
+        """
+        Returns
+        -------
+        dict
+        hits, misses, evictions and the number of cached results (size)
+        """
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            size=len(self.results),
+        )
+
+    def __len__(self):
+        return len(self.results)
+
+
+class EvaluationCacheManager(BaseManager):
+    """
+    Manager whose server process holds EvaluationCaches shared by all
+    processes; start it and create a cache with
+    ``manager.EvaluationCache(maxsize, resolution)``
+    """
+
+
+EvaluationCacheManager.register(
+    "EvaluationCache",
+    EvaluationCache,
+    exposed=("key", "get", "put", "clear", "stats", "__len__"),
+)
@@ -0,0 +1,151 @@
+"""
+Persistent store of policy evaluations.
+
+Every problem formulation evaluates policies with the same model and
+receives the same 13 objectives of simulate, from which it picks its own;
+the Gini and Euclidean formulations only differ in the equity index they
+report. An EvaluationStore keeps every evaluation in an SQLite database,
+content addressed by a digest of the model (its configuration and
+hydrology, see SusquehannaModel.model_digest), the policy type and the
+decision vector, so that any formulation, a resumed run or a later
+re-analysis looks a policy up instead of simulating it again.
+
+SQLite lets the worker processes of an optimisation share one database;
+each process opens its own connection and a pickled store only carries its
+path.
+"""
+import hashlib
+import os
+import sqlite3
+
+import numpy as np
+
+
+class EvaluationStore:
+    """
+    Evaluations by model digest, policy type and decision vector
+
+    Parameters
+    ----------
+    path : str
+           SQLite database, created with its directory if missing
+    timeout : float, optional
+              seconds to wait for a write lock held by another process
+    """
+
+    def __init__(self, path, timeout=60.0):
+        self.path = path
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=timeout)
+        # readers do not block the writer, and a commit does not wait for
+        # the disk, which is safe with a write-ahead log
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS evaluations ("
+                "key TEXT PRIMARY KEY, "
+                "model TEXT NOT NULL, "
+                "opt_met INTEGER NOT NULL, "
+                "decision_vars BLOB NOT NULL, "
+                "objectives BLOB NOT NULL, "
+                "error_bound BLOB)"
+            )
+
+    @staticmethod
+    def key(model_digest, decision_vars, opt_met=1):
+        """Content address of the evaluation of a decision vector"""
+        content = hashlib.sha256(model_digest.encode())
+        content.update(str(opt_met).encode())
+        content.update(np.asarray(decision_vars, dtype=float).tobytes())
+        return content.hexdigest()
+
+    def get(self, key):
+        """
+        Returns
+        -------
+        tuple or None
+        objectives and error bound (None if not stored) as numpy arrays,
+        None if the evaluation is not stored
+        """
+        row = self.connection.execute(
+            "SELECT objectives, error_bound FROM evaluations WHERE key = ?",
+            (key,),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        objectives, error_bound = row
+        if error_bound is not None:
+            error_bound = np.frombuffer(error_bound)
+        return np.frombuffer(objectives), error_bound
+
+    def put(self, key, model_digest, decision_vars, opt_met, objectives,
+            error_bound=None):
+        """
+        Store an evaluation, keeping the stored one if another process
+        stored it first
+        """
+        if error_bound is not None:
+            error_bound = np.asarray(error_bound, dtype=float).tobytes()
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO evaluations VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    model_digest,
+                    opt_met,
+                    np.asarray(decision_vars, dtype=float).tobytes(),
+                    np.asarray(objectives, dtype=float).tobytes(),
+                    error_bound,
+                ),
+            )
+
+    def evaluations(self, model_digest, opt_met=1):
+        """
+        All stored evaluations of a model, e.g. to score them again under
+        another formulation
+
+        Returns
+        -------
+        tuple of numpy arrays
+        decision variables (n_evaluations X n_decision_vars) and objectives
+        (n_evaluations X n_objectives)
+        """
+        rows = self.connection.execute(
+            "SELECT decision_vars, objectives FROM evaluations "
+            "WHERE model = ? AND opt_met = ? ORDER BY rowid",
+            (model_digest, opt_met),
+        ).fetchall()
+        if not rows:
+            return np.empty((0, 0)), np.empty((0, 0))
+        X = np.array([np.frombuffer(x) for x, _ in rows])
+        Y = np.array([np.frombuffer(y) for _, y in rows])
+        return X, Y
+
+    def stats(self):
+        """
+        Returns
+        -------
+        dict
+        hits and misses of this process and the number of stored
+        evaluations (size)
+        """
+        return dict(hits=self.hits, misses=self.misses, size=len(self))
+
+    def close(self):
+        self.connection.close()
+
+    def __len__(self):
+        (n_rows,) = self.connection.execute(
+            "SELECT COUNT(*) FROM evaluations"
+        ).fetchone()
+        return n_rows
+
+    def __reduce__(self):
+        return EvaluationStore, (self.path, self.timeout)
@@ -0,0 +1,283 @@
+"""
+Platypus evaluators that send solutions to the workers in chunks.
+
+ProcessPoolEvaluator submits one job per solution, and every job pickles
+the solution together with its problem to the worker and back. A
+ChunkedEvaluator instead sends each worker task a contiguous array with the
+decision vectors of a chunk of solutions and receives an array with their
+objectives. Problems without constraints that provide evaluate_batch
+evaluate a whole chunk in one call.
+
+A WorkerPool starts and warms the worker processes once, so that a series
+of optimisation runs can share them.
+"""
+import math
+import os
+import pickle
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from platypus import Evaluator, Solution
+
+
+def evaluate_chunk(problem, X):
+    """
+    Evaluate the decision vectors in X, called in the worker processes
+
+    Parameters
+    ----------
+    problem : platypus.Problem
+    X : numpy array
+        2-D, decoded decision variables, one solution per row
+    Returns
+    -------
+    tuple of numpy arrays
+    objectives (n_solutions X nobjs) and constraints (n_solutions X nconstrs)
+    """
+    # evaluate_batch only returns objectives, so problems with constraints
+    # are evaluated solution by solution
+    if hasattr(problem, "evaluate_batch") and problem.nconstrs == 0:
+        objectives = np.asarray(problem.evaluate_batch(X), dtype=float)
+        return objectives, np.zeros((X.shape[0], 0))
+
+    objectives = np.empty((X.shape[0], problem.nobjs))
+    constraints = np.empty((X.shape[0], problem.nconstrs))
+    for i, x in enumerate(X):
+        solution = Solution(problem)
+        solution.variables[:] = x.tolist()
+        problem.evaluate(solution)
+        objectives[i] = solution.objectives[:]
+        constraints[i] = solution.constraints[:]
+    return objectives, constraints
+
+
+class ChunkedEvaluator(Evaluator):
+    """
+    Evaluator that ships chunks of decision vectors to a process pool
+
+    Parameters
+    ----------
+    processes : int, optional
+                number of worker processes, all cpus if None
+    chunk_size : int, optional
+                 number of solutions per worker task, if None every batch
+                 is split in chunks_per_worker tasks per worker
+    chunks_per_worker : int, optional
+    executor : concurrent.futures.Executor, optional
+               executor to submit the tasks to instead of a new
+               ProcessPoolExecutor, it is not shut down by close
+    """
+
+    def __init__(self, processes=None, chunk_size=None, chunks_per_worker=2,
+                 executor=None):
+        super().__init__()
+        if executor is None:
+            self.executor = ProcessPoolExecutor(processes)
+            self.owns_executor = True
+        else:
+            self.executor = executor
+            self.owns_executor = False
+        self.processes = processes or getattr(
+            self.executor, "_max_workers", os.cpu_count()
+        )
+        self.chunk_size = chunk_size
+        self.chunks_per_worker = chunks_per_worker
+
+    def split(self, n_solutions):
+        if self.chunk_size is not None:
+            return self.chunk_size
+        n_chunks = self.processes * self.chunks_per_worker
+        return max(1, math.ceil(n_solutions / n_chunks))
+
+    def evaluate_all(self, jobs, **kwargs):
+        # solutions of the same problem are evaluated together
+        groups = {}
+        for job in jobs:
+            problem = job.solution.problem
+            groups.setdefault(id(problem), (problem, []))[1].append(job)
+
+        tasks = []
+        for problem, group in groups.values():
+            X = np.array(
+                [
+                    [t.decode(v) for t, v in zip(problem.types, job.solution.variables)]
+                    for job in group
+                ],
+                dtype=float,
+            )
+            chunk_size = self.split(len(group))
+            for start in range(0, len(group), chunk_size):
+                stop = start + chunk_size
+                future = self.executor.submit(
+                    evaluate_chunk, problem, X[start:stop]
+                )
+                tasks.append((problem, group[start:stop], future))
+
+        for problem, chunk, future in tasks:
+            objectives, constraints = future.result()
+            for job, y, c in zip(chunk, objectives, constraints):
+                solution = job.solution
+                solution.objectives[:] = y.tolist()
+                solution.constraints[:] = c.tolist()
+                solution.constraint_violation = sum(
+                    abs(f(x)) for f, x in zip(problem.constraints, solution.constraints)
+                )
+                solution.feasible = solution.constraint_violation == 0.0
+                solution.evaluated = True
+        return jobs
+
+    def close(self):
+        if self.owns_executor:
+            self.executor.shutdown()
+
+
+def warm_worker(problems):
+    """
+    Initializer of the WorkerPool processes: evaluate one solution of every
+    problem, so that the models are built and the kernels compiled before
+    the first real task arrives
+    """
+    # with fork the initializer arguments are not pickled, but tasks are;
+    # warm the models the tasks will be unpickled to
+    problems = pickle.loads(pickle.dumps(problems))
+
+    # the pool runs a worker per core already, the parallel ensemble kernel
+    # of each worker keeps to a single thread
+    import numba
+
+    numba.set_num_threads(1)
+    for problem in problems:
+        x = [(t.min_value + t.max_value) / 2 for t in problem.types]
+        evaluate_chunk(problem, np.asarray([x], dtype=float))
+
+
+def worker_pid(delay):
+    time.sleep(delay)
+    return os.getpid()
+
+
+def worker_pid_and(function, delay):
+    return os.getpid(), function(delay)
+
+
+def worker_kernel_report(delay):
+    import kernels
+
+    time.sleep(delay)
+    return kernels.cache_report()
+
+
+def worker_evaluation_cache_statistics(delay):
+    import susquehanna_model
+
+    time.sleep(delay)
+    return susquehanna_model.evaluation_cache_statistics()
+
+
+class WorkerPool:
+    """
+    Process pool that is started and warmed once and reused for any number
+    of optimisation runs, see ChunkedEvaluator
+
+    Parameters
+    ----------
+    problems : list of platypus.Problem
+               problems every worker evaluates once at start up
+    processes : int, optional
+                number of worker processes, all cpus if None
+    timeout : float, optional
+              maximum number of seconds to wait for all workers to start
+
+    Attributes
+    ----------
+    startup_time : float
+                   seconds until all workers were started and warmed, or
+                   until the timeout ran out
+    warm_workers : int
+                   number of workers that answered within the timeout
+    """
+
+    def __init__(self, problems=(), processes=None, timeout=600.0):
+        self.processes = processes or os.cpu_count()
+        start = time.perf_counter()
+        self.executor = ProcessPoolExecutor(
+            self.processes, initializer=warm_worker, initargs=(list(problems),)
+        )
+
+        # workers only take tasks after their initializer finished, so once
+        # every worker has answered all of them are warm
+        self.timeout = timeout
+        self.warm_workers = len(self.each_worker(worker_pid, start))
+        self.startup_time = time.perf_counter() - start
+
+    def each_worker(self, function, start=None):
+        """
+        Call function(delay) until every worker has answered once, the delay
+        keeps a worker from taking more than one call at a time. Warns if
+        the timeout runs out before every worker answered.
+
+        Returns
+        -------
+        dict
+        pid -> first answer of that worker
+        """
+        start = time.perf_counter() if start is None else start
+        answers = {}
+        while len(answers) < self.processes:
+            if time.perf_counter() - start > self.timeout:
+                break
+            futures = [
+                self.executor.submit(worker_pid_and, function, 0.05)
+                for _ in range(self.processes)
+            ]
+            for future in futures:
+                pid, answer = future.result()
+                answers.setdefault(pid, answer)
+        if len(answers) < self.processes:
+            warnings.warn(
+                f"only {len(answers)} of {self.processes} workers answered "
+                f"within {self.timeout:.0f} s"
+            )
+        return answers
+
+    def kernel_reports(self):
+        """
+        Compiled kernel cache hits and misses of every worker, see
+        kernels.cache_report
+
+        Returns
+        -------
+        dict
+        pid -> cache report
+        """
+        return self.each_worker(worker_kernel_report)
+
+    def evaluation_cache_statistics(self):
+        """
+        Hits, misses and evictions of the evaluation caches of the models
+        resident in every worker, see
+        susquehanna_model.evaluation_cache_statistics
+
+        Returns
+        -------
+        dict
+        pid -> statistics
+        """
+        return self.each_worker(worker_evaluation_cache_statistics)
+
+    def evaluator(self, **kwargs):
+        """ChunkedEvaluator on the workers of this pool"""
+        return ChunkedEvaluator(
+            processes=self.processes, executor=self.executor, **kwargs
+        )
+
+    def close(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,295 @@
+"""
+Precomputed turbine dispatch curves for Conowingo and Muddy Run.
+
+SusquehannaModel.g_hydRevCo splits every hourly release over the 13
+Conowingo turbines in a Python loop, and g_hydRevMR does the same for the 8
+Muddy Run units. How a release is split only depends on the release itself,
+so the total turbined flow is a fixed piecewise linear function of the
+release. A DispatchCurve holds that function, so that power and revenue
+become vectorized expressions over any number of hours.
+"""
+import numpy as np
+
+import utils
+from kernels import kernel, vector
+
+cubicFeetToCubicMeters = 0.0283  # 1 cf = 0.0283 m3
+feetToMeters = 0.3048  # 1 ft = 0.3048 m
+GG = 9.81
+gammaH20 = 1000.0
+efficiency_Co = 0.79  # assuming lower efficiency as in Exelon docs
+
+
+def dispatch_conowingo(r, turbines):
+    """
+    Turbined flow per turbine for a single release, exactly as in
+    SusquehannaModel.g_hydRevCo
+
+    Parameters
+    ----------
+    r : float
+        release (cfs)
+    turbines : numpy array
+               2-D, max capacity (cfs), min capacity (cfs) and efficiency per
+               turbine
+    Returns
+    -------
+    numpy array
+    1-D, turbined flow per turbine (cfs)
+    """
+    q_split = r
+    qturb = np.zeros(turbines.shape[1])
+    for j in range(turbines.shape[1]):
+        if q_split < turbines[1][j]:
+            qturb[j] = 0.0
+        elif q_split > turbines[0][j]:
+            qturb[j] = turbines[0][j]
+        else:
+            qturb[j] = q_split
+        q_split = q_split - qturb[j]
+    return qturb
+
+
+@kernel((vector, vector, vector, vector))
+def turbined_flow(r, breakpoints, offsets, slopes):
+    """
+    Evaluate a piecewise linear dispatch curve, see DispatchCurve
+
+    Parameters
+    ----------
+    r : numpy array
+        1-D, releases (cfs)
+    Returns
+    -------
+    numpy array
+    1-D, turbined flow (cfs)
+    """
+    q = np.empty(r.size)
+    for i in range(r.size):
+        x = max(r[i], 0.0)
+        k = np.searchsorted(breakpoints, x, side="right") - 1
+        q[i] = offsets[k] + slopes[k] * (x - breakpoints[k])
+    return q
+
+
+class DispatchCurve:
+    """
+    Total turbined flow as a function of the release
+
+    The curve is piecewise linear with slope 0 or 1 and can jump where a
+    turbine switches on. On [breakpoints[k], breakpoints[k + 1]) the turbined
+    flow is offsets[k] + slopes[k] * (r - breakpoints[k]).
+
+    Parameters
+    ----------
+    breakpoints : numpy array
+                  1-D, increasing, first value is 0
+    offsets : numpy array
+              1-D, turbined flow at each breakpoint
+    slopes : numpy array
+             1-D, slope after each breakpoint
+    """
+
+    def __init__(self, breakpoints, offsets, slopes):
+        self.breakpoints = np.asarray(breakpoints, dtype=float)
+        self.offsets = np.asarray(offsets, dtype=float)
+        self.slopes = np.asarray(slopes, dtype=float)
+
+    @property
+    def arrays(self):
+        """The curve as a tuple of arrays, as taken by the compiled functions"""
+        return self.breakpoints, self.offsets, self.slopes
+
+    @classmethod
+    def from_conowingo_turbines(cls, turbines):
+        """
+        Build the curve of the Conowingo turbines. Within a regime, the flow
+        reaching turbine j is the release minus the capacity of the turbines
+        before it that run at full load, so every breakpoint is the sum of
+        the capacities of a subset of the turbines before j plus the minimum
+        or maximum capacity of j. The curve is evaluated at all of these
+        candidates and collinear pieces are merged.
+        """
+        turbines = np.asarray(turbines, dtype=float)
+        capacity = turbines[0].sum()
+
+        candidates = {0.0, capacity}
+        subset_sums = {0.0}
+        for j in range(turbines.shape[1]):
+            for s in subset_sums:
+                for threshold in (turbines[1][j], turbines[0][j]):
+                    if s + threshold <= capacity:
+                        candidates.add(s + threshold)
+            subset_sums |= {s + turbines[0][j] for s in subset_sums}
+        breakpoints = np.asarray(sorted(candidates))
+
+        offsets = np.asarray(
+            [dispatch_conowingo(b, turbines).sum() for b in breakpoints]
+        )
+        # slope from the midpoint of each interval, 0 beyond the capacity
+        ends = np.append(breakpoints[1:], breakpoints[-1] + 1.0)
+        mids = (breakpoints + ends) / 2
+        at_mids = np.asarray(
+            [dispatch_conowingo(m, turbines).sum() for m in mids]
+        )
+        slopes = np.round((at_mids - offsets) / (mids - breakpoints))
+
+        # merge pieces that continue the previous one
+        keep = [0]
+        for k in range(1, breakpoints.size):
+            previous = keep[-1]
+            continued = offsets[previous] + slopes[previous] * (
+                breakpoints[k] - breakpoints[previous]
+            )
+            if slopes[k] != slopes[previous] or offsets[k] != continued:
+                keep.append(k)
+        return cls(breakpoints[keep], offsets[keep], slopes[keep])
+
+    @classmethod
+    def from_muddy_run_units(cls, capacity, n_units=8):
+        """
+        Curve of n_units identical units, each limited to capacity. The flow
+        is split over the units in g_hydRevMR, so the total is capped at
+        n_units * capacity.
+        """
+        total = n_units * capacity
+        return cls([0.0, total], [0.0, total], [1.0, 0.0])
+
+    @classmethod
+    def from_muddy_run_pumps(cls, capacity, n_units=8):
+        """
+        Curve of the pumped flow of n_units identical units. g_hydRevMR does
+        not split the pumped flow over the units, every unit pumps the flow
+        up to its capacity.
+        """
+        return cls([0.0, capacity], [0.0, n_units * capacity],
+                   [float(n_units), 0.0])
+
+    def __call__(self, r):
+        """Total turbined flow (cfs) for a release or an array of releases"""
+        r = np.asarray(r, dtype=float)
+        q = turbined_flow(r.ravel(), self.breakpoints, self.offsets, self.slopes)
+        return q.reshape(r.shape)
+
+    def max_deviation(self, turbines, n_samples=100000):
+        """
+        Maximum absolute deviation (cfs) against dispatch_conowingo over
+        n_samples releases between 0 and beyond the total capacity,
+        including the breakpoints themselves
+        """
+        r = np.concatenate(
+            (
+                np.linspace(0.0, 1.1 * self.breakpoints[-1], n_samples),
+                self.breakpoints,
+            )
+        )
+        exact = np.asarray([dispatch_conowingo(x, turbines).sum() for x in r])
+        return np.max(np.abs(self(r) - exact))
+
+
+@kernel()
+def hydropower_conowingo(release, level, prices, curve, tailwater_level):
+    """
+    Hourly hydropower production (kWh) and revenue ($) at Conowingo
+
+    Parameters
+    ----------
+    release : numpy array
+              1-D, release (cfs)
+    level : numpy array
+            1-D, Conowingo level (ft)
+    prices : numpy array or float
+             energy prices ($/MWh)
+    curve : tuple of numpy arrays
+            DispatchCurve.arrays
+    tailwater_level : numpy array
+                      1-D, tailwater level (ft) for each release
+    Returns
+    -------
+    tuple of numpy arrays
+    production and revenue, same shape as release
+    """
+    deltaH = level - tailwater_level
+    production = (
+        efficiency_Co
+        * GG
+        * gammaH20
+        * (cubicFeetToCubicMeters * turbined_flow(release, *curve))
+        * (feetToMeters * deltaH)
+        * 3600
+        / (3600 * 1000)
+    )
+    return production, production / 1000 * prices
+
+
+@kernel()
+def hydropower_muddy_run(q_pump, q_rel, level_Co, level_MR, prices,
+                         turbine_curve, pump_curve, turbines_Muddy):
+    """
+    Hourly pumping and turbine production (kWh) and revenue ($) at Muddy Run,
+    see SusquehannaModel.g_hydRevMR. The curves are DispatchCurve.arrays,
+    all other arrays are 1-D.
+
+    Returns
+    -------
+    tuple of numpy arrays
+    pumping energy, turbine production, pumping revenue and turbine revenue,
+    same shape as q_pump
+    """
+    deltaH = level_MR - level_Co
+    head = (
+        GG
+        * gammaH20
+        * cubicFeetToCubicMeters
+        * (feetToMeters * deltaH)
+        * 3600
+        / (3600 * 1000)
+    )
+    pumping = turbines_Muddy[3] * head * turbined_flow(q_pump, *pump_curve)
+    production = turbines_Muddy[1] * head * turbined_flow(q_rel, *turbine_curve)
+    return (
+        pumping,
+        production,
+        pumping / 1000 * prices,
+        production / 1000 * prices,
+    )
+
+
+def hydropower_conowingo_year(releases, levels, day0_of_year, curve, tailwater,
+                              energy_prices):
+    """
+    Hydropower production and revenue of Conowingo for a whole series of
+    hourly releases in one call
+
+    Parameters
+    ----------
+    releases : numpy array
+               2-D, hourly releases (cfs), shape (n_days X 24)
+    levels : numpy array
+             2-D, hourly Conowingo levels (ft), shape (n_days X 24)
+    day0_of_year : int
+                   day of the year of the first row
+    curve : DispatchCurve
+    tailwater : numpy array
+                2-D, release flow (cfs) - tailwater head (ft)
+    energy_prices : numpy array
+                    2-D, energy prices ($/MWh), shape (24 X 365)
+    Returns
+    -------
+    tuple of numpy arrays
+    hourly production and revenue, shape (n_days X 24)
+    """
+    n_days = releases.shape[0]
+    days = (day0_of_year + np.arange(n_days)) % energy_prices.shape[1]
+    prices = energy_prices[:, days].T
+    tailwater_level = utils.interpolate_linear_array(
+        tailwater[0], tailwater[1], releases
+    )
+    production, revenue = hydropower_conowingo(
+        releases.ravel(),
+        levels.ravel(),
+        prices.ravel(),
+        curve.arrays,
+        tailwater_level.ravel(),
+    )
+    return production.reshape(releases.shape), revenue.reshape(releases.shape)
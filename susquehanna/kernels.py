@@ -0,0 +1,212 @@
+"""
+Registry, on-disk cache and warm-up of the compiled kernels.
+
+All numba functions of the model are declared with the kernel decorator,
+which compiles them with cache=True, so that a process loads the machine
+code from the __pycache__ directory next to the module instead of compiling
+it again, and registers them together with their explicit signatures. The
+explicit signatures are compiled ahead of time by compile_signatures,
+other argument types still compile lazily on first use.
+
+Before a job fans out to its workers, populate the cache once with
+
+    python kernels.py warm-up
+
+and check which kernels a process loaded from the cache with
+
+    python kernels.py report
+"""
+import os
+import sys
+import time
+from collections import defaultdict
+
+from numba import njit, types
+from numba.core import event
+
+# kernels by qualified name, each with its dispatcher and the signatures
+# compiled by compile_signatures
+registry = {}
+
+# argument types used in the explicit signatures, model data is read-only
+# when it comes from the data cache or from shared memory
+f8 = types.float64
+vector = types.Array(f8, 1, "C")
+matrix = types.Array(f8, 2, "C")
+readonly_vector = types.Array(f8, 1, "C", readonly=True)
+
+
+def kernel(*signatures, parallel=False):
+    """
+    Decorator that compiles a function with numba's njit and an on-disk
+    cache, and registers it
+
+    Parameters
+    ----------
+    signatures : tuple of numba types
+                 argument types to compile ahead of time
+    parallel : bool, optional
+               compile with parallel=True, so that prange loops run on
+               numba's thread pool
+    """
+
+    def decorate(function):
+        dispatcher = njit(cache=True, parallel=parallel)(function)
+        name = f"{function.__module__}.{function.__qualname__}"
+        registry[name] = (dispatcher, signatures)
+        return dispatcher
+
+    return decorate
+
+
+def compile_signatures():
+    """
+    Compile every kernel for its explicit signatures, loading them from the
+    cache where possible
+
+    Returns
+    -------
+    dict
+    seconds per kernel
+    """
+    seconds = {}
+    for name, (dispatcher, signatures) in registry.items():
+        start = time.perf_counter()
+        for signature in signatures:
+            dispatcher.compile(signature)
+        seconds[name] = time.perf_counter() - start
+    return seconds
+
+
+def warm_up(engines=("numba", "python")):
+    """
+    Compile the explicit signatures and evaluate one policy with every
+    engine, alone and as an ensemble of the historic trace, from shared
+    memory as the workers do, so that all kernels the model uses end up in
+    the cache
+
+    Returns
+    -------
+    dict
+    seconds spent compiling per kernel, see compile_times
+    """
+    import numpy as np
+
+    import rbf_functions
+    from susquehanna_model import SusquehannaModel
+
+    with compile_times() as times:
+        compile_signatures()
+        for engine in engines:
+            rbf = rbf_functions.RBF(4, 2, 4)
+            model = SusquehannaModel(108.5, 505.0, 5, 1, rbf, engine=engine)
+            model.set_log(False)
+            x = np.asarray(
+                [(t.min_value + t.max_value) / 2 for t in rbf.platypus_types]
+            )
+            with model.publish_shared_data():
+                model.evaluate(x)
+                model.evaluate_ensemble(x)
+                attached = SusquehannaModel(
+                    **model.config, shared_data_handle=model.shared_data.handle
+                )
+                attached.set_log(False)
+                attached.evaluate(x)
+                attached.evaluate_ensemble(x)
+    return dict(times)
+
+
+class compile_times:
+    """
+    Context manager that records the time numba spends compiling, or
+    loading from the cache, per kernel while it is active
+
+    Use as ``with compile_times() as times:``, times maps the qualified
+    name of each compiled function to seconds.
+    """
+
+    def __init__(self):
+        self.times = defaultdict(float)
+        self.started = {}
+
+    def on_event(self, ev):
+        dispatcher = ev.data["dispatcher"]
+        py_func = dispatcher.py_func
+        name = f"{py_func.__module__}.{py_func.__qualname__}"
+        key = (name, str(ev.data["args"]))
+        if ev.is_start:
+            self.started[key] = time.perf_counter()
+        elif key in self.started:
+            self.times[name] += time.perf_counter() - self.started.pop(key)
+
+    def __enter__(self):
+        self.listener = Listener(self.on_event)
+        event.register("numba:compile", self.listener)
+        return self.times
+
+    def __exit__(self, *args):
+        event.unregister("numba:compile", self.listener)
+
+
+class Listener(event.Listener):
+    def __init__(self, callback):
+        self.callback = callback
+
+    def on_start(self, ev):
+        self.callback(ev)
+
+    def on_end(self, ev):
+        self.callback(ev)
+
+
+def cache_report():
+    """
+    Cache hits and misses of every kernel in this process
+
+    Returns
+    -------
+    dict
+    'pid' and, per kernel, a dict with the number of 'hits' and 'misses'
+    """
+    report = {"pid": os.getpid()}
+    for name, (dispatcher, _) in registry.items():
+        stats = dispatcher.stats
+        report[name] = {
+            "hits": sum(stats.cache_hits.values()),
+            "misses": sum(stats.cache_misses.values()),
+        }
+    return report
+
+
+def summarize(report):
+    """Total cache hits and misses of a cache_report"""
+    hits = sum(v["hits"] for k, v in report.items() if k != "pid")
+    misses = sum(v["misses"] for k, v in report.items() if k != "pid")
+    return hits, misses
+
+
+def main(argv):
+    command = argv[1] if len(argv) > 1 else "warm-up"
+    if command == "warm-up":
+        start = time.perf_counter()
+        times = warm_up()
+        for name, seconds in sorted(times.items(), key=lambda x: -x[1]):
+            print(f"{name:60s} {seconds:8.2f} s")
+        print(f"warm-up took {time.perf_counter() - start:.1f} s")
+    elif command == "report":
+        warm_up()
+        report = cache_report()
+        print(f"pid {report.pop('pid')}")
+        for name, counts in report.items():
+            print(f"{name:60s} hits {counts['hits']:3d} "
+                  f"misses {counts['misses']:3d}")
+    else:
+        raise SystemExit(f"unknown command {command}, use warm-up or report")
+
+
+if __name__ == "__main__":
+    # the model registers its kernels with the imported module, not with
+    # this script
+    import kernels
+
+    kernels.main(sys.argv)
@@ -0,0 +1,229 @@
+"""
+Uniform-grid lookup tables for the level / storage / surface / tailwater
+relationships of the Susquehanna model.
+
+utils.interpolate_linear does a binary search over the original table on
+every call. A UniformLookupTable resamples the same piecewise linear curve
+once on a dense uniform grid, so that a lookup reduces to index arithmetic.
+Outside of the original table the curve is extrapolated from its first or
+last two points, exactly as interpolate_linear does.
+
+Each table is packed into a single float array, a header followed by the
+values on the grid, which the compiled lookup reads. pack_lookup_tables
+stacks the tables of the model into the rows of one array, so that
+simulation_kernel looks them up by row inside the compiled simulation.
+"""
+import warnings
+
+import numpy as np
+
+import utils
+from kernels import kernel
+
+# layout of the header of a packed table, the values on the grid follow it
+X0, X_END, INV_DX, LOWER_SLOPE, UPPER_SLOPE, Y0, Y_END, N_POINTS = range(8)
+HEADER = 8
+
+# rows of pack_lookup_tables, each conversion is followed by the same
+# conversion of the next lake
+STORAGE_TO_LEVEL = 0
+LEVEL_TO_STORAGE = 2
+LEVEL_TO_SURFACE = 4
+TAILWATER = 6
+MUDDY_RUN = 0
+CONOWINGO = 1
+
+
+@kernel()
+def lookup(table, x):
+    """O(1) lookup of x in a packed table, see UniformLookupTable.packed"""
+    if x <= table[X0]:
+        return (x - table[X0]) * table[LOWER_SLOPE] + table[Y0]
+    elif x >= table[X_END]:
+        return table[Y_END] + table[UPPER_SLOPE] * (x - table[X_END])
+    position = (x - table[X0]) * table[INV_DX]
+    i = int(position)
+    last = int(table[N_POINTS]) - 2
+    if i > last:
+        i = last
+    fraction = position - i
+    lower = table[HEADER + i]
+    return lower + fraction * (table[HEADER + i + 1] - lower)
+
+
+@kernel()
+def lookup_flat(table, x):
+    """lookup of every element of a 1-D array"""
+    y = np.empty(x.size)
+    for i in range(x.size):
+        y[i] = lookup(table, x[i])
+    return y
+
+
+class UniformLookupTable:
+    """
+    Piecewise linear curve Y(X) resampled on a uniform grid
+
+    Parameters
+    ----------
+    X : numpy array
+        1-D, increasing x values of the original table
+    Y : numpy array
+        1-D, y values of the original table
+    n_points : int, optional
+               initial number of grid points
+    tolerance : float, optional
+                maximum error relative to the range of Y. The grid is
+                refined until the error against the exact interpolation is
+                below the tolerance or max_points is reached.
+    max_points : int, optional
+    x_scale : float, optional
+              factor applied to X, to fold a unit conversion into the table
+    y_scale : float, optional
+              factor applied to Y, to fold a unit conversion into the table
+
+    Attributes
+    ----------
+    n_points : int
+    packed : numpy array
+             1-D, the header of the table followed by the values on the grid
+    max_error : float
+                maximum absolute error against the exact interpolation
+    relative_error : float
+                     max_error relative to the range of Y
+    """
+
+    def __init__(self, X, Y, n_points=1024, tolerance=1e-4, max_points=2 ** 20,
+                 x_scale=1.0, y_scale=1.0):
+        self.X = np.asarray(X, dtype=float) * x_scale
+        self.Y = np.asarray(Y, dtype=float) * y_scale
+        self.tolerance = tolerance
+
+        dim = len(self.X) - 1
+        self.x0 = self.X[0]
+        self.x_end = self.X[dim]
+        self.y0 = self.Y[0]
+        self.y_end = self.Y[dim]
+        self.lower_slope = (self.Y[1] - self.Y[0]) / (self.X[1] - self.X[0])
+        self.upper_slope = (self.Y[dim] - self.Y[dim - 1]) / (
+            self.X[dim] - self.X[dim - 1]
+        )
+
+        self.build(n_points)
+        while (
+            tolerance is not None
+            and self.relative_error > tolerance
+            and self.n_points * 2 <= max_points
+        ):
+            self.build(self.n_points * 2)
+
+        if tolerance is not None and self.relative_error > tolerance:
+            warnings.warn(
+                f"lookup table error {self.relative_error:.2e} exceeds "
+                f"tolerance {tolerance:.2e} with {self.n_points} points"
+            )
+
+    def build(self, n_points):
+        """Resample the curve on n_points and update the error report"""
+        self.n_points = n_points
+        self.grid = np.linspace(self.x0, self.x_end, n_points)
+        self.dx = (self.x_end - self.x0) / (n_points - 1)
+        self.inv_dx = 1 / self.dx
+        self.packed = np.empty(HEADER + n_points)
+        self.packed[:HEADER] = [
+            self.x0, self.x_end, self.inv_dx, self.lower_slope,
+            self.upper_slope, self.y0, self.y_end, n_points,
+        ]
+        self.packed[HEADER:] = np.interp(self.grid, self.X, self.Y)
+
+        # both curves are linear in between grid points and knots and agree
+        # on the grid points, so the error is largest at one of the knots
+        exact = utils.interpolate_linear_array(self.X, self.Y, self.X)
+        self.max_error = np.max(np.abs(self.evaluate_array(self.X) - exact))
+        y_range = np.ptp(self.Y)
+        self.relative_error = self.max_error / y_range if y_range else 0.0
+
+    @property
+    def values(self):
+        """values on the grid, a view of packed"""
+        return self.packed[HEADER:]
+
+    def __call__(self, x):
+        return lookup(self.packed, x)
+
+    def evaluate_array(self, x):
+        """Array version of __call__, x can be of any shape"""
+        x = np.asarray(x, dtype=float)
+        return lookup_flat(self.packed, x.ravel()).reshape(x.shape)
+
+    def report(self):
+        return {
+            "n_points": self.n_points,
+            "max_error": self.max_error,
+            "relative_error": self.relative_error,
+            "tolerance": self.tolerance,
+        }
+
+
+def build_lookup_tables(lsv_rel, lsv_rel_muddy, tailwater, tolerance=1e-4,
+                        n_points=1024):
+    """
+    Build the lookup tables used by SusquehannaModel
+
+    Storages are in cubic feet, levels in feet and surfaces in squared feet,
+    so no unit conversion is needed when using the tables.
+
+    Returns
+    -------
+    dict
+    'storage_to_level', 'level_to_storage' and 'level_to_surface' map to a
+    list of two tables, indexed by lake (0 is Muddy Run, 1 is Conowingo),
+    'tailwater' maps to a single table.
+    """
+    acre_feet_to_cubic_feet = utils.acreFeetToCubicFeet(1.0)
+    acre_to_squared_feet = utils.acreToSquaredFeet(1.0)
+    kwargs = dict(tolerance=tolerance, n_points=n_points)
+
+    tables = {
+        "storage_to_level": [],
+        "level_to_storage": [],
+        "level_to_surface": [],
+    }
+    for lsv in (lsv_rel_muddy, lsv_rel):
+        tables["storage_to_level"].append(
+            UniformLookupTable(lsv[2], lsv[0], x_scale=acre_feet_to_cubic_feet,
+                               **kwargs)
+        )
+        tables["level_to_storage"].append(
+            UniformLookupTable(lsv[0], lsv[2], y_scale=acre_feet_to_cubic_feet,
+                               **kwargs)
+        )
+        tables["level_to_surface"].append(
+            UniformLookupTable(lsv[0], lsv[1], y_scale=acre_to_squared_feet,
+                               **kwargs)
+        )
+    tables["tailwater"] = UniformLookupTable(tailwater[0], tailwater[1],
+                                             **kwargs)
+    return tables
+
+
+def pack_lookup_tables(tables):
+    """
+    Stack the packed tables of build_lookup_tables into the rows of one
+    array, in the order of the row constants of this module
+
+    Returns
+    -------
+    numpy array
+    2-D, one packed table per row, padded to the longest one
+    """
+    rows = [
+        *tables["storage_to_level"],
+        *tables["level_to_storage"],
+        *tables["level_to_surface"],
+        tables["tailwater"],
+    ]
+    packed = np.zeros((len(rows), max(row.packed.size for row in rows)))
+    for i, row in enumerate(rows):
+        packed[i, :row.packed.size] = row.packed
+    return packed
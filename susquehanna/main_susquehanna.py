@@ -9,11 +9,37 @@ import logging
 import os
 import pandas as pd
 import random
-from platypus import EpsNSGAII, ProcessPoolEvaluator
+import time
+from platypus import EpsNSGAII
+from evaluators import WorkerPool
+from racing import RacingEvaluator
+from surrogate import SurrogateEvaluator
+import kernels
 # Other evaluators seem to not yield faster results: Evaluator, PoolEvaluator, MultiprocessingEvaluator
 from problem_formulation_original import TraditionalPrinciple
 import rbf_functions
 
+# size of the evaluation cache of every worker, see
+# SusquehannaModel.set_evaluation_cache; off (0) by default. Offspring
+# identical to an evaluated solution are rare, so the cache only pays off
+# with a CACHE_RESOLUTION coarse enough to merge near-identical offspring
+EVALUATION_CACHE_SIZE = 0
+CACHE_RESOLUTION = None
+
+# SQLite database keeping every evaluation, shared by all formulations and
+# runs of the same model, see SusquehannaModel.set_evaluation_store; off
+# (None) by default. A policy missing from the store is simulated for all
+# 13 objectives, so the store trades away the objective masking of the
+# formulations, and every worker writes to the database after each
+# simulation
+EVALUATION_STORE = None
+
+# only simulate the offspring a Gaussian process surrogate cannot rule
+# out, see surrogate.SurrogateEvaluator; off by default. Screened out
+# offspring never enter the archive, but a run no longer follows the same
+# trajectory as without screening
+SURROGATE_SCREENING = False
+
 class TrackProgress:
     def __init__(self):
         self.nfe = []
@@ -110,21 +136,89 @@ def main():
     # choose problem
     problem_choices = [traditional]
 
-    for problem_choice in problem_choices:
-        for seed in seeds:
-            random.seed(seed)
-
+    # publish the model data in shared memory once, the workers attach to
+    # it instead of receiving a copy with every evaluation
+    shared_data = problem_choices[0].susquehanna_river.publish_shared_data()
+    for problem_choice in problem_choices[1:]:
+        problem_choice.susquehanna_river.use_shared_data(shared_data)
+
+    # every worker memoises the evaluations of its models, so offspring
+    # identical to an evaluated solution are not simulated again
+    if EVALUATION_CACHE_SIZE:
+        for problem_choice in problem_choices:
+            problem_choice.susquehanna_river.set_evaluation_cache(
+                EVALUATION_CACHE_SIZE, CACHE_RESOLUTION
+            )
 
-            # leave it as is
-            epsilons = [0.5, 0.05, 0.05, 0.05, 0.001, 0.05, 0.1]
+    # keep every evaluation on disk, shared by all formulations and runs
+    # of the same model, see evaluation_store
+    if EVALUATION_STORE is not None:
+        for problem_choice in problem_choices:
+            problem_choice.susquehanna_river.set_evaluation_store(
+                EVALUATION_STORE
+            )
 
-            track_progress = TrackProgress()
-            with ProcessPoolEvaluator() as evaluator:
-                algorithm = EpsNSGAII(problem_choice, epsilons=epsilons, evaluator=evaluator)
-                algorithm.run(250, track_progress)
-            store_results(
-                algorithm, track_progress, "output_test_2", f"{problem_choice.__class__.__name__}", seed
+    # start and warm the workers once, all runs share them
+    with shared_data, WorkerPool(problem_choices) as pool:
+        logging.info(
+            "Started %d of %d workers warm in %.1f s",
+            pool.warm_workers, pool.processes, pool.startup_time,
+        )
+        for pid, report in pool.kernel_reports().items():
+            logging.info(
+                "Worker %d loaded %d kernels from the cache and compiled %d",
+                pid, *kernels.summarize(report),
             )
+        for problem_choice in problem_choices:
+            for seed in seeds:
+                random.seed(seed)
+
+
+                # leave it as is
+                epsilons = [0.5, 0.05, 0.05, 0.05, 0.001, 0.05, 0.1]
+
+                # with stochastic data, stop the Monte Carlo evaluation of
+                # candidates that cannot enter the archive
+                racing = not problem_choice.susquehanna_river.historic_data
+
+                track_progress = TrackProgress()
+                start = time.perf_counter()
+                with pool.evaluator() as evaluator:
+                    if racing:
+                        evaluator = racing_evaluator = RacingEvaluator(
+                            evaluator, epsilons
+                        )
+                    # only simulate the offspring a surrogate cannot rule out
+                    if SURROGATE_SCREENING:
+                        evaluator = SurrogateEvaluator(evaluator, epsilons)
+                    algorithm = EpsNSGAII(problem_choice, epsilons=epsilons, evaluator=evaluator)
+                    if SURROGATE_SCREENING:
+                        evaluator.screen_against(algorithm.archive)
+                    if racing:
+                        racing_evaluator.race_against(algorithm.archive)
+                    algorithm.run(250, track_progress)
+                logging.info(
+                    "Optimised %s for seed %d in %.1f s",
+                    problem_choice.__class__.__name__,
+                    seed,
+                    time.perf_counter() - start,
+                )
+                if SURROGATE_SCREENING:
+                    logging.info(
+                        "Simulated %d and screened out %d solutions",
+                        evaluator.statistics["simulated"],
+                        evaluator.statistics["screened"],
+                    )
+                store_results(
+                    algorithm, track_progress, "output_test_2", f"{problem_choice.__class__.__name__}", seed
+                )
+        for pid, statistics in pool.evaluation_cache_statistics().items():
+            for stats in statistics:
+                logging.info(
+                    "Worker %d evaluation cache: %d hits, %d misses, "
+                    "%d evictions",
+                    pid, stats["hits"], stats["misses"], stats["evictions"],
+                )
 
 
 if __name__ == "__main__":
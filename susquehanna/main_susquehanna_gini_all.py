@@ -9,11 +9,29 @@ import logging
 import os
 import pandas as pd
 import random
-from platypus import EpsNSGAII, ProcessPoolEvaluator
+import time
+from platypus import EpsNSGAII
+from evaluators import WorkerPool
+from surrogate import SurrogateEvaluator
+import kernels
     # Other evaluators seem to not yield faster results: Evaluator, PoolEvaluator, MultiprocessingEvaluator
 from problem_formulation_gini import CombinedTraditionalGiniMean, CombinedTraditionalGiniStd, CombinedTraditionalGiniRatioStdMean
 import rbf_functions
 
+# SQLite database keeping every evaluation, shared by all formulations and
+# runs of the same model, see SusquehannaModel.set_evaluation_store; off
+# (None) by default. A policy missing from the store is simulated for all
+# 13 objectives, so the store trades away the objective masking of the
+# formulations, and every worker writes to the database after each
+# simulation
+EVALUATION_STORE = None
+
+# only simulate the offspring a Gaussian process surrogate cannot rule
+# out, see surrogate.SurrogateEvaluator; off by default. Screened out
+# offspring never enter the archive, but a run no longer follows the same
+# trajectory as without screening
+SURROGATE_SCREENING = False
+
 class TrackProgress:
     def __init__(self):
         self.nfe = []
@@ -118,21 +136,64 @@ def main():
 
     problem_choices = [gini_mean, gini_std, gini_ratio_std_mean]
     # choose problem
-    for problem_choice in problem_choices:
-        for seed in seeds:
-            random.seed(seed)
-
-            # leave it as is
-            epsilons = [0.5, 0.05, 0.05, 0.05, 0.001, 0.05, 0.1]
-
-            # run all problems
-            track_progress = TrackProgress()
-            with ProcessPoolEvaluator() as evaluator:
-                algorithm = EpsNSGAII(problem_choice, epsilons=epsilons, evaluator=evaluator)
-                algorithm.run(250000, track_progress)
-            store_results(
-                algorithm, track_progress, "output", f"{problem_choice.__class__.__name__}", seed
+    # publish the model data in shared memory once, the workers attach to
+    # it instead of receiving a copy with every evaluation
+    shared_data = problem_choices[0].susquehanna_river.publish_shared_data()
+    for problem_choice in problem_choices[1:]:
+        problem_choice.susquehanna_river.use_shared_data(shared_data)
+
+    # keep every evaluation on disk, shared by all formulations and runs
+    # of the same model, see evaluation_store
+    if EVALUATION_STORE is not None:
+        for problem_choice in problem_choices:
+            problem_choice.susquehanna_river.set_evaluation_store(
+                EVALUATION_STORE
+            )
+
+    # start and warm the workers once, all runs share them
+    with shared_data, WorkerPool(problem_choices) as pool:
+        logging.info(
+            "Started %d of %d workers warm in %.1f s",
+            pool.warm_workers, pool.processes, pool.startup_time,
+        )
+        for pid, report in pool.kernel_reports().items():
+            logging.info(
+                "Worker %d loaded %d kernels from the cache and compiled %d",
+                pid, *kernels.summarize(report),
             )
+        for problem_choice in problem_choices:
+            for seed in seeds:
+                random.seed(seed)
+
+                # leave it as is
+                epsilons = [0.5, 0.05, 0.05, 0.05, 0.001, 0.05, 0.1]
+
+                # run all problems
+                track_progress = TrackProgress()
+                start = time.perf_counter()
+                with pool.evaluator() as evaluator:
+                    # only simulate the offspring a surrogate cannot rule out
+                    if SURROGATE_SCREENING:
+                        evaluator = SurrogateEvaluator(evaluator, epsilons)
+                    algorithm = EpsNSGAII(problem_choice, epsilons=epsilons, evaluator=evaluator)
+                    if SURROGATE_SCREENING:
+                        evaluator.screen_against(algorithm.archive)
+                    algorithm.run(250000, track_progress)
+                logging.info(
+                    "Optimised %s for seed %d in %.1f s",
+                    problem_choice.__class__.__name__,
+                    seed,
+                    time.perf_counter() - start,
+                )
+                if SURROGATE_SCREENING:
+                    logging.info(
+                        "Simulated %d and screened out %d solutions",
+                        evaluator.statistics["simulated"],
+                        evaluator.statistics["screened"],
+                    )
+                store_results(
+                    algorithm, track_progress, "output", f"{problem_choice.__class__.__name__}", seed
+                )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,194 @@
+"""
+Vectorized reliability and equity metrics.
+
+SusquehannaModel compares the reliabilities of its six users with the sum
+of their pairwise absolute differences ("euclidean" distance of 1-D values)
+and the Gini coefficient, for the year and for each month. For n values in
+ascending order x_(1) <= ... <= x_(n) the pairwise sum has the closed form
+
+    sum_{i<j} |x_i - x_j| = sum_k (2k - n - 1) x_(k)
+
+so both metrics take a sort instead of n (n - 1) / 2 differences. All
+functions work on the last axis and broadcast over any leading axes, a
+(12 X 6) monthly reliability matrix or a (n_policies X 12 X 6) population
+is handled in one call.
+
+Monthly aggregation goes through a MonthIndex, a precomputed grouping of
+the days into months that averages with a single np.add.reduceat.
+"""
+import functools
+
+import numpy as np
+
+N_MONTHS = 12
+
+# days in each month of the 365 day year of the model
+DAYS_IN_MONTH = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+
+
+def pairwise_distance_sum(x):
+    """
+    Sum of the absolute differences of all pairs of values along the last
+    axis, see SusquehannaModel.euclidean_distance_scipy
+
+    Parameters
+    ----------
+    x : numpy array
+        values along the last axis, any leading shape
+    Returns
+    -------
+    numpy array or float
+    shape is x.shape[:-1]
+    """
+    x = np.sort(np.asarray(x, dtype=float), axis=-1)
+    n = x.shape[-1]
+    coefficients = 2 * np.arange(n) - n + 1
+    return x @ coefficients
+
+
+def gini_coefficient(x):
+    """
+    Gini coefficient of the values along the last axis, see
+    SusquehannaModel.gini_coefficient_scipy
+
+    Parameters
+    ----------
+    x : numpy array
+        values along the last axis, any leading shape
+    Returns
+    -------
+    numpy array or float
+    shape is x.shape[:-1]
+    """
+    x = np.asarray(x, dtype=float)
+    n = x.shape[-1]
+    return pairwise_distance_sum(x) / (2 * n ** 2 * np.mean(x, axis=-1))
+
+
+def equity(reliability):
+    """
+    Gini coefficient and pairwise distance sum of the reliabilities of the
+    users, both from a single sort
+
+    Parameters
+    ----------
+    reliability : numpy array
+                  reliability of each user along the last axis, e.g. a
+                  (12 X 6) matrix of monthly reliabilities, optionally with
+                  a leading population axis
+    Returns
+    -------
+    tuple of numpy arrays
+    gini coefficients and distance sums, shape is reliability.shape[:-1]
+    """
+    reliability = np.asarray(reliability, dtype=float)
+    n = reliability.shape[-1]
+    distance = pairwise_distance_sum(reliability)
+    gini = distance / (2 * n ** 2 * np.mean(reliability, axis=-1))
+    return gini, distance
+
+
+def month_of_day(n_days, calendar=False):
+    """
+    Month (0 - 11) of every day of a simulation starting on January 1st
+
+    Parameters
+    ----------
+    n_days : int
+    calendar : bool, optional
+               if true, calendar months of the 365 day year, repeated every
+               year; if false day i belongs to month i % 12, the grouping of
+               SusquehannaModel.monthly_average
+    Returns
+    -------
+    numpy array
+    1-D, of int
+    """
+    days = np.arange(n_days)
+    if not calendar:
+        return days % N_MONTHS
+    months_of_year = np.repeat(np.arange(N_MONTHS), DAYS_IN_MONTH)
+    return months_of_year[days % DAYS_IN_MONTH.sum()]
+
+
+class MonthIndex:
+    """
+    Grouping of days into months, precomputed for np.add.reduceat
+
+    Parameters
+    ----------
+    n_days : int
+    calendar : bool, optional
+               see month_of_day
+
+    Attributes
+    ----------
+    months : numpy array
+             month of each day
+    order : numpy array or None
+            permutation that sorts the days by month, None if they already
+            are
+    starts : numpy array
+             first position of each month in the sorted days
+    counts : numpy array
+             number of days of each month
+    """
+
+    def __init__(self, n_days, calendar=False):
+        self.n_days = n_days
+        self.months = month_of_day(n_days, calendar)
+        order = np.argsort(self.months, kind="stable")
+        self.order = None if np.all(order == np.arange(n_days)) else order
+        self.counts = np.bincount(self.months, minlength=N_MONTHS)
+        if np.any(self.counts == 0):
+            raise ValueError(f"{n_days} days do not cover all months")
+        self.starts = np.concatenate([[0], np.cumsum(self.counts)[:-1]])
+
+    def sum(self, x):
+        """
+        Monthly sums of daily values along the last axis
+
+        Parameters
+        ----------
+        x : numpy array
+            shape is (..., n_days)
+        Returns
+        -------
+        numpy array
+        shape is (..., 12)
+        """
+        x = np.asarray(x, dtype=float)
+        if x.shape[-1] != self.n_days:
+            raise ValueError(f"expected {self.n_days} days, got {x.shape[-1]}")
+        if self.order is not None:
+            x = x[..., self.order]
+        return np.add.reduceat(x, self.starts, axis=-1)
+
+    def mean(self, x):
+        """Monthly averages of daily values along the last axis, see sum"""
+        return self.sum(x) / self.counts
+
+
+@functools.lru_cache(maxsize=None)
+def month_index(n_days, calendar=False):
+    """MonthIndex for n_days, built once per process"""
+    return MonthIndex(n_days, calendar)
+
+
+def monthly_average(x, calendar=False):
+    """
+    Monthly averages of daily values along the last axis
+
+    Parameters
+    ----------
+    x : numpy array
+        shape is (..., n_days)
+    calendar : bool, optional
+               see month_of_day
+    Returns
+    -------
+    numpy array
+    shape is (..., 12)
+    """
+    x = np.asarray(x, dtype=float)
+    return month_index(x.shape[-1], calendar).mean(x)
@@ -0,0 +1,30 @@
+"""
+Shared parts of the problem formulations.
+
+Every formulation picks its objectives from the 13 objectives of
+SusquehannaModel.evaluate, listed once per class in objective_indices.
+"""
+
+
+class BatchEvaluation:
+    '''
+    Mixin of the problem formulations that evaluates a chunk of decision
+    vectors at once, used by evaluators.ChunkedEvaluator. The class defines
+    objective_indices, the objectives of SusquehannaModel.evaluate it
+    optimises, in order, and its model as susquehanna_river.
+    '''
+    objective_indices = None
+
+    def evaluate_batch(self, X):
+        '''
+        Objectives of many decision vectors at once, see evaluate.
+
+        Input:
+        X: type numpy array, one decoded decision vector per row
+        Output:
+        objectives: type numpy array, one row per decision vector
+        '''
+        y = self.susquehanna_river.evaluate_batch(
+            X, objectives=self.objective_indices
+        )
+        return y[:, self.objective_indices]
@@ -1,10 +1,9 @@
 from susquehanna_model import SusquehannaModel
 from platypus import Problem
-from scipy.spatial.distance import pdist
-import pandas as pd
+from problem_formulation import BatchEvaluation
 
 
-class CombinedTraditionalEuclideanMean(Problem):
+class CombinedTraditionalEuclideanMean(BatchEvaluation, Problem):
     '''
     According to the explanation given in the thesis, this is the Proportionality-based Equity objective formulation. The
     goal is to minimize the distance between the ratio of allocation and demand of the objectives, also known as the reliability.
@@ -22,6 +21,9 @@ class CombinedTraditionalEuclideanMean(Problem):
     solution: type dictionary
     '''
 
+    # objectives of SusquehannaModel.evaluate, in order
+    objective_indices = [0, 1, 2, 3, 4, 5, 8]
+
     def __init__(self, n_decision_vars, n_objectives,
                  n_years, rbf):
         super(CombinedTraditionalEuclideanMean, self).__init__(n_decision_vars, n_objectives)
@@ -45,11 +47,11 @@ class CombinedTraditionalEuclideanMean(Problem):
         x = solution.variables[:]
         self.function = self.susquehanna_river.evaluate
 
-        y = self.function(x)
+        y = self.function(x, objectives=self.objective_indices)
         y = list(y)
 
         # euclidean mean is index number 8
-        index_nums_mean = [0, 1, 2, 3, 4, 5, 8]
+        index_nums_mean = self.objective_indices
 
         # specify here which formulation you are using
 
@@ -61,7 +63,7 @@ class CombinedTraditionalEuclideanMean(Problem):
         solution.objectives[:] = solution_set
 
 
-class CombinedTraditionalEuclideanStd(Problem):
+class CombinedTraditionalEuclideanStd(BatchEvaluation, Problem):
     '''
     According to the explanation given in the thesis, this is the Proportionality-based Equity objective formulation. The
     goal is to minimize the distance between the ratio of allocation and demand of the objectives, also known as the reliability.
@@ -79,6 +81,9 @@ class CombinedTraditionalEuclideanStd(Problem):
     solution: type dictionary
     '''
 
+    # objectives of SusquehannaModel.evaluate, in order
+    objective_indices = [0, 1, 2, 3, 4, 5, 10]
+
     def __init__(self, n_decision_vars, n_objectives,
                  n_years, rbf):
         super(CombinedTraditionalEuclideanStd, self).__init__(n_decision_vars, n_objectives)
@@ -102,12 +107,12 @@ class CombinedTraditionalEuclideanStd(Problem):
         x = solution.variables[:]
         self.function = self.susquehanna_river.evaluate
 
-        y = self.function(x)
+        y = self.function(x, objectives=self.objective_indices)
 
         y = list(y)
 
         # euclidean standard deviation is index number 10
-        index_nums_std = [0, 1, 2, 3, 4, 5, 10]
+        index_nums_std = self.objective_indices
 
         # specify here which formulation you are using
         index_nums = index_nums_std
@@ -116,7 +121,8 @@ class CombinedTraditionalEuclideanStd(Problem):
         solution_set = [y[var] for var in index_nums]
         solution.objectives[:] = solution_set
 
-class CombinedTraditionalEuclideanRatioStdMean(Problem):
+
+class CombinedTraditionalEuclideanRatioStdMean(BatchEvaluation, Problem):
     '''
     According to the explanation given in the thesis, this is the Proportionality-based Equity objective formulation. The
     goal is to minimize the distance between the ratio of allocation and demand of the objectives, also known as the reliability.
@@ -134,6 +140,9 @@ class CombinedTraditionalEuclideanRatioStdMean(Problem):
     solution: type dictionary
     '''
 
+    # objectives of SusquehannaModel.evaluate, in order
+    objective_indices = [0, 1, 2, 3, 4, 5, 12]
+
     def __init__(self, n_decision_vars, n_objectives,
                  n_years, rbf):
         super(CombinedTraditionalEuclideanRatioStdMean, self).__init__(n_decision_vars, n_objectives)
@@ -157,12 +166,12 @@ class CombinedTraditionalEuclideanRatioStdMean(Problem):
         x = solution.variables[:]
         self.function = self.susquehanna_river.evaluate
 
-        y = self.function(x)
+        y = self.function(x, objectives=self.objective_indices)
 
         y = list(y)
 
         # euclidean ratio is index number 12
-        index_nums_mean = [0, 1, 2, 3, 4, 5, 12]
+        index_nums_mean = self.objective_indices
 
         # specify here which formulation you are using
 
@@ -172,6 +181,3 @@ class CombinedTraditionalEuclideanRatioStdMean(Problem):
 
         solution_set = [y[var] for var in index_nums]
         solution.objectives[:] = solution_set
-
-
-
@@ -1,9 +1,9 @@
 from susquehanna_model import SusquehannaModel
 from platypus import Problem
+from problem_formulation import BatchEvaluation
 import numpy as np
-import pandas as pd
 
-class CombinedTraditionalGiniMean(Problem):
+class CombinedTraditionalGiniMean(BatchEvaluation, Problem):
     '''
     According to the explanation given in the thesis, this is the Proportionality-based Equity objective formulation. The
     goal is to minimize the distance between the ratio of allocation and demand of the objectives, also known as the reliability.
@@ -21,6 +21,9 @@ class CombinedTraditionalGiniMean(Problem):
     solution: type dictionary
     '''
 
+    # objectives of SusquehannaModel.evaluate, in order
+    objective_indices = [0, 1, 2, 3, 4, 5, 7]
+
     def __init__(self, n_decision_vars, n_objectives,
                 n_years, rbf):
         super(CombinedTraditionalGiniMean, self).__init__(n_decision_vars, n_objectives)
@@ -45,11 +48,11 @@ class CombinedTraditionalGiniMean(Problem):
         x = solution.variables[:]
         self.function = self.susquehanna_river.evaluate
 
-        y = self.function(x)
+        y = self.function(x, objectives=self.objective_indices)
         y = list(y)
 
         # gini mean is index number 7
-        index_nums_mean = [0, 1, 2, 3, 4, 5, 7]
+        index_nums_mean = self.objective_indices
 
         # specify here which formulation you are using
         index_nums = index_nums_mean
@@ -61,7 +64,7 @@ class CombinedTraditionalGiniMean(Problem):
         solution.objectives[:] = solution_set
 
 
-class CombinedTraditionalGiniStd(Problem):
+class CombinedTraditionalGiniStd(BatchEvaluation, Problem):
     '''
     According to the explanation given in the thesis, this is the Proportionality-based Equity objective formulation. The
     goal is to minimize the distance between the ratio of allocation and demand of the objectives, also known as the reliability.
@@ -79,6 +82,9 @@ class CombinedTraditionalGiniStd(Problem):
     solution: type dictionary
     '''
 
+    # objectives of SusquehannaModel.evaluate, in order
+    objective_indices = [0, 1, 2, 3, 4, 5, 9]
+
     def __init__(self, n_decision_vars, n_objectives,
                 n_years, rbf):
         super(CombinedTraditionalGiniStd, self).__init__(n_decision_vars, n_objectives)
@@ -103,11 +109,11 @@ class CombinedTraditionalGiniStd(Problem):
         x = solution.variables[:]
         self.function = self.susquehanna_river.evaluate
 
-        y = self.function(x)
+        y = self.function(x, objectives=self.objective_indices)
 
         y = list(y)
         # gini standard deviation is index number 9
-        index_nums_std = [0, 1, 2, 3, 4, 5, 9]
+        index_nums_std = self.objective_indices
 
         # specify here which formulation you are using
         index_nums = index_nums_std
@@ -118,7 +124,8 @@ class CombinedTraditionalGiniStd(Problem):
         # self.add_objective(euclidean_distance, name = 'equity')
         solution.objectives[:] = solution_set
 
-class CombinedTraditionalGiniRatioStdMean(Problem):
+
+class CombinedTraditionalGiniRatioStdMean(BatchEvaluation, Problem):
     '''
     According to the explanation given in the thesis, this is the Proportionality-based Equity objective formulation. The
     goal is to minimize the distance between the ratio of allocation and demand of the objectives, also known as the reliability.
@@ -136,6 +143,9 @@ class CombinedTraditionalGiniRatioStdMean(Problem):
     solution: type dictionary
     '''
 
+    # objectives of SusquehannaModel.evaluate, in order
+    objective_indices = [0, 1, 2, 3, 4, 5, 11]
+
     def __init__(self, n_decision_vars, n_objectives,
                 n_years, rbf):
         super(CombinedTraditionalGiniRatioStdMean, self).__init__(n_decision_vars, n_objectives)
@@ -160,10 +170,10 @@ class CombinedTraditionalGiniRatioStdMean(Problem):
         x = solution.variables[:]
         self.function = self.susquehanna_river.evaluate
 
-        y = self.function(x)
+        y = self.function(x, objectives=self.objective_indices)
         y = list(y)
         # gini ratio is index number 11
-        index_nums_std = [0, 1, 2, 3, 4, 5, 11]
+        index_nums_std = self.objective_indices
 
         # specify here which formulation you are using
 
@@ -172,7 +182,3 @@ class CombinedTraditionalGiniRatioStdMean(Problem):
         # specify solution set which will be added to objectives
         solution_set = [y[var] for var in index_nums]
         solution.objectives[:] = solution_set
-
-
-
-
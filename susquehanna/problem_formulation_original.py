@@ -1,12 +1,12 @@
 import numpy as np
 
-import csv
 from susquehanna_model import SusquehannaModel
 from platypus import Problem
-import pandas as pd
 
+from problem_formulation import BatchEvaluation
 
-class TraditionalPrinciple(Problem):
+
+class TraditionalPrinciple(BatchEvaluation, Problem):
     '''
     According to the explanation given in the thesis, this is the Original objective formulation. The
     goal is to maximize the direction of all objectives in a consequentialist manner. Therefore we maximize
@@ -17,6 +17,9 @@ class TraditionalPrinciple(Problem):
     Output:
     solution: type dictionary
     '''
+    # objectives of SusquehannaModel.evaluate, in order
+    objective_indices = [0, 1, 2, 3, 4, 5]
+
     def __init__(self,
                  n_decision_vars,
                  n_objectives,
@@ -45,12 +48,7 @@ class TraditionalPrinciple(Problem):
         x = solution.variables[:]
 
         self.function = self.susquehanna_river.evaluate
-        y = self.function(x)
+        y = self.function(x, objectives=self.objective_indices)
 
         # set objective values for only original problem posed [0:6]
-        solution.objectives[:] = y[0:6]
-
-
-
-
-
+        solution.objectives[:] = [y[i] for i in self.objective_indices]
@@ -0,0 +1,265 @@
+"""
+Streaming percentiles of ensemble objectives.
+
+evaluate_mc reduces the objectives of every trace of the ensemble to a
+percentile. A QuantileReducer receives the objectives chunk by chunk and
+never keeps all of them:
+
+exact
+    Only the order statistics np.percentile interpolates between can
+    matter. For the 99th percentile of n traces these are among the
+    n - floor(0.99 (n - 1)) largest values, so with a known number of
+    samples the reducer keeps that tail, about 1% of the ensemble, and
+    returns the same numbers as np.percentile over all of them.
+
+approximate
+    A Greenwald-Khanna summary per objective, which keeps
+    O(log(epsilon n) / epsilon) values and answers any rank within
+    epsilon n of the requested one. Unlike P-square or t-digest estimates
+    this guarantee is deterministic, so every percentile comes with a
+    bracket the exact value is known to lie in, reported by error_bound.
+    For extreme percentiles the exact tail is the smaller of the two until
+    the ensemble reaches millions of traces; the summary is independent of
+    the percentile and does not need the number of samples in advance.
+"""
+import bisect
+import math
+
+import numpy as np
+
+METHODS = ("exact", "approximate")
+
+
+def interpolate(lower, upper, fraction):
+    """Linear interpolation between order statistics as in np.percentile"""
+    difference = upper - lower
+    if fraction >= 0.5:
+        return upper - difference * (1 - fraction)
+    return lower + difference * fraction
+
+
+class GKSummary:
+    """
+    Greenwald-Khanna summary of a stream of values
+
+    Each stored value v_i carries g_i, the number of values between it and
+    its predecessor in the summary, and delta_i, the uncertainty of its
+    rank: the rank of v_i lies in [rmin_i, rmin_i + delta_i] with rmin_i
+    the sum of g up to i.
+
+    Parameters
+    ----------
+    epsilon : float
+              maximum rank error relative to the number of values
+    """
+
+    def __init__(self, epsilon):
+        if not 0 < epsilon < 1:
+            raise ValueError("epsilon should be between 0 and 1")
+        self.epsilon = epsilon
+        self.values = []
+        self.g = []
+        self.delta = []
+        self.count = 0
+        self.compress_every = max(int(1 / (2 * epsilon)), 1)
+
+    def insert(self, value):
+        i = bisect.bisect_right(self.values, value)
+        if i == 0 or i == len(self.values):
+            delta = 0
+        else:
+            delta = int(2 * self.epsilon * self.count)
+        self.values.insert(i, value)
+        self.g.insert(i, 1)
+        self.delta.insert(i, delta)
+        self.count += 1
+        if self.count % self.compress_every == 0:
+            self.compress()
+
+    def compress(self):
+        """Merge neighbouring values whose combined rank range allows it"""
+        threshold = int(2 * self.epsilon * self.count)
+        i = len(self.values) - 2
+        while i >= 1:
+            if self.g[i] + self.g[i + 1] + self.delta[i + 1] <= threshold:
+                self.g[i + 1] += self.g[i]
+                del self.values[i], self.g[i], self.delta[i]
+            i -= 1
+
+    def query(self, rank):
+        """
+        Value of approximately the given rank, and a bracket of the value
+        of exactly that rank
+
+        Parameters
+        ----------
+        rank : int
+               1-based rank in the values inserted so far
+        Returns
+        -------
+        tuple
+        estimate, lower bound, upper bound
+        """
+        if self.count == 0:
+            raise ValueError("the summary is empty")
+        allowed = self.epsilon * self.count
+        rmin = 0
+        estimate = None
+        lower = self.values[0]
+        upper = self.values[-1]
+        for value, g, delta in zip(self.values, self.g, self.delta):
+            rmin += g
+            rmax = rmin + delta
+            if estimate is None and rank - rmin <= allowed and rmax - rank <= allowed:
+                estimate = value
+            # a value whose rank is certainly at most / at least rank
+            # bounds the value of that rank from below / above
+            if rmax <= rank:
+                lower = value
+            if rmin >= rank:
+                upper = value
+                break
+        if estimate is None:
+            estimate = upper
+        return estimate, lower, upper
+
+    def __len__(self):
+        return len(self.values)
+
+
+class QuantileReducer:
+    """
+    Percentile of every column of a stream of samples
+
+    Parameters
+    ----------
+    percentile : float
+                 percentile to compute, 0 - 100
+    n_columns : int
+    method : {'exact', 'approximate'}, optional
+    n_samples : int, optional
+                total number of samples, lets the exact method keep only
+                the tail it needs; without it all samples are kept
+    epsilon : float, optional
+              rank error of the approximate method relative to the number
+              of samples
+    """
+
+    def __init__(self, percentile, n_columns, method="exact", n_samples=None,
+                 epsilon=1e-3):
+        if method not in METHODS:
+            raise ValueError(f"unknown method {method}, use one of {METHODS}")
+        self.q = percentile / 100
+        self.n_columns = n_columns
+        self.method = method
+        self.n_samples = n_samples
+        self.count = 0
+        self.has_nan = np.zeros(n_columns, dtype=bool)
+
+        # exact: the kept order statistics, the largest values if the
+        # percentile is in the upper half and the smallest otherwise
+        self.upper = self.q >= 0.5
+        self.keep = None
+        if n_samples is not None:
+            lowest = math.floor(self.position(n_samples))
+            self.keep = n_samples - lowest if self.upper else lowest + 2
+        self.kept = np.empty((0, n_columns))
+
+        # approximate
+        self.summaries = [GKSummary(epsilon) for _ in range(n_columns)]
+
+    def position(self, n):
+        """
+        0-based position of the percentile among n sorted values, computed
+        as np.percentile does so that the exact method matches it bitwise
+        """
+        return (n - 1) * self.q
+
+    def add(self, samples):
+        """
+        Parameters
+        ----------
+        samples : numpy array
+                  shape (n, n_columns)
+        """
+        samples = np.asarray(samples, dtype=float).reshape(-1, self.n_columns)
+        self.count += samples.shape[0]
+        if self.n_samples is not None and self.count > self.n_samples:
+            raise ValueError(f"more than n_samples={self.n_samples} samples")
+        nan = np.isnan(samples)
+        self.has_nan |= nan.any(axis=0)
+
+        if self.method == "exact":
+            kept = np.sort(np.concatenate([self.kept, samples]), axis=0)
+            if self.keep is not None and kept.shape[0] > self.keep:
+                kept = kept[-self.keep:] if self.upper else kept[: self.keep]
+            self.kept = kept
+        else:
+            for column, summary in enumerate(self.summaries):
+                for value in samples[~nan[:, column], column]:
+                    summary.insert(value)
+
+    def bounds(self):
+        """
+        Percentile of every column, with a bracket the exact percentile is
+        guaranteed to lie in; the bracket is the estimate itself in the
+        exact method
+
+        Returns
+        -------
+        tuple of numpy arrays
+        estimate, lower bound, upper bound, each (n_columns,); nan for
+        columns with a nan sample
+        """
+        if self.count == 0:
+            raise ValueError("no samples")
+        position = self.position(self.count)
+        lowest = math.floor(position)
+        fraction = position - lowest
+        highest = min(lowest + 1, self.count - 1)
+
+        if self.method == "exact":
+            # index of the lowest order statistic among the kept ones
+            offset = 0
+            if self.upper:
+                offset = self.count - self.kept.shape[0]
+            below = self.kept[lowest - offset]
+            above = self.kept[highest - offset]
+            estimate = np.array([
+                interpolate(a, b, fraction) for a, b in zip(below, above)
+            ])
+            lower = upper = estimate
+        else:
+            estimate = np.empty(self.n_columns)
+            lower = np.empty(self.n_columns)
+            upper = np.empty(self.n_columns)
+            for column, summary in enumerate(self.summaries):
+                if len(summary) == 0:
+                    estimate[column] = lower[column] = upper[column] = np.nan
+                    continue
+                below, lower[column], _ = summary.query(lowest + 1)
+                above, _, upper[column] = summary.query(highest + 1)
+                estimate[column] = interpolate(below, above, fraction)
+
+        estimate = np.where(self.has_nan, np.nan, estimate)
+        lower = np.where(self.has_nan, np.nan, lower)
+        upper = np.where(self.has_nan, np.nan, upper)
+        return estimate, lower, upper
+
+    def quantile(self):
+        """Percentile of every column, see bounds"""
+        return self.bounds()[0]
+
+    def error_bound(self):
+        """
+        Largest possible absolute error of quantile for every column, zero
+        in the exact method
+        """
+        estimate, lower, upper = self.bounds()
+        return np.maximum(estimate - lower, upper - estimate)
+
+    def nbytes(self):
+        """Memory held by the kept values, 8 bytes per value"""
+        if self.method == "exact":
+            return self.kept.nbytes
+        return 8 * sum(3 * len(summary) for summary in self.summaries)
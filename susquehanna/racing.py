@@ -0,0 +1,210 @@
+"""
+Racing Monte Carlo evaluation.
+
+Under the stochastic formulation evaluate_mc simulates every trace of the
+ensemble for every candidate policy, although most candidates of an
+optimisation run are clearly dominated after a few traces. A Race holds a
+snapshot of the epsilon archive of the run; SusquehannaModel.evaluate_mc
+then simulates the traces in increments and stops as soon as an optimistic
+confidence bound on every percentile objective is epsilon-box dominated by
+a member of the archive, i.e. once the candidate cannot be expected to
+enter the archive. Candidates that are not stopped are evaluated over the
+whole ensemble and get exactly the objectives of evaluate_mc.
+
+All candidates see the traces in the same order and the bootstrap uses the
+same resamples (common random numbers), so candidates are compared on the
+same hydrology and the comparisons have low variance.
+
+The optimistic bounds combine what the finite ensemble allows with
+certainty, e.g. the 99th percentile of 48 traces cannot fall below the
+second largest of 16 simulated ones, with a bootstrap interval of the
+percentile over the traces simulated so far. The bootstrap is a
+heuristic for extreme percentiles of few traces, so a candidate is only
+stopped after min_traces traces.
+"""
+import numpy as np
+from platypus import Direction, Evaluator
+
+
+class Race:
+    """
+    Snapshot of an epsilon archive and the settings of the racing
+    evaluation of a candidate
+
+    Parameters
+    ----------
+    archive_objectives : numpy array
+                         objectives of the archive members, (n_members X
+                         n_objectives)
+    epsilons : list of float
+               epsilons of the archive
+    maximize : list of bool
+               direction of every objective
+    increment : int, optional
+                number of traces simulated between two checks
+    min_traces : int, optional
+                 number of traces before a candidate can be stopped,
+                 2 * increment if None
+    confidence : float, optional
+                 one-sided confidence of the optimistic bounds
+    n_bootstrap : int, optional
+                  number of bootstrap resamples
+    seed : int, optional
+           seed of the trace order and of the resamples, shared by all
+           candidates
+    """
+
+    def __init__(self, archive_objectives, epsilons, maximize, increment=8,
+                 min_traces=None, confidence=0.95, n_bootstrap=100, seed=0):
+        self.archive_objectives = np.asarray(archive_objectives, dtype=float)
+        n_objectives = len(maximize)
+        self.epsilons = np.resize(np.asarray(epsilons, dtype=float), n_objectives)
+        self.maximize = np.asarray(maximize, dtype=bool)
+        self.increment = increment
+        self.min_traces = 2 * increment if min_traces is None else min_traces
+        self.confidence = confidence
+        self.n_bootstrap = n_bootstrap
+        self.seed = seed
+
+        # epsilon boxes of the archive, all objectives minimised
+        self.archive_boxes = self.boxes(self.archive_objectives)
+
+    @classmethod
+    def from_archive(cls, archive, problem, epsilons, **kwargs):
+        """
+        Race against the current members of a platypus archive
+
+        Parameters
+        ----------
+        archive : platypus.Archive
+                  e.g. the EpsilonBoxArchive of an EpsNSGAII run
+        problem : platypus.Problem
+        epsilons : list of float
+        kwargs : see Race
+        """
+        objectives = [list(solution.objectives) for solution in archive]
+        maximize = [d == Direction.MAXIMIZE for d in problem.directions]
+        return cls(
+            np.reshape(objectives, (len(objectives), problem.nobjs)),
+            epsilons,
+            maximize,
+            **kwargs,
+        )
+
+    def boxes(self, objectives):
+        """Epsilon boxes of objectives, with all objectives minimised"""
+        signed = np.where(self.maximize, -objectives, objectives)
+        return np.floor(signed / self.epsilons)
+
+    def order(self, n_traces):
+        """Order in which every candidate simulates the traces"""
+        return np.random.default_rng(self.seed).permutation(n_traces)
+
+    def optimistic(self, samples, percentile, n_traces):
+        """
+        Optimistic bound on the percentile of every objective over the
+        ensemble, from the samples of the traces simulated so far
+
+        Two bounds are combined. The order statistics np.percentile
+        interpolates between can only move by as many ranks as there are
+        traces left, which bounds the final percentile with certainty once
+        enough traces are simulated; the bootstrap interval of the
+        percentile over the samples bounds it at the confidence of the race.
+
+        Parameters
+        ----------
+        samples : numpy array
+                  objectives of the simulated traces (n_simulated X
+                  n_objectives)
+        percentile : float
+        n_traces : int
+                   number of traces of the ensemble
+        Returns
+        -------
+        numpy array
+        upper bound for maximised objectives, lower bound for minimised ones
+        """
+        n = samples.shape[0]
+        rng = np.random.default_rng(self.seed + n)
+        resamples = rng.integers(0, n, size=(self.n_bootstrap, n))
+        estimates = np.percentile(samples[resamples], percentile, axis=1)
+        upper = np.quantile(estimates, self.confidence, axis=0)
+        lower = np.quantile(estimates, 1 - self.confidence, axis=0)
+
+        # the final percentile lies between the order statistics lowest and
+        # highest of the ensemble, of which n traces are known
+        position = (n_traces - 1) * percentile / 100
+        lowest = int(np.floor(position))
+        highest = min(lowest + 1, n_traces - 1)
+        ordered = np.sort(samples, axis=0)
+        if lowest - (n_traces - n) >= 0:
+            lower = np.maximum(lower, ordered[lowest - (n_traces - n)])
+        if highest < n:
+            upper = np.minimum(upper, ordered[highest])
+        return np.where(self.maximize, upper, lower)
+
+    def cannot_enter(self, optimistic):
+        """
+        True if the epsilon box of the optimistic objectives is dominated
+        by the box of an archive member, so that not even the optimistic
+        candidate would be added to the archive
+        """
+        if self.archive_boxes.shape[0] == 0 or np.any(np.isnan(optimistic)):
+            return False
+        box = self.boxes(optimistic)
+        dominated = np.all(self.archive_boxes <= box, axis=1) & np.any(
+            self.archive_boxes < box, axis=1
+        )
+        return bool(np.any(dominated))
+
+
+class RacingEvaluator(Evaluator):
+    """
+    Evaluator that races the Monte Carlo evaluations of another evaluator
+    against the archive of an optimisation run
+
+    Before every batch, the models of the problems receive a Race against
+    the current archive; they are pickled with it when the batch goes to
+    worker processes. The objectives of the problems have to be those
+    returned by SusquehannaModel.evaluate_mc, in the same order.
+
+    Parameters
+    ----------
+    evaluator : platypus.Evaluator
+    epsilons : list of float
+               epsilons of the archive
+    kwargs : see Race
+
+    Use as::
+
+        algorithm = EpsNSGAII(problem, epsilons, evaluator=evaluator)
+        evaluator.race_against(algorithm.archive)
+    """
+
+    def __init__(self, evaluator, epsilons, **kwargs):
+        super().__init__()
+        self.evaluator = evaluator
+        self.epsilons = epsilons
+        self.kwargs = kwargs
+        self.archive = None
+
+    def race_against(self, archive):
+        self.archive = archive
+
+    def evaluate_all(self, jobs, **kwargs):
+        problems = {id(job.solution.problem): job.solution.problem for job in jobs}
+        for problem in problems.values():
+            race = None
+            if self.archive is not None and len(self.archive) > 0:
+                race = Race.from_archive(
+                    self.archive, problem, self.epsilons, **self.kwargs
+                )
+            problem.susquehanna_river.race = race
+        try:
+            return self.evaluator.evaluate_all(jobs, **kwargs)
+        finally:
+            for problem in problems.values():
+                problem.susquehanna_river.race = None
+
+    def close(self):
+        self.evaluator.close()
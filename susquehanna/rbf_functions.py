@@ -3,7 +3,18 @@ from platypus import Real
 
 import numpy as np
 # import numba
-from scipy.spatial.distance import cdist
+
+import compiled_rbf_functions
+
+
+def cdist(XA, XB):
+    """
+    scipy.spatial.distance.cdist, imported on first use, workers that only
+    run the compiled rbf functions never load scipy.spatial
+    """
+    from scipy.spatial.distance import cdist
+
+    return cdist(XA, XB)
 
 
 def original_rbf(rbf_input, centers, radii, weights):
@@ -296,6 +307,195 @@ def matern52_rbf(rbf_input, centers, radii, weights):
     return output
 
 
+def batch_distances(rbf_input, centers):
+    """
+    Euclidean distance between each input and each center, the batched
+    counterpart of cdist(rbf_input[np.newaxis, :], centers).T
+
+    Returns
+    -------
+    numpy array
+    shape is (... X n_rbfs X 1)
+    """
+    a = rbf_input[..., np.newaxis, :] - centers
+    return np.sqrt(np.sum(a ** 2, axis=-1))[..., np.newaxis]
+
+
+def batch_weighted_sum(rbf_scores, weights):
+    """Sum over the rbfs of the weights times the rbf scores"""
+    weighted_rbfs = weights * rbf_scores[..., np.newaxis]
+    return weighted_rbfs.sum(axis=-2)
+
+
+# The batched versions below take inputs of shape (... X n_inputs) and
+# parameters of shape (... X n_rbfs X n_inputs) or (... X n_rbfs X
+# n_outputs), where the leading axes broadcast against each other:
+#
+# - one policy, many inputs: rbf_input (n_samples X n_inputs) and 2-D
+#   parameters as for the functions above
+# - one input per policy: rbf_input (n_policies X n_inputs) and parameters
+#   (n_policies X n_rbfs X ...)
+# - many inputs for many policies: rbf_input (n_samples X n_policies X
+#   n_inputs) and parameters (n_policies X n_rbfs X ...)
+#
+# and return an array of shape (... X n_outputs).
+
+
+def original_rbf_batch(rbf_input, centers, radii, weights):
+    """
+    Batched version of original_rbf
+
+    Parameters
+    ----------
+    rbf_input : numpy array
+                shape is (... X n_inputs)
+    centers :   numpy array
+                shape is (... X n_rbfs X n_inputs)
+    radii :     shape is (... X n_rbfs X n_inputs)
+    weights :   shape is (... X n_rbfs X n_outputs)
+    Returns
+    -------
+    numpy array
+    shape is (... X n_outputs)
+    """
+
+    # sum over inputs
+    a = rbf_input[..., np.newaxis, :] - centers
+    b = a ** 2
+    c = radii ** 2
+    rbf_scores = np.exp(-(np.sum(b / c, axis=-1)))
+
+    # sum over rbfs
+    return batch_weighted_sum(rbf_scores, weights)
+
+
+def squared_exponential_rbf_batch(rbf_input, centers, radii, weights):
+    """Batched version of squared_exponential_rbf, see original_rbf_batch"""
+    b = batch_distances(rbf_input, centers) ** 2
+    c = 2 * radii ** 2
+    rbf_scores = np.exp(-(np.sum(b / c, axis=-1)))
+    return batch_weighted_sum(rbf_scores, weights)
+
+
+def gaussian_rbf_batch(rbf_input, centers, radii, weights):
+    """Batched version of gaussian_rbf, see original_rbf_batch"""
+    a = rbf_input[..., np.newaxis, :] - centers
+    n = a / radii
+    p = n ** 2
+    q = np.sum(p, axis=-1)
+    rbf_scores = np.exp(-1 * q)
+    return batch_weighted_sum(rbf_scores, weights)
+
+
+def gaussian_rbf_lit_batch(rbf_input, centers, radii, weights):
+    """Batched version of gaussian_rbf_lit, see original_rbf_batch"""
+    n = batch_distances(rbf_input, centers) * radii
+    q = np.sum(n ** 2, axis=-1)
+    rbf_scores = np.exp(-1 * q)
+    return batch_weighted_sum(rbf_scores, weights)
+
+
+def inverse_quadratic_rbf_batch(rbf_input, centers, radii, weights):
+    """Batched version of inverse_quadratic_rbf, see original_rbf_batch"""
+    b = batch_distances(rbf_input, centers) / radii
+    d = np.sum(b ** 2, axis=-1)
+    rbf_scores = 1 / (1 + d)
+    return batch_weighted_sum(rbf_scores, weights)
+
+
+def inverse_quadratic_rbf_lit_batch(rbf_input, centers, radii, weights):
+    """Batched version of inverse_quadratic_rbf_lit, see original_rbf_batch"""
+    b = batch_distances(rbf_input, centers) * radii
+    d = np.sum(b ** 2, axis=-1)
+    rbf_scores = 1 / (1 + d)
+    return batch_weighted_sum(rbf_scores, weights)
+
+
+def inverse_multiquadric_rbf_batch(rbf_input, centers, radii, weights):
+    """Batched version of inverse_multiquadric_rbf, see original_rbf_batch"""
+    b = (batch_distances(rbf_input, centers) / radii) ** 2
+    rbf_scores = 1 / np.sqrt(1 + np.sum(b, axis=-1))
+    return batch_weighted_sum(rbf_scores, weights)
+
+
+def inverse_multiquadric_rbf_lit_batch(rbf_input, centers, radii, weights):
+    """
+    Batched version of inverse_multiquadric_rbf_lit, see original_rbf_batch
+    """
+    b = (batch_distances(rbf_input, centers) * radii) ** 2
+    rbf_scores = 1 / np.sqrt(1 + np.sum(b, axis=-1))
+    return batch_weighted_sum(rbf_scores, weights)
+
+
+def exponential_rbf_batch(rbf_input, centers, radii, weights):
+    """Batched version of exponential_rbf, see original_rbf_batch"""
+    b = batch_distances(rbf_input, centers) / radii
+    rbf_scores = np.exp(-1 * np.sum(b, axis=-1))
+    return batch_weighted_sum(rbf_scores, weights)
+
+
+def matern32_rbf_batch(rbf_input, centers, radii, weights):
+    """Batched version of matern32_rbf, see original_rbf_batch"""
+    distances = batch_distances(rbf_input, centers)
+    sqrt = np.sqrt(3) * np.sum(distances / radii, axis=-1)
+    rbf_scores = (1 + sqrt) * (np.exp(-sqrt))
+    return batch_weighted_sum(rbf_scores, weights)
+
+
+def matern52_rbf_batch(rbf_input, centers, radii, weights):
+    """Batched version of matern52_rbf, see original_rbf_batch"""
+    distances = batch_distances(rbf_input, centers)
+    sqrt = np.sqrt(5) * np.sum(distances / radii, axis=-1)
+    sq = 5 * np.sum(np.square(distances) / 3 * np.square(radii), axis=-1)
+    rbf_scores = (1 + sqrt + sq) * (np.exp(-sqrt))
+    return batch_weighted_sum(rbf_scores, weights)
+
+
+def gaussian_inverse_scale(radii):
+    """
+    Inverse squared length scale per rbf and input of original_rbf and
+    gaussian_rbf, which both compute exp(-sum((x - c) ** 2 / r ** 2)).
+    """
+    return 1 / radii ** 2
+
+
+def squared_exponential_inverse_scale(radii):
+    """
+    Inverse squared length scale per rbf and input of
+    squared_exponential_rbf. The squared distance over all inputs is divided
+    by 2 * r ** 2 for every input and summed, so every input gets the same
+    scale sum(1 / (2 * r ** 2)).
+    """
+    scale = np.sum(1 / (2 * radii ** 2), axis=1)
+    return np.repeat(scale[:, np.newaxis], radii.shape[1], axis=1)
+
+
+# rbf functions of the form exp(-sum((x - c) ** 2 * s)), for which the
+# contribution of each input factors out of the exponent, mapped to the
+# function that computes s from the radii
+separable_rbfs = {
+    original_rbf: gaussian_inverse_scale,
+    gaussian_rbf: gaussian_inverse_scale,
+    squared_exponential_rbf: squared_exponential_inverse_scale,
+}
+
+
+# batched versions of the rbf functions
+batched_rbfs = {
+    original_rbf: original_rbf_batch,
+    squared_exponential_rbf: squared_exponential_rbf_batch,
+    gaussian_rbf: gaussian_rbf_batch,
+    gaussian_rbf_lit: gaussian_rbf_lit_batch,
+    inverse_quadratic_rbf: inverse_quadratic_rbf_batch,
+    inverse_quadratic_rbf_lit: inverse_quadratic_rbf_lit_batch,
+    inverse_multiquadric_rbf: inverse_multiquadric_rbf_batch,
+    inverse_multiquadric_rbf_lit: inverse_multiquadric_rbf_lit_batch,
+    exponential_rbf: exponential_rbf_batch,
+    matern32_rbf: matern32_rbf_batch,
+    matern52_rbf: matern52_rbf_batch,
+}
+
+
 rbfs = [
     original_rbf,
     squared_exponential_rbf,
@@ -313,12 +513,37 @@ rbfs = [
 
 class RBF:
     def __init__(
-        self, n_rbfs, n_inputs, n_outputs, rbf_function=original_rbf
+        self, n_rbfs, n_inputs, n_outputs, rbf_function=original_rbf,
+        compiled=False,
     ):
+        """
+        Parameters
+        ----------
+        n_rbfs : int
+        n_inputs : int
+        n_outputs : int
+        rbf_function : callable, optional
+                       one of the functions in rbfs
+        compiled : bool, optional
+                   if true, apply_rbfs uses the compiled counterpart of
+                   rbf_function from compiled_rbf_functions
+        """
         self.n_rbfs = n_rbfs
         self.n_inputs = n_inputs
         self.n_outputs = n_outputs
         self.rbf = rbf_function
+        self.compiled = compiled
+
+        if compiled:
+            self.compiled_rbf = compiled_rbf_functions.get_compiled_rbf(
+                rbf_function
+            )
+            if self.compiled_rbf is None:
+                raise ValueError(
+                    f"no compiled version of {rbf_function.__name__}"
+                )
+        else:
+            self.compiled_rbf = None
 
         types = []
         c_i = []
@@ -342,25 +567,237 @@ class RBF:
         self.r_i = np.asarray(r_i, dtype=np.int16)
         self.w_i = np.asarray(w_i, dtype=np.int16)
 
+        # centers, radii and weights are gathered with a single fancy index,
+        # after which each is a view on a slice of the gathered block
+        self.unpack_index = np.concatenate((self.c_i, self.r_i, self.w_i))
+        self.unpack_split = (self.c_i.size, self.c_i.size + self.r_i.size)
+
         self.centers = None
         self.radii = None
         self.weights = None
 
-    def set_decision_vars(self, decision_vars):
-        decision_vars = decision_vars.copy()
-
-        self.centers = decision_vars[self.c_i].reshape((self.n_rbfs, self.n_inputs))
-        self.radii = decision_vars[self.r_i].reshape((self.n_rbfs, self.n_inputs))
-        self.weights = decision_vars[self.w_i].reshape((self.n_rbfs, self.n_outputs))
+        # per-basis time factors, see compile_policy
+        self.time_factors = None
+        self.time_index = None
+        self.other_index = None
+        self.other_centers = None
+        self.other_scale = None
+
+    def key(self):
+        """Hashable description of the rbf, without decision variables"""
+        return (
+            self.n_rbfs,
+            self.n_inputs,
+            self.n_outputs,
+            self.rbf.__module__,
+            self.rbf.__name__,
+            self.compiled,
+        )
+
+    def __getstate__(self):
+        # the decision variables and everything derived from them are set
+        # again for every evaluation, so they are not pickled
+        state = self.__dict__.copy()
+        for name in ("centers", "radii", "weights", "time_factors",
+                     "time_index", "other_index", "other_centers",
+                     "other_scale", "compiled_rbf"):
+            state[name] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.compiled:
+            self.compiled_rbf = compiled_rbf_functions.get_compiled_rbf(
+                self.rbf
+            )
 
-        # sum of weights per input is 1
-        self.weights /= self.weights.sum(axis=0)[np.newaxis, :]
+    def set_decision_vars(self, decision_vars):
+        self.centers, self.radii, self.weights = self.unpack(
+            np.asarray(decision_vars)
+        )
+
+        # time factors of a previous policy are no longer valid
+        self.time_factors = None
+
+    def is_separable(self):
+        return self.rbf in separable_rbfs
+
+    def compile_policy(self, time_inputs, time_index=0):
+        """
+        Precompute the factor of each basis function that only depends on
+        the time input, for all values the time input can take. Only
+        possible for the rbf functions in separable_rbfs, call after
+        set_decision_vars.
+
+        Only the python engine of SusquehannaModel uses the precomputed
+        factors, where they save numpy calls per decision. The compiled
+        kernel in simulation_kernel evaluates the whole exponent instead:
+        every decision step recurs only n_years times per simulation, so a
+        table of time factors would cost about as many exponentials as it
+        saves.
+
+        Parameters
+        ----------
+        time_inputs : numpy array
+                      1-D, normalized time input for each decision step
+        time_index : int, optional
+                     position of the time input in the input vector
+        """
+        inverse_scale = separable_rbfs[self.rbf](self.radii)
+        self.time_index = time_index
+
+        # centers and scales of the remaining inputs
+        other = np.flatnonzero(np.arange(self.n_inputs) != time_index)
+        self.other_index = other
+        self.other_centers = self.centers[:, other]
+        self.other_scale = inverse_scale[:, other]
+
+        distance = time_inputs[:, np.newaxis] - self.centers[:, time_index]
+        self.time_factors = np.exp(
+            -(distance ** 2) * inverse_scale[:, time_index]
+        )
+
+    def apply_rbfs_compiled(self, step, inputs):
+        """
+        Same as apply_rbfs for a policy compiled with compile_policy. The time
+        input is taken from the precomputed factors of decision step step,
+        only the other inputs are evaluated.
+
+        Parameters
+        ----------
+        step : int
+               index into the time_inputs given to compile_policy
+        inputs : numpy array
+                 1-D, shape is (n_inputs,), the time input is ignored
+        """
+        a = inputs[self.other_index] - self.other_centers
+        rbf_scores = self.time_factors[step] * np.exp(
+            -(a * a * self.other_scale).sum(axis=1)
+        )
+        return rbf_scores @ self.weights
 
     def apply_rbfs(self, inputs):
+        if self.compiled_rbf is not None:
+            return self.compiled_rbf(
+                inputs, self.centers, self.radii, self.weights
+            )
         outputs = self.rbf(inputs, self.centers, self.radii, self.weights)
 
         return outputs
 
+    def apply_rbfs_rows(self, inputs):
+        """
+        Apply the rbf to each row of a matrix of inputs
+
+        Parameters
+        ----------
+        inputs : numpy array
+                 2-D, shape is (n_samples X n_inputs)
+        Returns
+        -------
+        numpy array
+        2-D, shape is (n_samples X n_outputs)
+        """
+        rbf_id = compiled_rbf_functions.get_rbf_id(self.rbf)
+        if rbf_id is None:
+            return np.asarray([self.apply_rbfs(x) for x in inputs])
+        return compiled_rbf_functions.apply_rbf_rows(
+            rbf_id, np.ascontiguousarray(inputs, dtype=float), self.centers,
+            self.radii, self.weights,
+        )
+
+    def unpack(self, decision_vars):
+        """
+        Centers, radii and normalized weights of one decision vector, or of
+        a whole population of decision vectors at once
+
+        The decision variables are gathered with one fancy index, which
+        copies them once, the centers, radii and weights are views on that
+        copy.
+
+        Parameters
+        ----------
+        decision_vars : numpy array
+                        shape is (... X n_decision_vars)
+        Returns
+        -------
+        tuple of numpy arrays
+        centers and radii (... X n_rbfs X n_inputs), and weights
+        (... X n_rbfs X n_outputs)
+        """
+        leading = decision_vars.shape[:-1]
+        block = decision_vars[..., self.unpack_index]
+        centers, radii, weights = np.split(block, self.unpack_split, axis=-1)
+
+        centers = centers.reshape(leading + (self.n_rbfs, self.n_inputs))
+        radii = radii.reshape(leading + (self.n_rbfs, self.n_inputs))
+        weights = weights.reshape(leading + (self.n_rbfs, self.n_outputs))
+
+        # sum of weights per input is 1
+        weights /= weights.sum(axis=-2)[..., np.newaxis, :]
+        return centers, radii, weights
+
+    def unpack_decision_vars_batch(self, decision_vars):
+        """
+        Population version of set_decision_vars
+
+        Parameters
+        ----------
+        decision_vars : numpy array
+                        2-D, shape is (n_policies X n_decision_vars)
+        Returns
+        -------
+        tuple of numpy arrays
+        centers and radii (n_policies X n_rbfs X n_inputs), and weights
+        (n_policies X n_rbfs X n_outputs)
+        """
+        return self.unpack(np.asarray(decision_vars))
+
+    def apply_rbfs_batch(self, inputs, centers, radii, weights):
+        """
+        Apply the rbf to many inputs and many policies at once
+
+        Parameters
+        ----------
+        inputs : numpy array
+                 (n_policies X n_inputs) for one input per policy, or
+                 (n_samples X n_policies X n_inputs) for many inputs per
+                 policy
+        centers, radii, weights : numpy arrays
+                                  parameters of all policies, see
+                                  unpack_decision_vars_batch
+        Returns
+        -------
+        numpy array
+        shape is inputs.shape[:-1] + (n_outputs,)
+
+        Raises a ValueError if the rbf function has no batched version.
+        """
+        try:
+            rbf_batch = batched_rbfs[self.rbf]
+        except KeyError:
+            raise ValueError(f"no batched version of {self.rbf.__name__}")
+        return rbf_batch(inputs, centers, radii, weights)
+
+    def apply_rbfs_many(self, inputs):
+        """
+        Apply the policy set with set_decision_vars to many inputs at once
+
+        Parameters
+        ----------
+        inputs : numpy array
+                 2-D, shape is (n_samples X n_inputs)
+        Returns
+        -------
+        numpy array
+        2-D, shape is (n_samples X n_outputs)
+        """
+        try:
+            rbf_batch = batched_rbfs[self.rbf]
+        except KeyError:
+            return self.apply_rbfs_rows(inputs)
+        return rbf_batch(inputs, self.centers, self.radii, self.weights)
+
 # def multiquadric_rbf(rbf_input, centers, radii, weights):
 #     """
 
@@ -0,0 +1,136 @@
+"""
+Read-only model data shared between processes.
+
+Every worker of a ProcessPoolEvaluator otherwise holds its own copy of the
+hydrology, the energy prices and the reservoir tables. A SharedArrayStore
+publishes a set of arrays once in shared memory from the parent process;
+workers attach to it through a small picklable handle and get read-only
+views on the same memory.
+"""
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+# stores attached in this process, by handle, so that every problem
+# unpickled in a worker maps the shared memory only once
+_attached = {}
+
+
+def open_segment(name):
+    """
+    Open an existing shared memory segment without taking ownership, the
+    parent that published it remains responsible for unlinking it
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+
+    # before Python 3.13 every attach registers the segment with the
+    # resource tracker, which would unlink it when the worker exits
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+class SharedArrayStore:
+    """
+    Named numpy arrays in shared memory
+
+    Use SharedArrayStore.publish in the parent and SharedArrayStore.attach
+    with the handle of the published store in the workers.
+
+    Attributes
+    ----------
+    arrays : dict
+             name -> numpy array, read-only in attached stores
+    handle : tuple
+             (name, segment name, shape, dtype) per array, picklable
+    """
+
+    def __init__(self, segments, handle, owner):
+        self.segments = segments
+        self.handle = handle
+        self.owner = owner
+        self.arrays = {}
+        for (name, _, shape, dtype), segment in zip(handle, segments):
+            array = np.ndarray(shape, dtype=dtype, buffer=segment.buf)
+            if not owner:
+                array.flags.writeable = False
+            self.arrays[name] = array
+
+    @classmethod
+    def publish(cls, arrays):
+        """
+        Copy arrays into new shared memory segments
+
+        Parameters
+        ----------
+        arrays : dict
+                 name -> array_like
+        Returns
+        -------
+        SharedArrayStore
+        """
+        segments = []
+        handle = []
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            segment = shared_memory.SharedMemory(
+                create=True, size=max(array.nbytes, 1)
+            )
+            np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)[...] = array
+            segments.append(segment)
+            handle.append((name, segment.name, array.shape, array.dtype.str))
+        return cls(segments, tuple(handle), owner=True)
+
+    @classmethod
+    def attach(cls, handle):
+        """
+        Attach to a published store, at most once per process
+
+        Parameters
+        ----------
+        handle : tuple
+                 SharedArrayStore.handle of the published store
+        Returns
+        -------
+        SharedArrayStore
+        """
+        try:
+            return _attached[handle]
+        except KeyError:
+            segments = [open_segment(segment) for _, segment, _, _ in handle]
+            store = cls(segments, handle, owner=False)
+            _attached[handle] = store
+            return store
+
+    def nbytes(self):
+        return sum(array.nbytes for array in self.arrays.values())
+
+    def close(self):
+        """Release the views and the mapping of this process"""
+        self.arrays = {}
+        for segment in self.segments:
+            try:
+                segment.close()
+            except BufferError:
+                # views are still in use, the mapping is released with them
+                pass
+        _attached.pop(self.handle, None)
+
+    def unlink(self):
+        """Free the shared memory, only by the owner after all use"""
+        if self.owner:
+            for segment in self.segments:
+                segment.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        self.unlink()
@@ -0,0 +1,604 @@
+"""
+Compiled simulation engine for the Susquehanna model.
+
+The functions in this module mirror SusquehannaModel.simulate step by step,
+but run the complete daily / 4-hourly loop, the RBF policy, the Conowingo
+hydropower computation and the reliability and equity metrics inside a single
+numba call. SusquehannaModel.simulate remains the reference implementation;
+the kernel is selected through the ``engine`` argument of the model.
+
+The level / storage / surface / tailwater conversions interpolate the
+original tables, or look the values up in the packed lookup tables of the
+model if it uses them, see lookup_tables.pack_lookup_tables.
+"""
+import numpy as np
+from numba import prange
+
+from kernels import f8, kernel, vector
+from lookup_tables import (
+    CONOWINGO,
+    LEVEL_TO_STORAGE,
+    LEVEL_TO_SURFACE,
+    MUDDY_RUN,
+    STORAGE_TO_LEVEL,
+    TAILWATER,
+    lookup,
+)
+from utils import interpolate_linear
+from compiled_rbf_functions import apply_rbf, get_rbf_id  # noqa: F401
+
+# unit conversions, identical to the ones in utils
+ACRE_FEET_TO_CUBIC_FEET = 43560.0
+INCHES_TO_FEET = 0.08333
+CUBIC_FEET_TO_CUBIC_METERS = 0.0283
+FEET_TO_METERS = 0.3048
+
+GG = 9.81
+GAMMA_H2O = 1000.0
+
+N_OBJECTIVES = 13
+
+
+@kernel()
+def unpack_decision_vars(var, c_i, r_i, w_i, n_rbfs, n_inputs, n_outputs):
+    """
+    Compiled counterpart of RBF.set_decision_vars, returns the centers,
+    radii and normalized weights of a single decision vector.
+    """
+    centers = var[c_i].reshape((n_rbfs, n_inputs))
+    radii = var[r_i].reshape((n_rbfs, n_inputs))
+    weights = var[w_i].reshape((n_rbfs, n_outputs))
+
+    # sum of weights per input is 1
+    for k in range(n_outputs):
+        total = 0.0
+        for i in range(n_rbfs):
+            total += weights[i, k]
+        for i in range(n_rbfs):
+            weights[i, k] = weights[i, k] / total
+    return centers, radii, weights
+
+
+@kernel()
+def storage_to_level(s, lsv, tables, lake):
+    """
+    lake indexes the rows of tables, which are only used if there are any
+    """
+    if tables.shape[0] > 0:
+        return lookup(tables[STORAGE_TO_LEVEL + lake], s)
+    return interpolate_linear(lsv[2], lsv[0], s / ACRE_FEET_TO_CUBIC_FEET)
+
+
+@kernel()
+def level_to_storage(h, lsv, tables, lake):
+    if tables.shape[0] > 0:
+        return lookup(tables[LEVEL_TO_STORAGE + lake], h)
+    return interpolate_linear(lsv[0], lsv[2], h) * ACRE_FEET_TO_CUBIC_FEET
+
+
+@kernel()
+def level_to_surface(h, lsv, tables, lake):
+    if tables.shape[0] > 0:
+        return lookup(tables[LEVEL_TO_SURFACE + lake], h)
+    return interpolate_linear(lsv[0], lsv[1], h) * ACRE_FEET_TO_CUBIC_FEET
+
+
+@kernel()
+def muddyrun_pumpturb(day, hour, level_co, level_mr, lsv_rel_muddy, tables):
+    """
+    Compiled counterpart of SusquehannaModel.muddyrun_pumpturb
+    """
+    QP = 24800.0  # cfs
+    QT = 32000.0  # cfs
+
+    # active storage = sMR - deadStorage
+    qM = (
+        level_to_storage(level_mr, lsv_rel_muddy, tables, MUDDY_RUN)
+        - level_to_storage(470.0, lsv_rel_muddy, tables, MUDDY_RUN)
+    ) / 3600
+    qp = 0.0
+    qt = 0.0
+    if day == 0:  # sunday
+        if hour < 5 or hour >= 22:
+            qp = QP
+    elif 1 <= day <= 4:  # monday to thursday
+        if hour <= 6 or hour >= 21:
+            qp = QP
+        if (7 <= hour <= 11) or (17 <= hour <= 20):
+            qt = min(QT, qM)
+    elif day == 5:  # friday
+        if (7 <= hour <= 11) or (17 <= hour <= 20):
+            qt = min(QT, qM)
+    elif day == 6:  # saturday
+        if hour <= 6 or hour >= 22:
+            qp = QP
+
+    if level_co < 104.7:  # if True cavitation problems in pumping
+        qp = 0.0
+
+    if level_mr < 470.0:
+        qt = 0.0
+    return qp, qt
+
+
+@kernel()
+def actual_release(uu, level_co, day_of_year, w_atomic, w_baltimore,
+                   w_chester, spillways, min_levels, rr):
+    """
+    Compiled counterpart of SusquehannaModel.actual_release, writes the
+    release vector into rr.
+
+    min_levels holds the minimum levels of Atomic power plant, Baltimore and
+    Chester, in that order.
+    """
+    Tcap = 85412.0  # total turbine capacity (cfs)
+
+    qm_A = 0.0
+    qm_B = 0.0
+    qm_C = 0.0
+    qm_D = 0.0
+
+    # reservoir release constraints
+    if level_co <= min_levels[0]:
+        qM_A = 0.0
+    else:
+        qM_A = w_atomic[day_of_year]
+    if level_co <= min_levels[1]:
+        qM_B = 0.0
+    else:
+        qM_B = w_baltimore[day_of_year]
+    if level_co <= min_levels[2]:
+        qM_C = 0.0
+    else:
+        qM_C = w_chester[day_of_year]
+
+    qM_D = Tcap
+    if level_co > 110.2:  # spillways activated
+        qM_D = interpolate_linear(spillways[0], spillways[1], level_co) + Tcap
+        qm_D = qM_D
+
+    # same ordering as the reference, only the first branch can trigger
+    if level_co < 105.5:
+        qM_D = 0.0
+
+    rr[0] = min(qM_A, max(qm_A, uu[0]))
+    rr[1] = min(qM_B, max(qm_B, uu[1]))
+    rr[2] = min(qM_C, max(qm_C, uu[2]))
+    rr[3] = min(qM_D, max(qm_D, uu[3]))
+
+
+@kernel()
+def hydropower_co(release, level, price, tailwater, turbines, tables):
+    """
+    Hourly hydropower production (kWh) and revenue ($) of Conowingo, see
+    SusquehannaModel.g_hydRevCo
+    """
+    if tables.shape[0] > 0:
+        tailwater_level = lookup(tables[TAILWATER], release)
+    else:
+        tailwater_level = interpolate_linear(tailwater[0], tailwater[1], release)
+    deltaH = level - tailwater_level
+    q_split = release
+    production = 0.0
+    for j in range(turbines.shape[1]):
+        if q_split < turbines[1, j]:
+            qturb = 0.0
+        elif q_split > turbines[0, j]:
+            qturb = turbines[0, j]
+        else:
+            qturb = q_split
+        q_split = q_split - qturb
+        production += (
+            0.79
+            * GG
+            * GAMMA_H2O
+            * (CUBIC_FEET_TO_CUBIC_METERS * qturb)
+            * (FEET_TO_METERS * deltaH)
+            * 3600
+            / (3600 * 1000)
+        )
+    return production, production / 1000 * price
+
+
+@kernel((f8, vector))
+def vol_rel_daily(q1, q_target):
+    """Compiled counterpart of SusquehannaModel.g_vol_rel_daily"""
+    total = 0.0
+    for i in range(q_target.size):
+        total += q1 / q_target[i]
+    return total / q_target.size
+
+
+@kernel((f8, vector))
+def shortage_index_daily(q1, q_target):
+    """Compiled counterpart of SusquehannaModel.g_shortage_index_daily"""
+    total = 0.0
+    for i in range(q_target.size):
+        shortage = max(q_target[i] - q1, 0.0) / q_target[i]
+        total += shortage ** 2
+    return total / q_target.size
+
+
+@kernel((vector,))
+def pairwise_distance_sum(x):
+    """Sum of the pairwise absolute differences, see euclidean_distance_scipy"""
+    total = 0.0
+    for i in range(x.size):
+        for j in range(i + 1, x.size):
+            total += abs(x[i] - x[j])
+    return total
+
+
+@kernel((vector,))
+def gini_coefficient(x):
+    """Compiled counterpart of SusquehannaModel.gini_coefficient_scipy"""
+    return pairwise_distance_sum(x) / (2 * x.size ** 2 * np.mean(x))
+
+
+@kernel(())
+def hydro_reliability_target():
+    """Daily hydropower target (kWh/day), see j_hydro_reliability_energy"""
+    power_MR = 1070  # MW
+    power_Co = 572  # MW
+    devaluation_reliability = 0.39
+    q_target_yearly = devaluation_reliability * (
+        1.6 * pow(10, 9) * (power_Co / (power_MR + power_Co))
+    )  # kWh / year
+    return (q_target_yearly * 24) / 8760  # kWh/day
+
+
+@kernel()
+def simulate(
+    var,
+    c_i,
+    r_i,
+    w_i,
+    n_rbfs,
+    n_inputs,
+    n_outputs,
+    rbf_id,
+    input_max,
+    output_max,
+    init_level,
+    init_level_mr,
+    day0,
+    n_years,
+    inflow,
+    inflow_lat,
+    inflow_mr,
+    evap_co,
+    evap_mr,
+    lsv_rel,
+    lsv_rel_muddy,
+    tailwater,
+    tables,
+    turbines,
+    spillways,
+    energy_prices,
+    min_flow,
+    h_ref_rec,
+    w_atomic,
+    w_baltimore,
+    w_chester,
+    min_levels,
+    compute,
+    record,
+):
+    """
+    Simulate a single policy over n_years, see SusquehannaModel.simulate
+
+    tables holds the packed lookup tables of the model, with no rows if
+    it interpolates exactly, see SusquehannaModel.lookup_table_rows.
+    compute is the SusquehannaModel.objective_mask of the requested
+    objectives, the metrics no requested objective depends on are skipped.
+    The objectives are accumulated per day, so memory does not grow with
+    n_years; levels and releases are only returned if record is true.
+
+    Returns
+    -------
+    objectives : numpy array
+                 1-D, the 13 objectives in the order of
+                 SusquehannaModel.simulate
+    level_co, level_mr : numpy array
+                         1-D, daily levels (n_days + 1,), only the initial
+                         level if not record
+    releases : numpy array
+               2-D, daily releases to Atomic power plant, Baltimore,
+               Chester and downstream (4 X n_days), (4 X 0) if not record
+    reliability_gini, reliability_eucli : numpy array
+                                          1-D, monthly equity values (12,)
+    """
+    n_days_in_year = 365
+    decisions_per_day = 6
+    hours_between_decisions = 4
+    decision_steps_per_year = n_days_in_year * decisions_per_day
+    time_horizon_H = n_days_in_year * n_years
+    sim_step = 3600.0  # s/hour
+    leak = 800.0  # cfs
+
+    centers, radii, weights = unpack_decision_vars(
+        var, c_i, r_i, w_i, n_rbfs, n_inputs, n_outputs
+    )
+
+    # levels and releases are only kept when recorded, the objectives are
+    # accumulated day by day in fixed-size state
+    n_recorded = time_horizon_H if record else 0
+    level_co = np.empty(n_recorded + 1)
+    level_mr = np.empty(n_recorded + 1)
+    releases = np.empty((4, n_recorded))
+
+    monthly = compute[9] or compute[10]
+    q_target_daily = hydro_reliability_target()
+    revenue_co = 0.0
+    hydro_reliability_sum = 0.0
+    volumetric_sum = np.zeros(3)
+    shortage_sum = 0.0
+    below_target = 0
+    # daily reliabilities of atomic power plant, Baltimore, Chester,
+    # environment and hydropower summed per month, day t counts in month
+    # t % 12 as in SusquehannaModel.monthly_average
+    monthly_sum = np.zeros((5, 12))
+    monthly_count = np.zeros(12)
+
+    rbf_input = np.empty(2)
+    rr = np.empty(4)
+    daily_release = np.empty(4)
+    step_release = np.empty(4)
+
+    # initial condition
+    s_co = level_to_storage(init_level, lsv_rel, tables, CONOWINGO)
+    s_mr = level_to_storage(init_level_mr, lsv_rel_muddy, tables, MUDDY_RUN)
+    h_co = init_level
+    level_co[0] = init_level
+    level_mr[0] = init_level_mr
+    if s_co < h_ref_rec[0]:
+        below_target += 1
+
+    for t in range(time_horizon_H):
+        day_of_week = (day0 + t) % 7
+        day_of_year = t % n_days_in_year
+        year = t // n_days_in_year
+
+        n_sim = inflow[year, day_of_year]
+        n_lat = inflow_lat[year, day_of_year]
+        ev = evap_co[year, day_of_year]
+        n_sim_mr = inflow_mr[year, day_of_year]
+        ev_mr = evap_mr[year, day_of_year]
+
+        daily_release[:] = 0.0
+        daily_hydropower_co = 0.0
+
+        for j in range(decisions_per_day):
+            # decision step i in a year
+            jj = (t * decisions_per_day + j) % decision_steps_per_year
+
+            # compute decision
+            rbf_input[0] = jj / input_max[0]
+            rbf_input[1] = h_co / input_max[1]
+            uu = apply_rbf(rbf_id, rbf_input, centers, radii, weights) * output_max
+
+            # system transition over the 4-hour horizon
+            step_release[:] = 0.0
+            for i in range(hours_between_decisions):
+                c_hour = hours_between_decisions * j + i
+                h_co = storage_to_level(s_co, lsv_rel, tables, CONOWINGO)
+                h_mr = storage_to_level(s_mr, lsv_rel_muddy, tables, MUDDY_RUN)
+
+                # Muddy Run operation
+                q_pump, q_rel = muddyrun_pumpturb(
+                    day_of_week, c_hour, h_co, h_mr, lsv_rel_muddy, tables
+                )
+
+                # Compute actual release
+                actual_release(uu, h_co, day_of_year, w_atomic, w_baltimore,
+                               w_chester, spillways, min_levels, rr)
+                for k in range(4):
+                    step_release[k] += rr[k]
+                WS = rr[0] + rr[1] + rr[2]
+
+                # Compute surface level and evaporation losses
+                evaporation_losses_co = (
+                    ev * INCHES_TO_FEET
+                    * level_to_surface(h_co, lsv_rel, tables, CONOWINGO) / 86400
+                )
+                evaporation_losses_mr = (
+                    ev_mr * INCHES_TO_FEET
+                    * level_to_surface(h_mr, lsv_rel_muddy, tables, MUDDY_RUN)
+                    / 86400
+                )
+
+                # hourly hydropower production / revenue
+                production, revenue = hydropower_co(
+                    rr[3], h_co, energy_prices[c_hour, day_of_year], tailwater,
+                    turbines, tables,
+                )
+                daily_hydropower_co += production
+                revenue_co += revenue
+
+                # System Transition
+                s_mr = s_mr + sim_step * (
+                    q_pump - q_rel + n_sim_mr - evaporation_losses_mr
+                )
+                s_co = s_co + sim_step * (
+                    n_sim + n_lat - rr[3] - WS - evaporation_losses_co
+                    - q_pump + q_rel - leak
+                )
+
+            for k in range(4):
+                daily_release[k] += step_release[k] / hours_between_decisions
+            h_co = storage_to_level(s_co, lsv_rel, tables, CONOWINGO)
+
+        for k in range(4):
+            daily_release[k] = daily_release[k] / decisions_per_day
+        if record:
+            level_co[t + 1] = h_co
+            level_mr[t + 1] = storage_to_level(
+                s_mr, lsv_rel_muddy, tables, MUDDY_RUN
+            )
+            for k in range(4):
+                releases[k, t] = daily_release[k]
+
+        # volumetric reliability and shortage index against the target of
+        # the day, storage reliability against the recreation target
+        volumetric_sum[0] += daily_release[0] / w_atomic[day_of_year]
+        volumetric_sum[1] += daily_release[1] / w_baltimore[day_of_year]
+        volumetric_sum[2] += daily_release[2] / w_chester[day_of_year]
+        shortage = (
+            max(min_flow[day_of_year] - daily_release[3], 0.0)
+            / min_flow[day_of_year]
+        )
+        shortage_sum += shortage ** 2
+        if s_co < h_ref_rec[(t + 1) % n_days_in_year]:
+            below_target += 1
+
+        # hydropower reliability, production per decision step
+        hydro_reliability = daily_hydropower_co / decisions_per_day / q_target_daily
+        hydro_reliability_sum += hydro_reliability
+
+        # daily reliability values, only needed for monthly equity
+        if monthly:
+            month = t % 12
+            monthly_sum[0, month] += vol_rel_daily(daily_release[0], w_atomic)
+            monthly_sum[1, month] += vol_rel_daily(daily_release[1], w_baltimore)
+            monthly_sum[2, month] += vol_rel_daily(daily_release[2], w_chester)
+            monthly_sum[3, month] += shortage_index_daily(
+                daily_release[3], min_flow
+            )
+            monthly_sum[4, month] += hydro_reliability
+            monthly_count[month] += 1
+
+    # yearly objectives
+    j_hyd = revenue_co / n_years / pow(10, 6)  # GWh/year (M$/year)
+    j_atom = volumetric_sum[0] / time_horizon_H
+    j_balt = volumetric_sum[1] / time_horizon_H
+    j_ches = volumetric_sum[2] / time_horizon_H
+    j_env = shortage_sum / time_horizon_H
+
+    # storage reliability, the number of days below the recreation target
+    # relative to the number of days with a target
+    j_rec = 1 - below_target / (n_years * np.sum(h_ref_rec > 0))
+
+    # hydropower reliability
+    j_hydro_reliability_yearly_average = hydro_reliability_sum / time_horizon_H
+
+    # monthly equity values
+    reliability_gini = np.full(12, np.nan)
+    reliability_eucli = np.full(12, np.nan)
+    gini_std = np.nan
+    eucli_std = np.nan
+    if monthly:
+        reliability_monthly = np.empty(6)
+        for i in range(12):
+            reliability_monthly[0] = monthly_sum[0, i] / monthly_count[i]
+            reliability_monthly[1] = monthly_sum[1, i] / monthly_count[i]
+            reliability_monthly[2] = monthly_sum[2, i] / monthly_count[i]
+            reliability_monthly[3] = monthly_sum[3, i] / monthly_count[i]
+            reliability_monthly[4] = j_rec
+            reliability_monthly[5] = monthly_sum[4, i] / monthly_count[i]
+            if compute[10]:
+                reliability_eucli[i] = pairwise_distance_sum(reliability_monthly)
+            if compute[9]:
+                reliability_gini[i] = gini_coefficient(reliability_monthly)
+        if compute[10]:
+            eucli_std = np.std(reliability_eucli)
+        if compute[9]:
+            gini_std = np.std(reliability_gini)
+
+    reliability_yearly = np.array(
+        [j_atom, j_balt, j_ches, j_env, j_rec,
+         j_hydro_reliability_yearly_average]
+    )
+    gini_mean = np.nan
+    eucli_mean = np.nan
+    if compute[7]:
+        gini_mean = gini_coefficient(reliability_yearly)
+    if compute[8]:
+        eucli_mean = pairwise_distance_sum(reliability_yearly)
+
+    objectives = np.array(
+        [
+            j_hyd,
+            j_atom,
+            j_balt,
+            j_ches,
+            j_env,
+            j_rec,
+            j_hydro_reliability_yearly_average,
+            gini_mean,
+            eucli_mean,
+            gini_std,
+            eucli_std,
+            gini_std / gini_mean,
+            eucli_std / eucli_mean,
+        ]
+    )
+    # the cheap yearly objectives are always computed, they are nan when
+    # not in compute as in SusquehannaModel.simulate
+    for i in range(objectives.size):
+        if not compute[i]:
+            objectives[i] = np.nan
+    return (objectives, level_co, level_mr, releases, reliability_gini,
+            reliability_eucli)
+
+
+@kernel(parallel=True)
+def simulate_ensemble(
+    var,
+    c_i,
+    r_i,
+    w_i,
+    n_rbfs,
+    n_inputs,
+    n_outputs,
+    rbf_id,
+    input_max,
+    output_max,
+    init_level,
+    init_level_mr,
+    day0,
+    n_years,
+    inflow,
+    inflow_lat,
+    inflow_mr,
+    evap_co,
+    evap_mr,
+    lsv_rel,
+    lsv_rel_muddy,
+    tailwater,
+    tables,
+    turbines,
+    spillways,
+    energy_prices,
+    min_flow,
+    h_ref_rec,
+    w_atomic,
+    w_baltimore,
+    w_chester,
+    min_levels,
+    compute,
+):
+    """
+    Simulate a single policy over every trace of a hydrological ensemble,
+    the traces run in parallel on numba's thread pool
+
+    The arguments are those of simulate, except that the five hydrology
+    arrays carry a leading trace axis (n_traces X n_years X 365) and
+    nothing is recorded.
+
+    Returns
+    -------
+    numpy array
+    2-D, the 13 objectives of every trace (n_traces X 13)
+    """
+    n_traces = inflow.shape[0]
+    objectives = np.empty((n_traces, N_OBJECTIVES))
+    for k in prange(n_traces):
+        objectives[k] = simulate(
+            var, c_i, r_i, w_i, n_rbfs, n_inputs, n_outputs, rbf_id,
+            input_max, output_max, init_level, init_level_mr, day0, n_years,
+            inflow[k], inflow_lat[k], inflow_mr[k], evap_co[k], evap_mr[k],
+            lsv_rel, lsv_rel_muddy, tailwater, tables, turbines, spillways,
+            energy_prices, min_flow, h_ref_rec, w_atomic, w_baltimore,
+            w_chester, min_levels, compute, False,
+        )[0]
+    return objectives
@@ -0,0 +1,261 @@
+"""
+Surrogate-assisted pre-screening of offspring.
+
+Most offspring of an EpsNSGAII run never enter the epsilon archive, yet each
+of them costs a full simulation. A SurrogateEvaluator fits a Gaussian
+process to the objectives of the solutions simulated so far and predicts
+the objectives of new offspring with their uncertainty. Only offspring
+whose optimistic prediction, kappa standard deviations towards the better
+side of every objective, could enter the archive are simulated; the others
+keep the predicted objectives. As for racing, whether an offspring could
+enter the archive is decided on epsilon boxes, see racing.Race, so a
+screened offspring never enters the archive and the result of a run only
+holds simulated solutions.
+
+The Gaussian process does not work on the decision variables of the RBF
+policies, which describe the same policy in many ways, but on the releases
+of the policy on a coarse grid, see SusquehannaModel.policy_features;
+problems without a Susquehanna model fall back to the decision variables
+scaled to [0, 1]. Its Matern 5/2 kernel has a length scale and noise per
+objective, chosen by marginal likelihood on a small grid every time it is
+fitted.
+"""
+import numpy as np
+from platypus import Direction, Evaluator
+from scipy.linalg import cho_factor, cho_solve
+
+from racing import Race
+
+
+class GaussianProcess:
+    """
+    Gaussian process regression of several outputs
+
+    Parameters
+    ----------
+    length_scales : list of float, optional
+                    candidate length scales, relative to the square root
+                    of the number of inputs
+    noises : list of float, optional
+             candidate noise variances, relative to the variance of each
+             standardised output
+    """
+
+    def __init__(self, length_scales=(0.05, 0.1, 0.2, 0.4, 0.8, 1.6, 3.2, 6.4),
+                 noises=(1e-6, 1e-3, 1e-2, 1e-1)):
+        self.length_scales = length_scales
+        self.noises = noises
+        self.length_scale = None
+        self.noise = None
+
+    @staticmethod
+    def kernel(A, B, length_scale):
+        """Matern 5/2 covariance between the rows of A and B"""
+        distance = np.sqrt(
+            np.maximum(
+                np.sum(A ** 2, axis=1)[:, np.newaxis]
+                + np.sum(B ** 2, axis=1)[np.newaxis]
+                - 2 * A @ B.T,
+                0,
+            )
+        ) * (np.sqrt(5) / length_scale)
+        return (1 + distance + distance ** 2 / 3) * np.exp(-distance)
+
+    def fit(self, X, Y):
+        """
+        Choose the length scale and noise of every output by marginal
+        likelihood, all candidates share the factorisation of each
+        covariance matrix
+
+        Parameters
+        ----------
+        X : numpy array
+            inputs (n_samples X n_inputs)
+        Y : numpy array
+            outputs (n_samples X n_outputs)
+        """
+        self.X = np.asarray(X, dtype=float)
+        Y = np.asarray(Y, dtype=float)
+        self.y_mean = Y.mean(axis=0)
+        self.y_std = Y.std(axis=0)
+        self.y_std[self.y_std == 0] = 1
+        Z = (Y - self.y_mean) / self.y_std
+
+        n, n_outputs = Z.shape
+        scale = np.sqrt(self.X.shape[1])
+        best = np.full(n_outputs, -np.inf)
+        self.length_scale = np.empty(n_outputs)
+        self.noise = np.empty(n_outputs)
+        self.factors = [None] * n_outputs
+        self.alpha = np.empty((n, n_outputs))
+        for length_scale in self.length_scales:
+            K = self.kernel(self.X, self.X, length_scale * scale)
+            for noise in self.noises:
+                try:
+                    factor = cho_factor(K + noise * np.eye(n), lower=True)
+                except np.linalg.LinAlgError:
+                    continue
+                alpha = cho_solve(factor, Z)
+                # log marginal likelihood of every output, without the
+                # constant term
+                likelihood = -0.5 * np.sum(Z * alpha, axis=0) - np.sum(
+                    np.log(np.diag(factor[0]))
+                )
+                for j in np.flatnonzero(likelihood > best):
+                    best[j] = likelihood[j]
+                    self.length_scale[j] = length_scale * scale
+                    self.noise[j] = noise
+                    self.factors[j] = factor
+                    self.alpha[:, j] = alpha[:, j]
+        if np.any(best == -np.inf):
+            raise np.linalg.LinAlgError(
+                "no covariance matrix was positive definite"
+            )
+        return self
+
+    def predict(self, X):
+        """
+        Returns
+        -------
+        tuple of numpy arrays
+        mean and standard deviation of every output (n_points X n_outputs)
+        """
+        X = np.asarray(X, dtype=float)
+        mean = np.empty((X.shape[0], self.alpha.shape[1]))
+        variance = np.empty_like(mean)
+        kernels = {}
+        for j, length_scale in enumerate(self.length_scale):
+            if length_scale not in kernels:
+                kernels[length_scale] = self.kernel(X, self.X, length_scale)
+            K = kernels[length_scale]
+            mean[:, j] = K @ self.alpha[:, j]
+            variance[:, j] = 1 - np.sum(
+                K * cho_solve(self.factors[j], K.T).T, axis=1
+            )
+        std = np.sqrt(np.maximum(variance, 0))
+        return self.y_mean + mean * self.y_std, std * self.y_std
+
+
+class SurrogateEvaluator(Evaluator):
+    """
+    Evaluator that simulates only the offspring a Gaussian process
+    predicts could enter the archive of an optimisation run, and evaluates
+    all others with the prediction
+
+    Parameters
+    ----------
+    evaluator : platypus.Evaluator
+                evaluator of the simulated solutions
+    epsilons : list of float
+               epsilons of the archive
+    kappa : float, optional
+            number of standard deviations of the optimistic prediction, a
+            smaller kappa screens out more offspring and more often one
+            that would have entered the archive
+    min_samples : int, optional
+                  number of simulated solutions before screening starts
+    max_samples : int, optional
+                  number of most recently simulated solutions the Gaussian
+                  process is fitted to
+
+    Attributes
+    ----------
+    statistics : dict
+                 number of solutions simulated and of solutions screened
+                 out
+
+    Use as::
+
+        evaluator = SurrogateEvaluator(evaluator, epsilons)
+        algorithm = EpsNSGAII(problem, epsilons, evaluator=evaluator)
+        evaluator.screen_against(algorithm.archive)
+    """
+
+    def __init__(self, evaluator, epsilons, kappa=1.0, min_samples=200,
+                 max_samples=400):
+        super().__init__()
+        self.evaluator = evaluator
+        self.epsilons = epsilons
+        self.kappa = kappa
+        self.min_samples = min_samples
+        self.max_samples = max_samples
+        self.archive = None
+        self.X = []
+        self.Y = []
+        self.statistics = dict(simulated=0, screened=0)
+
+    def screen_against(self, archive):
+        self.archive = archive
+
+    def features(self, problem, variables):
+        """Inputs of the Gaussian process for solutions of problem"""
+        variables = np.asarray(variables, dtype=float)
+        model = getattr(problem, "susquehanna_river", None)
+        if model is not None:
+            return model.policy_features(variables)
+        lower = np.array([t.min_value for t in problem.types], dtype=float)
+        upper = np.array([t.max_value for t in problem.types], dtype=float)
+        return (variables - lower) / (upper - lower)
+
+    def promising(self, jobs):
+        """
+        Which jobs the surrogate cannot rule out, all of them until it has
+        min_samples simulated solutions to learn from
+        """
+        if (len(self.X) < self.min_samples or self.archive is None
+                or len(self.archive) == 0):
+            return np.ones(len(jobs), dtype=bool)
+        problem = jobs[0].solution.problem
+        if problem.nconstrs > 0:
+            return np.ones(len(jobs), dtype=bool)
+
+        process = GaussianProcess().fit(np.asarray(self.X), np.asarray(self.Y))
+        mean, std = process.predict(
+            self.features(problem, [job.solution.variables for job in jobs])
+        )
+        maximize = np.array(
+            [d == Direction.MAXIMIZE for d in problem.directions]
+        )
+        optimistic = mean + np.where(maximize, self.kappa, -self.kappa) * std
+        race = Race.from_archive(self.archive, problem, self.epsilons)
+
+        promising = np.ones(len(jobs), dtype=bool)
+        for i, job in enumerate(jobs):
+            if race.cannot_enter(optimistic[i]):
+                promising[i] = False
+                solution = job.solution
+                solution.objectives[:] = mean[i].tolist()
+                solution.constraint_violation = 0.0
+                solution.feasible = True
+                solution.evaluated = True
+        return promising
+
+    def evaluate_all(self, jobs, **kwargs):
+        jobs = list(jobs)
+        if not jobs:
+            return []
+        promising = self.promising(jobs)
+        simulated = self.evaluator.evaluate_all(
+            [job for job, keep in zip(jobs, promising) if keep], **kwargs
+        )
+        self.statistics["simulated"] += len(simulated)
+        self.statistics["screened"] += len(jobs) - len(simulated)
+
+        if simulated:
+            solutions = [job.solution for job in simulated]
+            self.X.extend(
+                self.features(
+                    solutions[0].problem, [s.variables for s in solutions]
+                )
+            )
+            self.Y.extend(list(s.objectives) for s in solutions)
+            del self.X[:-self.max_samples], self.Y[:-self.max_samples]
+
+        results = []
+        simulated = iter(simulated)
+        for job, keep in zip(jobs, promising):
+            results.append(next(simulated) if keep else job)
+        return results
+
+    def close(self):
+        self.evaluator.close()
@@ -1,8 +1,22 @@
+import copy
+import hashlib
 import os
 import numpy as np
 import utils
-from numba import njit
-from scipy.spatial.distance import pdist
+import data_cache
+import evaluation_cache
+import evaluation_store
+import simulation_kernel
+import rbf_functions
+import lookup_tables
+import metrics
+import quantiles
+import hydropower
+import tabulated_policy
+import shared_data
+from workspace import SimulationWorkspace
+from accumulators import ObjectiveAccumulator
+from kernels import kernel
 
 def create_path(rest):
     # FIXME my dir is now retrieved repeatedly
@@ -10,12 +24,169 @@ def create_path(rest):
     return os.path.abspath(os.path.join(my_dir, rest))
 
 
+# models rebuilt from pickles in this process, by configuration
+_resident_models = {}
+
+
+def resident_model(config, shared_data_handle=None, log_objectives=None,
+                   race=None, shared_cache=None):
+    """
+    Return the model of this process with configuration config, building it
+    on first use. Unpickling a SusquehannaModel calls this function.
+
+    Parameters
+    ----------
+    config : dict
+             SusquehannaModel.config
+    shared_data_handle : tuple, optional
+                         handle of the SharedArrayStore to attach to
+    log_objectives : bool, optional
+                     passed to set_log if not None
+    race : racing.Race, optional
+           race of the Monte Carlo evaluations, see evaluate_mc
+    shared_cache : proxy of an evaluation_cache.EvaluationCache, optional
+                   evaluation cache shared between processes, see
+                   share_evaluation_cache
+    Returns
+    -------
+    SusquehannaModel
+    """
+    key = tuple(
+        (name, value.key() if name == "rbf" else value)
+        for name, value in config.items()
+    ) + (shared_data_handle,)
+    try:
+        model = _resident_models[key]
+    except KeyError:
+        model = SusquehannaModel(**config, shared_data_handle=shared_data_handle)
+        _resident_models[key] = model
+    if log_objectives is not None:
+        model.set_log(log_objectives)
+    model.race = race
+    if shared_cache is not None:
+        model.use_evaluation_cache(shared_cache)
+    return model
+
+
+def evaluation_cache_statistics():
+    """
+    Hits, misses and evictions of the evaluation caches of the models
+    resident in this process
+
+    Returns
+    -------
+    list of dict
+    EvaluationCache.stats of every resident model with a cache
+    """
+    return [
+        model.evaluation_cache.stats()
+        for model in _resident_models.values()
+        if model.evaluation_cache is not None
+    ]
+
+
 class SusquehannaModel:
     gammaH20 = 1000.0
     GG = 9.81
     n_days_in_year = 365
 
-    def __init__(self, l0, l0_muddy_run, d0, n_years, rbf, historic_data=True):
+    # model data published by publish_shared_data
+    shared_attributes = (
+        "lsv_rel",
+        "turbines",
+        "tailwater",
+        "spillways",
+        "lsv_rel_Muddy",
+        "turbines_Muddy",
+        "energy_prices",
+        "min_flow",
+        "h_ref_rec",
+        "w_baltimore",
+        "w_chester",
+        "w_atomic",
+        "evap_CO_MC",
+        "inflow_MC",
+        "inflowLat_MC",
+        "evap_Muddy_MC",
+        "inflow_Muddy_MC",
+        "inflow_ensemble",
+        "inflowLat_ensemble",
+        "inflow_Muddy_ensemble",
+        "evap_CO_ensemble",
+        "evap_Muddy_ensemble",
+    )
+
+    # stochastic hydrology in dataMC, one synthetic year per row, by the
+    # keyword of set_ensemble
+    stochastic_files = {
+        "evap_CO_MC": "evapCO_MC.txt",
+        "inflow_MC": "MariettaFlows_MC.txt",
+        "inflowLat_MC": "nLat_MC.txt",
+        "evap_Muddy_MC": "evapMR_MC.txt",
+        "inflow_Muddy_MC": "nMR_MC.txt",
+    }
+
+    # attribute holding the ensemble of each keyword of set_ensemble, in the
+    # argument order of simulate; the historic hydrology keeps the
+    # attribute named after the keyword
+    ensemble_attributes = {
+        "inflow_MC": "inflow_ensemble",
+        "inflowLat_MC": "inflowLat_ensemble",
+        "inflow_Muddy_MC": "inflow_Muddy_ensemble",
+        "evap_CO_MC": "evap_CO_ensemble",
+        "evap_Muddy_MC": "evap_Muddy_ensemble",
+    }
+
+    # percentile of the objectives over the traces reported by evaluate_mc,
+    # the rank error of its approximate method and the number of traces
+    # simulated at once
+    mc_percentile = 99
+    mc_epsilon = 1e-3
+    ensemble_chunk_size = 64
+
+    # settings in config that do not change the evaluations, left out of
+    # model_digest
+    undigested_config = (
+        "evaluation_cache_size",
+        "cache_resolution",
+        "evaluation_store_path",
+    )
+
+    # names of the objectives returned by simulate, in order
+    objective_names = (
+        "hydropower",
+        "atomic_power_plant",
+        "baltimore",
+        "chester",
+        "environment",
+        "recreation",
+        "hydropower_reliability",
+        "gini_mean",
+        "euclidean_mean",
+        "gini_std",
+        "euclidean_std",
+        "gini_ratio",
+        "euclidean_ratio",
+    )
+
+    # objectives each objective is computed from, by index; the equity
+    # metrics compare the reliabilities of all six users
+    objective_dependencies = {
+        7: (1, 2, 3, 4, 5, 6),
+        8: (1, 2, 3, 4, 5, 6),
+        9: (1, 2, 3, 4, 5, 6),
+        10: (1, 2, 3, 4, 5, 6),
+        11: (7, 9),
+        12: (8, 10),
+    }
+
+    def __init__(self, l0, l0_muddy_run, d0, n_years, rbf, historic_data=True,
+                 engine="numba", use_lookup_tables=False,
+                 lookup_tolerance=1e-4, tabulate_policy=False,
+                 policy_table_size=16, shared_data_handle=None,
+                 n_traces=None, mc_quantiles="exact",
+                 evaluation_cache_size=0, cache_resolution=None,
+                 evaluation_store_path=None):
         """
         Parameters
         ----------
@@ -30,8 +201,75 @@ class SusquehannaModel:
         historic_data : bool, optional
                         if true use historic data, if false use stochastic
                         data
+        engine : {'numba', 'python'}, optional
+                 'numba' runs each simulation as a single call to the
+                 compiled kernel in simulation_kernel, 'python' uses the
+                 reference implementation in simulate. The kernel is only
+                 used if the rbf function has a compiled counterpart.
+        use_lookup_tables : bool, optional
+                            if true, the level / storage / surface /
+                            tailwater conversions of both engines use
+                            uniform-grid lookup tables instead of exact
+                            interpolation
+        lookup_tolerance : float, optional
+                           maximum error of the lookup tables, relative to
+                           the range of each curve
+        tabulate_policy : bool, optional
+                          if true, the python engine samples each policy on
+                          a (decision step X Conowingo level) grid once and
+                          interpolates in it, see tabulated_policy. Implies
+                          engine='python'. Only for re-evaluating a fixed
+                          set of policies, e.g. over the stochastic
+                          ensemble; tabulating takes longer than simulating,
+                          so it slows down an optimisation.
+        policy_table_size : int, optional
+                            number of tabulated policies kept per model
+        shared_data_handle : tuple, optional
+                             handle of a SharedArrayStore published by
+                             publish_shared_data, the model data is then
+                             taken from shared memory
+        n_traces : int, optional
+                   number of traces of the stochastic ensemble, each of
+                   n_years synthetic years; all complete traces in the
+                   stochastic data if None. Only used if historic_data is
+                   false.
+        mc_quantiles : {'exact', 'approximate'}, optional
+                       how evaluate_mc reduces the ensemble, see quantiles;
+                       the approximate method stores the bound of its error
+                       in mc_error_bound
+        evaluation_cache_size : int, optional
+                                number of evaluations evaluate memoises by
+                                decision vector, see evaluation_cache; no
+                                cache if 0
+        cache_resolution : float, optional
+                           decision vectors closer than this share a cached
+                           evaluation, only identical vectors if None
+        evaluation_store_path : str, optional
+                                path of an evaluation_store.EvaluationStore
+                                that keeps every evaluation on disk, see
+                                evaluate_stored
         """
 
+        # constructor arguments, all that a pickled model carries
+        self.config = dict(
+            l0=l0,
+            l0_muddy_run=l0_muddy_run,
+            d0=d0,
+            n_years=n_years,
+            rbf=rbf,
+            historic_data=historic_data,
+            engine=engine,
+            use_lookup_tables=use_lookup_tables,
+            lookup_tolerance=lookup_tolerance,
+            tabulate_policy=tabulate_policy,
+            policy_table_size=policy_table_size,
+            n_traces=n_traces,
+            mc_quantiles=mc_quantiles,
+            evaluation_cache_size=evaluation_cache_size,
+            cache_resolution=cache_resolution,
+            evaluation_store_path=evaluation_store_path,
+        )
+
         self.init_level = l0  # feet
         self.init_level_MR = l0_muddy_run
         self.day0 = d0
@@ -73,6 +311,13 @@ class SusquehannaModel:
         self.n_days_one_year = 365
         self.n_months_one_year = 12
 
+        # buffers reused by every simulation
+        self.workspace = SimulationWorkspace(
+            self.time_horizon_H,
+            self.decisions_per_day,
+            self.hours_between_decisions,
+        )
+
         # Constraints for the reservoir
         self.min_level_chester = 99.8  # ft of water
         self.min_level_app = 98.5  # ft of water
@@ -81,57 +326,102 @@ class SusquehannaModel:
 
         # n_days_one_year = 1*365 moved to init
         # Conowingo characteristics
-        self.lsv_rel = utils.loadMatrix(
+        self.lsv_rel = data_cache.loadMatrix(
             create_path("./data1999/lsv_rel_Conowingo.txt"), 3, 10
         )  # level (ft) - Surface (acre) - storage (acre-feet) relationships
-        self.turbines = utils.loadMatrix(
+        self.turbines = data_cache.loadMatrix(
             create_path("./data1999/turbines_Conowingo2.txt"), 3, 13
         )  # Max-min capacity (cfs) - efficiency of Conowingo plant turbines
-        self.tailwater = utils.loadMatrix(
+        self.tailwater = data_cache.loadMatrix(
             create_path("./data1999/tailwater.txt"), 2, 18
         )  # tailwater head (ft) - release flow (cfs)
-        self.spillways = utils.loadMatrix(
+        self.spillways = data_cache.loadMatrix(
             create_path("./data1999/spillways_Conowingo.txt"), 3, 8
         )
         # substitute with newConowingo1
         # level (ft) - max release (cfs) - min release (cfs) for level > 108 ft
 
         # Muddy Run characteristics
-        self.lsv_rel_Muddy = utils.loadMatrix(
+        self.lsv_rel_Muddy = data_cache.loadMatrix(
             create_path("./data1999/lsv_rel_Muddy.txt"), 3, 38
         )  # level (ft) - Surface (acre) - storage (acre-feet) relationships
-        self.turbines_Muddy = utils.loadVector(
+        self.turbines_Muddy = data_cache.loadVector(
             create_path("./data1999/turbines_Muddy.txt"), 4
         )
         # Turbine-Pumping capacity (cfs) - efficiency of Muddy Run plant (
         # equal for the 8 units)
 
+        # turbined flow as a function of the release
+        self.dispatch_curve_Co = hydropower.DispatchCurve.from_conowingo_turbines(
+            self.turbines
+        )
+        self.turbine_curve_MR = hydropower.DispatchCurve.from_muddy_run_units(
+            self.turbines_Muddy[0]
+        )
+        self.pump_curve_MR = hydropower.DispatchCurve.from_muddy_run_pumps(
+            self.turbines_Muddy[2]
+        )
+
+        # lookup tables for the level / storage / surface conversions
+        if use_lookup_tables:
+            self.lookup_tables = lookup_tables.build_lookup_tables(
+                self.lsv_rel, self.lsv_rel_Muddy, self.tailwater,
+                tolerance=lookup_tolerance,
+            )
+            self.lookup_table_rows = lookup_tables.pack_lookup_tables(
+                self.lookup_tables
+            )
+        else:
+            self.lookup_tables = None
+            self.lookup_table_rows = np.empty((0, lookup_tables.HEADER))
+
         #adapt here to look for problem formulations
         self.historic_data = historic_data
+        self.n_traces = n_traces
+        if mc_quantiles not in quantiles.METHODS:
+            raise ValueError(f"unknown mc_quantiles {mc_quantiles}")
+        self.mc_quantiles = mc_quantiles
+        self.mc_error_bound = None
+
+        # racing Monte Carlo evaluation, see racing
+        self.race = None
+        self.race_statistics = dict(evaluations=0, stopped=0, traces=0)
+
+        # memoised and stored evaluations, see evaluate_cached and
+        # evaluate_stored
+        self.evaluation_cache = None
+        self.evaluation_store = None
+        self.digest = None
         if historic_data:
             self.load_historic_data()
-            self.evaluate = self.evaluate_historic
+            self.evaluate_simulated = self.evaluate_historic
         else:
             self.load_stochastic_data()
-            self.evaluate = self.evaluate_mc
+            self.evaluate_simulated = self.evaluate_mc
+        self.evaluate_uncached = self.evaluate_simulated
+        self.evaluate = self.evaluate_uncached
+        if evaluation_store_path is not None:
+            self.set_evaluation_store(evaluation_store_path)
+        if evaluation_cache_size:
+            self.set_evaluation_cache(evaluation_cache_size, cache_resolution)
 
         # objectives parameters
-        self.energy_prices = utils.loadArrangeMatrix(
+        self.energy_prices = data_cache.loadArrangeMatrix(
             create_path("./data1999/Pavg99.txt"), 24, self.n_days_one_year
         )  # energy prices ($/MWh)
-        self.min_flow = utils.loadVector(
+        self.min_flow = data_cache.loadVector(
             create_path("./data1999/min_flow_req.txt"), self.n_days_one_year
         )  # FERC minimum flow requirements for 1 year (cfs)
-        self.h_ref_rec = utils.loadVector(
+        self.h_ref_rec = data_cache.loadVector(
             create_path("./data1999/h_rec99.txt"), self.n_days_one_year
         )  # target level for weekends in touristic season (ft)
-        self.w_baltimore = utils.loadVector(
+        self.w_baltimore = data_cache.loadVector(
             create_path("./data1999/wBaltimore.txt"), self.n_days_one_year
         )  # water demand of Baltimore (cfs)
-        self.w_chester = utils.loadVector(
+        self.w_chester = data_cache.loadVector(
             create_path("./data1999/wChester.txt"), self.n_days_one_year
         )  # water demand of Chester (cfs)
-        self.w_atomic = utils.loadVector(
+        self.w_atomic = data_cache.loadVector(
             create_path("./data1999/wAtomic.txt"), self.n_days_one_year
         )  # water demand for cooling the atomic power plant (cfs)
 
@@ -145,28 +435,54 @@ class SusquehannaModel:
         self.output_max.append(85412)
         # max release = tot turbine capacity + spillways @ max storage
 
+        # tabulated policies, by decision vector
+        self.policy_table = None
+        if tabulate_policy:
+            self.policy_tables = tabulated_policy.PolicyTableCache(
+                policy_table_size
+            )
+        else:
+            self.policy_tables = None
+
+        # simulation engine
+        if engine not in ("numba", "python"):
+            raise ValueError(f"unknown engine {engine}")
+        self.rbf_id = simulation_kernel.get_rbf_id(self.rbf.rbf)
+        if (engine == "numba" and self.rbf_id is not None
+                and not tabulate_policy):
+            self.engine = "numba"
+            self.simulation = self.simulate_compiled
+        else:
+            self.engine = "python"
+            self.simulation = self.simulate
+
+        # model data in shared memory, see publish_shared_data
+        self.shared_data = None
+        if shared_data_handle is not None:
+            self.attach_shared_data(shared_data_handle)
+
     def load_historic_data(self):
-        self.evap_CO_MC = utils.loadMultiVector(
+        self.evap_CO_MC = data_cache.loadMultiVector(
             create_path("./data_historical/vectors/evapCO_history.txt"),
             self.n_years,
             self.n_days_one_year,
         )  # evaporation losses (inches per day)
-        self.inflow_MC = utils.loadMultiVector(
+        self.inflow_MC = data_cache.loadMultiVector(
             create_path("./data_historical/vectors/MariettaFlows_history.txt"),
             self.n_years,
             self.n_days_one_year,
         )  # inflow, i.e. flows at Marietta (cfs)
-        self.inflowLat_MC = utils.loadMultiVector(
+        self.inflowLat_MC = data_cache.loadMultiVector(
             create_path("./data_historical/vectors/nLat_history.txt"),
             self.n_years,
             self.n_days_one_year,
         )  # lateral inflows from Marietta to Conowingo (cfs)
-        self.evap_Muddy_MC = utils.loadMultiVector(
+        self.evap_Muddy_MC = data_cache.loadMultiVector(
             create_path("./data_historical/vectors/evapMR_history.txt"),
             self.n_years,
             self.n_days_one_year,
         )  # evaporation losses (inches per day)
-        self.inflow_Muddy_MC = utils.loadMultiVector(
+        self.inflow_Muddy_MC = data_cache.loadMultiVector(
             create_path("./data_historical/vectors/nMR_history.txt"),
             self.n_years,
             self.n_days_one_year,
@@ -180,19 +496,95 @@ class SusquehannaModel:
 
 
     def load_stochastic_data(self):
-        # stochastic hydrology
-        self.evap_CO_MC = utils.loadMatrix(
-            "./dataMC/evapCO_MC.txt", self.n_years, self.n_days_one_year
-        )  # evaporation losses (inches per day)
-        self.inflow_MC = utils.loadMatrix(
-            "./dataMC/MariettaFlows_MC.txt", self.n_years, self.n_days_one_year
-        )  # inflow, i.e. flows at Marietta (cfs)
-        self.inflowLat_MC = utils.loadMatrix(
-            "./dataMC/nLat_MC.txt", self.n_years, self.n_days_one_year
-        )  # lateral inflows from Marietta to Conowingo (cfs)
-        self.evap_Muddy_MC = utils.loadMatrix(
-            "./dataMC/evapMR_MC.txt", self.n_years, self.n_days_one_year
-        )  # evaporation losses (inches per day)
+        '''
+        Load the stochastic hydrology from dataMC, see stochastic_files.
+        Consecutive groups of n_years rows form the traces of the ensemble.
+        '''
+        n_rows = None
+        if self.n_traces is not None:
+            n_rows = self.n_traces * self.n_years
+        hydrology = {}
+        for name, file_name in self.stochastic_files.items():
+            path = create_path(os.path.join("./dataMC", file_name))
+            if not os.path.exists(path):
+                raise FileNotFoundError(
+                    f"stochastic data {path} not found, the Monte Carlo "
+                    f"evaluation needs {', '.join(self.stochastic_files.values())}"
+                )
+            hydrology[name] = data_cache.loadMatrix(
+                path, n_rows, self.n_days_one_year
+            )
+        self.set_ensemble(**hydrology)
+
+    def set_ensemble(self, **hydrology):
+        '''
+        Use an ensemble of hydrological traces for evaluate_mc and
+        evaluate_ensemble. The historic hydrology is left alone, so a model
+        of the historic data still evaluates the historic trace with
+        evaluate and evaluate_batch.
+
+        :param hydrology: one array per attribute of stochastic_files, each
+            holding n_years synthetic years of 365 days per trace, either as
+            rows of a 2-D array or as a (n_traces, n_years, 365) array.
+            Files of different length are cut to the traces all of them
+            cover.
+        '''
+        if set(hydrology) != set(self.stochastic_files):
+            raise ValueError(
+                f"expected the arrays {', '.join(self.stochastic_files)}"
+            )
+        days_per_trace = self.n_years * self.n_days_one_year
+        n_traces = min(np.size(data) // days_per_trace
+                       for data in hydrology.values())
+        if n_traces == 0:
+            raise ValueError(
+                f"the stochastic data holds less than {self.n_years} years"
+            )
+        for name, data in hydrology.items():
+            data = np.asarray(data, dtype=float).reshape(-1)
+            setattr(
+                self,
+                self.ensemble_attributes[name],
+                data[: n_traces * days_per_trace].reshape(
+                    n_traces, self.n_years, self.n_days_one_year
+                ),
+            )
+        self.n_traces = n_traces
+        self.digest = None
+        if self.evaluation_cache is not None:
+            self.evaluation_cache.clear()
+
+    def ensemble(self):
+        '''
+        :return: the ensemble of set_ensemble in the argument order of
+            simulate (inflow, lateral inflow, Muddy Run inflow, Conowingo
+            evaporation and Muddy Run evaporation), each (n_traces, n_years,
+            365); the historic hydrology as a single trace if no ensemble
+            was set
+        '''
+        hydrology = tuple(
+            getattr(self, name, None)
+            for name in self.ensemble_attributes.values()
+        )
+        if hydrology[0] is None:
+            return tuple(
+                np.asarray(data)[np.newaxis]
+                for data in self.historic_hydrology()
+            )
+        return hydrology
+
+    def historic_hydrology(self):
+        '''
+        :return: the historic hydrology in the argument order of simulate,
+            each (n_years, 365)
+        '''
+        return (
+            self.inflow_MC,
+            self.inflowLat_MC,
+            self.inflow_Muddy_MC,
+            self.evap_CO_MC,
+            self.evap_Muddy_MC,
+        )
 
     def set_log(self, log_objectives):
         if log_objectives:
@@ -219,13 +611,50 @@ class SusquehannaModel:
             self.eucli_ratio,
         )
 
+    @classmethod
+    def objective_mask(cls, objectives=None):
+        '''
+        Which of the 13 objectives of simulate to compute for a request,
+        the requested objectives and all objectives they depend on.
+
+        :param objectives: names (see objective_names) or indices of the
+            requested objectives, all objectives if None
+        :return: boolean numpy array of 13 values
+        '''
+        n_objectives = len(cls.objective_names)
+        mask = np.zeros(n_objectives, dtype=bool)
+        if objectives is None:
+            mask[:] = True
+            return mask
+        for objective in objectives:
+            if isinstance(objective, str):
+                if objective not in cls.objective_names:
+                    raise ValueError(f"unknown objective {objective}")
+                objective = cls.objective_names.index(objective)
+            mask[objective] = True
+        for i in range(n_objectives - 1, -1, -1):
+            if mask[i]:
+                mask[list(cls.objective_dependencies.get(i, ()))] = True
+        return mask
+
     def apply_rbf_policy(self, rbf_input):
 
+        # interpolate in the tabulated policy, the exact policy is used
+        # outside the tabulated levels
+        table = self.policy_table
+        if table is not None and table.in_range(rbf_input[1]):
+            return table(int(rbf_input[0]), rbf_input[1])
+
         # normalize inputs
         formatted_input = rbf_input / self.input_max
 
-        # apply rbf
-        normalized_output = self.rbf.apply_rbfs(formatted_input)
+        # apply rbf, reusing the time factors if the policy is compiled
+        if self.rbf.time_factors is not None:
+            normalized_output = self.rbf.apply_rbfs_compiled(
+                int(rbf_input[0]), formatted_input
+            )
+        else:
+            normalized_output = self.rbf.apply_rbfs(formatted_input)
 
         # scale back
         scaled_output = normalized_output * self.output_max
@@ -235,58 +664,484 @@ class SusquehannaModel:
         #     uu.append(u[i] * self.output_max[i])
         return scaled_output
 
-    def evaluate_historic(self, var, opt_met=1):
-        return self.simulate(
-            var,
-            self.inflow_MC,
-            self.inflowLat_MC,
-            self.inflow_Muddy_MC,
-            self.evap_CO_MC,
-            self.evap_Muddy_MC,
-            opt_met,
+    def policy_features(self, X, n_times=12, n_levels=5):
+        '''
+        Releases of policies on a coarse (decision step X Conowingo level)
+        grid, relative to the largest releases. Unlike the decision
+        variables they do not change when the basis functions are permuted,
+        which makes them the better input of a surrogate, see surrogate.
+
+        :param X: decision variables, shape (n_policies, n_decision_vars)
+        :param n_times: number of decision steps over the year
+        :param n_levels: number of levels between 95 and 115 ft
+        :return: shape (n_policies, n_times * n_levels * n_outputs)
+        '''
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        input_max = np.asarray(self.input_max, dtype=float)
+        steps, levels = np.meshgrid(
+            np.linspace(0, input_max[0], n_times),
+            np.linspace(95.0, 115.0, n_levels),
+            indexing="ij",
+        )
+        inputs = np.stack([steps.ravel(), levels.ravel()], axis=1) / input_max
+        if self.rbf.rbf in rbf_functions.batched_rbfs:
+            outputs = self.rbf.apply_rbfs_batch(
+                np.repeat(inputs[:, np.newaxis], X.shape[0], axis=1),
+                *self.rbf.unpack_decision_vars_batch(X),
+            )
+            outputs = np.swapaxes(outputs, 0, 1)
+        else:
+            outputs = []
+            for x in X:
+                self.rbf.set_decision_vars(x)
+                outputs.append(self.rbf.apply_rbfs_many(inputs))
+            outputs = np.asarray(outputs)
+        return outputs.reshape(X.shape[0], -1)
+
+    def evaluate_historic(self, var, opt_met=1, objectives=None):
+        '''
+        :param objectives: names or indices of the objectives to compute,
+            see objective_mask; the others are returned as nan
+        '''
+        return self.simulation(
+            var, *self.historic_hydrology(), opt_met, objectives
         )
 
-    def evaluate_mc(self, var, opt_met=1):
-        obj, Jhyd, Jatom, Jbal, Jche, Jenv, Jrec = [], [], [], [], [], [], []
-        # MC simulations
-        n_samples = 2
-        for i in range(0, n_samples):
-            (
-                Jhydropower,
-                Jatomicpowerplant,
-                Jbaltimore,
-                Jchester,
-                Jenvironment,
-                Jrecreation,
-            ) = self.simulate(
-                var,
-                self.inflow_MC,
-                self.inflowLat_MC,
-                self.inflow_Muddy_MC,
-                self.evap_CO_MC,
-                self.evap_Muddy_MC,
-                opt_met,
+    def set_evaluation_cache(self, maxsize, resolution=None):
+        '''
+        Memoise evaluate in a cache of this process, see evaluate_cached.
+        The setting is part of config, so models pickled to worker processes
+        afterwards get a cache of their own.
+
+        :param maxsize: number of evaluations kept, no cache if 0
+        :param resolution: see evaluation_cache.EvaluationCache
+        '''
+        self.config.update(
+            evaluation_cache_size=maxsize, cache_resolution=resolution
+        )
+        cache = None
+        if maxsize:
+            cache = evaluation_cache.EvaluationCache(maxsize, resolution)
+        self.use_evaluation_cache(cache)
+
+    def share_evaluation_cache(self, manager):
+        '''
+        Replace the cache of this model by one held in the server process of
+        a started evaluation_cache.EvaluationCacheManager. Models pickled
+        afterwards carry a proxy of it, so all worker processes share the
+        evaluations; every lookup is then a round trip to the manager.
+
+        :return: the proxy of the shared cache
+        '''
+        maxsize = self.config["evaluation_cache_size"]
+        if not maxsize:
+            raise ValueError("the model has no evaluation cache to share")
+        cache = manager.EvaluationCache(maxsize, self.config["cache_resolution"])
+        self.use_evaluation_cache(cache)
+        return cache
+
+    def set_evaluation_store(self, path):
+        '''
+        Look evaluations up in, and add them to, an evaluation store on disk,
+        see evaluate_stored. Like set_evaluation_cache the setting is part
+        of config; every process opens the store itself.
+
+        A policy missing from the store is simulated for all objectives,
+        and evaluate_batch evaluates policy by policy, so the store gives
+        up the objective masking of the formulations and the population
+        batching of the python engine; it pays off when runs or
+        formulations evaluate the same policies again.
+
+        :param path: SQLite database of the store, no store if None;
+            relative paths are resolved against the current directory
+        '''
+        if path is not None:
+            path = os.path.abspath(path)
+        self.config.update(evaluation_store_path=path)
+        if self.evaluation_store is not None:
+            self.evaluation_store.close()
+        if path is None:
+            self.evaluation_store = None
+            self.evaluate_uncached = self.evaluate_simulated
+        else:
+            self.evaluation_store = evaluation_store.EvaluationStore(path)
+            self.evaluate_uncached = self.evaluate_stored
+        self.use_evaluation_cache(self.evaluation_cache)
+
+    def model_digest(self):
+        '''
+        Digest of what the evaluations of this model depend on, its
+        configuration apart from the caching settings and its hydrology;
+        the other model data is read from the files of the repository.
+
+        :return: hexadecimal sha256 digest
+        '''
+        if self.digest is None:
+            content = hashlib.sha256()
+            for name, value in self.config.items():
+                if name in self.undigested_config:
+                    continue
+                if name == "rbf":
+                    value = value.key()
+                content.update(repr((name, value)).encode())
+            if self.historic_data:
+                hydrology = self.historic_hydrology()
+            else:
+                hydrology = self.ensemble()
+            for data in hydrology:
+                content.update(np.ascontiguousarray(data, dtype=float).tobytes())
+            self.digest = content.hexdigest()
+        return self.digest
+
+    def evaluate_stored(self, var, opt_met=1, objectives=None):
+        '''
+        evaluate_historic or evaluate_mc through the evaluation store. A
+        policy missing from the store is evaluated for all objectives, so
+        that the stored result serves every formulation; the objectives not
+        requested are returned as nan all the same. Logged simulations
+        bypass the store and stopped racing candidates are not stored.
+        '''
+        if getattr(self, "log_objectives", False):
+            return self.evaluate_simulated(var, opt_met, objectives)
+        digest = self.model_digest()
+        key = self.evaluation_store.key(digest, var, opt_met)
+        stored = self.evaluation_store.get(key)
+        if stored is None:
+            values = np.asarray(
+                self.evaluate_simulated(var, opt_met), dtype=float
+            )
+            bound = self.mc_error_bound
+            if bound is None or np.all(np.isfinite(bound)):
+                self.evaluation_store.put(
+                    key, digest, var, opt_met, values, bound
+                )
+        else:
+            values, self.mc_error_bound = stored
+        mask = self.objective_mask(objectives)[: values.size]
+        return np.where(mask, values, np.nan).tolist()
+
+    def use_evaluation_cache(self, cache):
+        self.evaluation_cache = cache
+        if cache is None:
+            self.evaluate = self.evaluate_uncached
+        else:
+            self.evaluate = self.evaluate_cached
+
+    def evaluation_key(self, var, opt_met, objectives):
+        return self.evaluation_cache.key(
+            var, opt_met, self.objective_mask(objectives).tobytes()
+        )
+
+    def evaluate_cached(self, var, opt_met=1, objectives=None):
+        '''
+        evaluate_historic or evaluate_mc through the evaluation cache, by
+        decision vector, policy type and requested objectives. Logged
+        simulations bypass the cache. Stopped racing candidates are not
+        stored, as they only have estimates, but a cached evaluation is
+        returned to a race as well.
+        '''
+        if getattr(self, "log_objectives", False):
+            return self.evaluate_uncached(var, opt_met, objectives)
+        key = self.evaluation_key(var, opt_met, objectives)
+        cached = self.evaluation_cache.get(key)
+        if cached is not None:
+            result, self.mc_error_bound = cached
+            return copy.copy(result)
+        result = self.evaluate_uncached(var, opt_met, objectives)
+        bound = self.mc_error_bound
+        if bound is None or np.all(np.isfinite(bound)):
+            self.evaluation_cache.put(key, (copy.copy(result), bound))
+        return result
+
+    def evaluate_batch(self, X, opt_met=1, objectives=None):
+        '''
+        Evaluate a population of policies over the hydrology used by
+        evaluate_historic. With the numba engine every policy runs through
+        the compiled kernel, which is faster per policy than the vectorized
+        pass of simulate_batch used otherwise. With stochastic data every
+        policy is evaluated with evaluate_mc.
+
+        :param X: decision variables, shape (n_policies, n_decision_vars)
+        :param objectives: names or indices of the objectives to compute,
+            see objective_mask; the others are returned as nan
+        :return: objectives, shape (n_policies, 13), in the order of simulate
+        '''
+        X = np.asarray(X, dtype=float)
+        if X.ndim != 2:
+            raise ValueError("X should be 2-D (n_policies X n_decision_vars)")
+        if (self.engine == "numba" or not self.historic_data
+                or self.rbf.rbf not in rbf_functions.batched_rbfs
+                or self.evaluation_store is not None):
+            return np.asarray([self.evaluate(x, opt_met, objectives) for x in X])
+        if self.evaluation_cache is None or getattr(
+                self, "log_objectives", False):
+            return self.simulate_batch_historic(X, opt_met, objectives)
+
+        # simulate only the policies missing from the cache
+        keys = [self.evaluation_key(x, opt_met, objectives) for x in X]
+        cached = [self.evaluation_cache.get(key) for key in keys]
+        missing = [i for i, hit in enumerate(cached) if hit is None]
+        Y = np.empty((X.shape[0], len(self.objective_names)))
+        for i, hit in enumerate(cached):
+            if hit is not None:
+                Y[i] = hit[0]
+        if missing:
+            Y[missing] = self.simulate_batch_historic(
+                X[missing], opt_met, objectives
             )
-            Jhyd.append(Jhydropower)
-            Jatom.append(Jatomicpowerplant)
-            Jbal.append(Jbaltimore)
-            Jche.append(Jchester)
-            Jenv.append(Jenvironment)
-            Jrec.append(Jrecreation)
-
-        # objectives aggregation (minimax)
-        obj.insert(0, np.percentile(Jhyd, 99))
-        obj.insert(1, np.percentile(Jatom, 99))
-        obj.insert(2, np.percentile(Jbal, 99))
-        obj.insert(3, np.percentile(Jche, 99))
-        obj.insert(4, np.percentile(Jenv, 99))
-        obj.insert(5, np.percentile(Jrec, 99))
-        return obj
+            for i in missing:
+                self.evaluation_cache.put(keys[i], (tuple(Y[i].tolist()), None))
+        return Y
+
+    def simulate_batch_historic(self, X, opt_met=1, objectives=None):
+        '''simulate_batch over the hydrology used by evaluate_historic'''
+        return self.simulate_batch(
+            X, *self.historic_hydrology(), opt_met, objectives
+        )
+
+    def evaluate_ensemble(self, var, opt_met=1, objectives=None, traces=None):
+        '''
+        Evaluate a policy over every trace of the hydrological ensemble, see
+        ensemble. The numba engine runs the traces in parallel in a single
+        call to simulation_kernel.simulate_ensemble, the python engine as
+        the rows of one simulate_batch pass; logged simulations and the
+        other policies run trace by trace.
+
+        :param objectives: names or indices of the objectives to compute,
+            see objective_mask; the others are returned as nan
+        :param traces: slice of the traces to simulate, all if None
+        :return: objectives, shape (n_traces, 13), in the order of simulate
+        '''
+        hydrology = self.ensemble()
+        if traces is not None:
+            hydrology = tuple(data[traces] for data in hydrology)
+        n_traces = hydrology[0].shape[0]
+        if opt_met == 1 and not getattr(self, "log_objectives", False):
+            if self.engine == "numba":
+                return simulation_kernel.simulate_ensemble(
+                    *self.kernel_arguments(var, hydrology, objectives)
+                )
+            if (self.rbf.rbf in rbf_functions.batched_rbfs
+                    and self.policy_tables is None):
+                X = np.repeat(
+                    np.asarray(var, dtype=float)[np.newaxis], n_traces, axis=0
+                )
+                return self.simulate_batch(X, *hydrology, opt_met, objectives)
+        return np.asarray(
+            [
+                self.simulation(
+                    var, *(data[k] for data in hydrology), opt_met, objectives
+                )
+                for k in range(n_traces)
+            ]
+        )
+
+    def evaluate_mc(self, var, opt_met=1, objectives=None):
+        '''
+        Evaluate a policy over the stochastic ensemble, every objective
+        aggregated over the traces by its mc_percentile-th percentile
+        (minimax). The traces are simulated ensemble_chunk_size at a time
+        and reduced by a quantiles.QuantileReducer, so only the order
+        statistics the percentile needs are kept; with mc_quantiles
+        'approximate' the bound of the error of each objective is stored in
+        mc_error_bound.
+
+        :param objectives: names or indices of the objectives to compute,
+            see objective_mask; the others are returned as nan
+        :return: list of the 6 aggregated objectives, hydropower to
+            recreation
+        '''
+        if self.race is not None:
+            return self.evaluate_mc_racing(var, opt_met, objectives)
+        n_traces = self.ensemble()[0].shape[0]
+        reducer = quantiles.QuantileReducer(
+            self.mc_percentile,
+            6,
+            method=self.mc_quantiles,
+            n_samples=n_traces,
+            epsilon=self.mc_epsilon,
+        )
+        for start in range(0, n_traces, self.ensemble_chunk_size):
+            traces = slice(start, start + self.ensemble_chunk_size)
+            reducer.add(
+                self.evaluate_ensemble(var, opt_met, objectives, traces)[:, :6]
+            )
+        obj, lower, upper = reducer.bounds()
+        self.mc_error_bound = np.maximum(obj - lower, upper - obj)
+        return obj.tolist()
+
+    def evaluate_mc_racing(self, var, opt_met=1, objectives=None):
+        '''
+        evaluate_mc against the archive of self.race, see racing. The traces
+        are simulated race.increment at a time in the order of the race,
+        until the candidate cannot enter the archive or all traces are
+        simulated. A stopped candidate gets the percentiles over the traces
+        simulated so far, and an infinite mc_error_bound; race_statistics
+        counts the evaluations, the stopped ones and the simulated traces.
+
+        :return: list of the 6 aggregated objectives, hydropower to
+            recreation
+        '''
+        race = self.race
+        n_traces = self.ensemble()[0].shape[0]
+        order = race.order(n_traces)
+        samples = np.empty((n_traces, 6))
+        stopped = False
+        n_simulated = 0
+        while n_simulated < n_traces and not stopped:
+            traces = order[n_simulated:n_simulated + race.increment]
+            samples[n_simulated:n_simulated + traces.size] = (
+                self.evaluate_ensemble(var, opt_met, objectives, traces)[:, :6]
+            )
+            n_simulated += traces.size
+            if race.min_traces <= n_simulated < n_traces:
+                stopped = race.cannot_enter(
+                    race.optimistic(
+                        samples[:n_simulated], self.mc_percentile, n_traces
+                    )
+                )
+
+        self.race_statistics["evaluations"] += 1
+        self.race_statistics["stopped"] += int(stopped)
+        self.race_statistics["traces"] += n_simulated
+        self.mc_error_bound = np.full(6, np.inf if stopped else 0.0)
+        return np.percentile(
+            samples[:n_simulated], self.mc_percentile, axis=0
+        ).tolist()
+
+    def lookup_table_report(self):
+        '''
+        Error of each lookup table against the exact interpolation
+
+        :return: dict mapping the name of each table to its report, see
+        UniformLookupTable.report
+        '''
+        if self.lookup_tables is None:
+            return {}
+        report = {}
+        lakes = ["muddy_run", "conowingo"]
+        for name, tables in self.lookup_tables.items():
+            if name == "tailwater":
+                report[name] = tables.report()
+            else:
+                for lake, table in zip(lakes, tables):
+                    report[f"{name}_{lake}"] = table.report()
+        return report
+
+    def lookup_table_items(self):
+        '''
+        :return: list of (name, UniformLookupTable) pairs of all lookup
+        tables
+        '''
+        if self.lookup_tables is None:
+            return []
+        items = []
+        for name, tables in self.lookup_tables.items():
+            if name == "tailwater":
+                items.append((name, tables))
+            else:
+                for lake, table in enumerate(tables):
+                    items.append((f"{name}.{lake}", table))
+        return items
+
+    def shared_arrays(self):
+        '''
+        :return: dict with the model data that can be shared between
+        processes, by name
+        '''
+        arrays = {
+            name: getattr(self, name)
+            for name in self.shared_attributes
+            if hasattr(self, name)
+        }
+        for name, table in self.lookup_table_items():
+            arrays[f"{name}.grid"] = table.grid
+            arrays[f"{name}.packed"] = table.packed
+        return arrays
+
+    def publish_shared_data(self):
+        '''
+        Copy the model data into shared memory. Models pickled afterwards
+        attach to the shared memory when unpickled instead of carrying the
+        data, see __getstate__.
+
+        :return: the SharedArrayStore, to be closed and unlinked by the
+        caller once all workers are done
+        '''
+        store = shared_data.SharedArrayStore.publish(self.shared_arrays())
+        self.use_shared_data(store)
+        return store
+
+    def attach_shared_data(self, handle):
+        '''
+        Take the model data from a published SharedArrayStore
+
+        :param handle: SharedArrayStore.handle
+        '''
+        self.use_shared_data(shared_data.SharedArrayStore.attach(handle))
+
+    def use_shared_data(self, store):
+        tables = dict(self.lookup_table_items())
+        for name, array in store.arrays.items():
+            table_name, _, field = name.rpartition(".")
+            if table_name in tables:
+                setattr(tables[table_name], field, array)
+            else:
+                setattr(self, name, array)
+        self.shared_data = store
+
+    def __reduce__(self):
+        """
+        A pickled model only carries its constructor arguments, the handle
+        of its shared data, its log setting, its race and its evaluation
+        cache if shared between processes. Unpickling
+        returns the resident model of the unpickling process for that
+        configuration, see resident_model, so that a worker builds every
+        model only once. Changes made to a model after construction, other
+        than set_log, race and share_evaluation_cache, do not cross the
+        process boundary.
+        """
+        handle = None if self.shared_data is None else self.shared_data.handle
+        shared_cache = None
+        if not isinstance(self.evaluation_cache,
+                          (evaluation_cache.EvaluationCache, type(None))):
+            shared_cache = self.evaluation_cache
+        return resident_model, (
+            self.config, handle, getattr(self, "log_objectives", None),
+            self.race, shared_cache,
+        )
+
+    def tabulate_policy(self, n_steps):
+        """
+        Tabulate the policy of the current decision variables
+
+        Parameters
+        ----------
+        n_steps : int
+                  number of decision steps in a year
+        Returns
+        -------
+        TabulatedPolicy
+        """
+        return tabulated_policy.TabulatedPolicy(
+            self.rbf, self.input_max, self.output_max, n_steps
+        )
+
+    def policy_table_report(self, var, n_samples=10000, seed=None):
+        """
+        Maximum absolute release deviation (cfs) per release of the
+        tabulated policy of var against the exact policy
+        """
+        self.rbf.set_decision_vars(np.asarray(var))
+        table = self.tabulate_policy(self.n_days_in_year * self.decisions_per_day)
+        return table.max_deviation(n_samples, seed)
 
     def storage_to_level(self, s, lake):
         # s : storage
         # lake : which lake it is at
         # gets triggered decision step * time horizon
+        if self.lookup_tables is not None:
+            return self.lookup_tables["storage_to_level"][lake](s)
         s_ = utils.cubicFeetToAcreFeet(s)
         if lake == 0:
             h = utils.interpolate_linear(
@@ -297,6 +1152,8 @@ class SusquehannaModel:
         return h
 
     def level_to_storage(self, h, lake):
+        if self.lookup_tables is not None:
+            return self.lookup_tables["level_to_storage"][lake](h)
         if lake == 0:
             s = utils.interpolate_linear(
                 self.lsv_rel_Muddy[0], self.lsv_rel_Muddy[2], h
@@ -306,6 +1163,8 @@ class SusquehannaModel:
         return utils.acreFeetToCubicFeet(s)
 
     def level_to_surface(self, h, lake):
+        if self.lookup_tables is not None:
+            return self.lookup_tables["level_to_surface"][lake](h)
         if lake == 0:
             s = utils.interpolate_linear(
                 self.lsv_rel_Muddy[0], self.lsv_rel_Muddy[1], h
@@ -314,7 +1173,50 @@ class SusquehannaModel:
             s = utils.interpolate_linear(self.lsv_rel[0], self.lsv_rel[1], h)
         return utils.acreToSquaredFeet(s)
 
+    def storage_to_level_array(self, s, lake):
+        # array version of storage_to_level
+        if self.lookup_tables is not None:
+            return self.lookup_tables["storage_to_level"][lake].evaluate_array(s)
+        s_ = utils.cubicFeetToAcreFeet(s)
+        if lake == 0:
+            lsv = self.lsv_rel_Muddy
+        else:
+            lsv = self.lsv_rel
+        return utils.interpolate_linear_array(lsv[2], lsv[0], s_)
+
+    def level_to_storage_array(self, h, lake):
+        # array version of level_to_storage
+        if self.lookup_tables is not None:
+            return self.lookup_tables["level_to_storage"][lake].evaluate_array(h)
+        if lake == 0:
+            lsv = self.lsv_rel_Muddy
+        else:
+            lsv = self.lsv_rel
+        s = utils.interpolate_linear_array(lsv[0], lsv[2], h)
+        return utils.acreFeetToCubicFeet(s)
+
+    def level_to_surface_array(self, h, lake):
+        # array version of level_to_surface
+        if self.lookup_tables is not None:
+            return self.lookup_tables["level_to_surface"][lake].evaluate_array(h)
+        if lake == 0:
+            lsv = self.lsv_rel_Muddy
+        else:
+            lsv = self.lsv_rel
+        s = utils.interpolate_linear_array(lsv[0], lsv[1], h)
+        return utils.acreToSquaredFeet(s)
+
+    def tailwater_level_array(self, q):
+        # array version of tailwater_level
+        if self.lookup_tables is not None:
+            return self.lookup_tables["tailwater"].evaluate_array(q)
+        return utils.interpolate_linear_array(
+            self.tailwater[0], self.tailwater[1], q
+        )
+
     def tailwater_level(self, q):
+        if self.lookup_tables is not None:
+            return self.lookup_tables["tailwater"](q)
         return utils.interpolate_linear(self.tailwater[0], self.tailwater[1], q)
 
     def muddyrun_pumpturb(self, day, hour, level_Co, level_MR):
@@ -356,24 +1258,16 @@ class SusquehannaModel:
         return qp, qt  # pumping, Turbine release
 
     @staticmethod
-    @njit
+    @kernel()
     def g_hydRevCo(
         r, h, day_of_year, hour0, GG, gammaH20, tailwater, turbines, energy_prices
     ):
-        def interpolate_tailwater_level(X, Y, x):
-            dim = len(X) - 1
-            if x <= X[0]:
-                y = (x - X[0]) * (Y[1] - Y[0]) / (X[1] - X[0]) + Y[0]
-                return y
-            elif x >= X[dim]:
-                y = Y[dim] + (Y[dim] - Y[dim - 1]) / (X[dim] - X[dim - 1]) * (
-                    x - X[dim]
-                )
-                return y
-            else:
-                y = np.interp(x, X, Y)
-            return y
-
+        '''
+        Reference implementation of the hourly hydropower production and
+        revenue of Conowingo, no longer called by simulate. The dispatch
+        curves in hydropower and simulation_kernel.hydropower_co reproduce
+        it.
+        '''
         cubicFeetToCubicMeters = 0.0283  # 1 cf = 0.0283 m3
         feetToMeters = 0.3048  # 1 ft = 0.3048 m
         Nturb = 13
@@ -382,7 +1276,7 @@ class SusquehannaModel:
         pp = []
         c_hour = len(r) * hour0
         for i in range(0, len(r)):
-            deltaH = h[i] - interpolate_tailwater_level(
+            deltaH = h[i] - utils.interpolate_linear(
                 tailwater[0], tailwater[1], r[i]
             )
             q_split = r[i]
@@ -416,7 +1310,7 @@ class SusquehannaModel:
         return Gp, Gr
 
     @staticmethod
-    @njit
+    @kernel()
     def g_hydRevMR(
         qp,
         qr,
@@ -429,6 +1323,11 @@ class SusquehannaModel:
         turbines_Muddy,
         energy_prices,
     ):
+        '''
+        Reference implementation of the hourly hydropower production and
+        revenue of Muddy Run, no longer called by simulate, see
+        hydropower.hydropower_muddy_run.
+        '''
         n_turb = 8
         cubic_feet_to_cubic_meters = 0.0283  # 1 cf = 0.0283 m3
         feet_to_meters = 0.3048  # 1 ft = 0.3048 m
@@ -493,6 +1392,87 @@ class SusquehannaModel:
 
         return g_pump, g_hyd, g_revP, g_rev
 
+    def g_hydRevCo_batch(self, r, h, c_hour, day_of_year):
+        '''
+        Hourly hydropower production (kWh) and revenue ($) at Conowingo for
+        a population of releases, see g_hydRevCo.
+
+        :param r: release per policy, shape (n_policies,)
+        :param h: Conowingo level per policy, shape (n_policies,)
+        :param c_hour: hour of the day
+        :param day_of_year:
+        :return: production and revenue, each of shape (n_policies,)
+        '''
+        price = self.energy_prices[c_hour][day_of_year]
+        production, revenue = hydropower.hydropower_conowingo(
+            r, h, price, self.dispatch_curve_Co.arrays,
+            self.tailwater_level_array(r),
+        )
+        return production, revenue
+
+    def muddyrun_pumpturb_batch(self, day, hour, level_Co, level_MR):
+        '''
+        Population version of muddyrun_pumpturb
+
+        :param level_Co: Conowingo level per policy, shape (n_policies,)
+        :param level_MR: Muddy Run level per policy, shape (n_policies,)
+        :return: pumping and turbine release, each of shape (n_policies,)
+        '''
+        # the schedule only depends on the day and the hour, so reuse the
+        # scalar version for it and apply the level constraints per policy
+        qp_on, qt_on = self.muddyrun_pumpturb(day, hour, 110.0, 505.0)
+        QT = 32000  # cfs
+
+        qp = np.where(level_Co < 104.7, 0.0, qp_on)
+        if qt_on:
+            qM = (
+                self.level_to_storage_array(level_MR, 0)
+                - self.level_to_storage(470.0, 0)
+            ) / 3600
+            qt = np.where(level_MR < 470.0, 0.0, np.minimum(QT, qM))
+        else:
+            qt = np.zeros_like(level_MR)
+        return qp, qt
+
+    def actual_release_batch(self, uu, level_Co, day_of_year):
+        '''
+        Population version of actual_release
+
+        :param uu: rbf release per policy, shape (n_policies, 4)
+        :param level_Co: Conowingo level per policy, shape (n_policies,)
+        :param day_of_year:
+        :return: actual release, shape (n_policies, 4)
+        '''
+        Tcap = 85412  # total turbine capacity (cfs)
+
+        q_min = np.zeros_like(uu)
+        q_max = np.empty_like(uu)
+        q_max[:, 0] = np.where(
+            level_Co <= self.min_level_app, 0.0, self.w_atomic[day_of_year]
+        )
+        q_max[:, 1] = np.where(
+            level_Co <= self.min_level_baltimore,
+            0.0,
+            self.w_baltimore[day_of_year],
+        )
+        q_max[:, 2] = np.where(
+            level_Co <= self.min_level_chester, 0.0, self.w_chester[day_of_year]
+        )
+
+        # spillways activated
+        spill = level_Co > 110.2
+        q_spill = (
+            utils.interpolate_linear_array(
+                self.spillways[0], self.spillways[1], level_Co
+            )
+            + Tcap
+        )
+        q_max[:, 3] = np.where(spill, q_spill, Tcap)
+        q_min[:, 3] = np.where(spill, q_spill, 0.0)
+        q_max[level_Co < 105.5, 3] = 0.0
+
+        return np.minimum(q_max, np.maximum(q_min, uu))
+
     def actual_release(self, uu, level_Co, day_of_year):
         '''
 
@@ -604,21 +1584,19 @@ class SusquehannaModel:
         leak = 800  # cfs
 
         # Storages and levels of Conowingo and Muddy Run
-        shape = (HH + 1,)
+        ws = self.workspace
+        storage_Co = ws.step_storage_co
+        level_Co = ws.step_level_co
+        storage_mr = ws.step_storage_mr
+        level_mr = ws.step_level_mr
 
-        storage_Co = np.empty(shape)
-        level_Co = np.empty(shape)
-        storage_mr = np.empty(shape)
-        level_mr = np.empty(shape)
         # Actual releases (Atomic Power plant, Baltimore, Chester, Dowstream)
-
-        shape = (HH,)
-        release_A = np.empty(shape)
-        release_B = np.empty(shape)
-        release_C = np.empty(shape)
-        release_D = np.empty(shape)
-        q_pump = np.empty(shape)
-        q_rel = np.empty(shape)
+        release_A = ws.step_release_a
+        release_B = ws.step_release_b
+        release_C = ws.step_release_c
+        release_D = ws.step_release_d
+        q_pump = ws.step_q_pump
+        q_rel = ws.step_q_rel
 
         # initial conditions
         storage_Co[0] = s0
@@ -686,33 +1664,25 @@ class SusquehannaModel:
         rel_c = utils.computeMean(release_C)
         rel_d = utils.computeMean(release_D)
 
-        level_Co = np.asarray(level_Co)
         # 4-hours hydropower production/revenue
-        # hp = self.g_hydRevCo(release_D, level_Co, day_of_year, hour0)
-        hp = SusquehannaModel.g_hydRevCo(
-            np.asarray(release_D),
-            level_Co,
-            day_of_year,
-            hour0,
-            self.GG,
-            self.gammaH20,
-            self.tailwater,
-            self.turbines,
-            self.energy_prices,
+        prices = self.energy_prices[HH * hour0 : HH * (hour0 + 1), day_of_year]
+        production, revenue = hydropower.hydropower_conowingo(
+            release_D,
+            level_Co[:HH],
+            prices,
+            self.dispatch_curve_Co.arrays,
+            self.tailwater_level_array(release_D),
         )
-        # hp_mr = self.g_hydRevMR(q_pump, q_rel, level_Co, level_mr,
-        # day_of_year, hour0)
-        hp_mr = SusquehannaModel.g_hydRevMR(
-            np.asarray(q_pump),
-            np.asarray(q_rel),
-            level_Co,
-            np.asarray(level_mr),
-            day_of_year,
-            hour0,
-            self.GG,
-            self.gammaH20,
+        hp = (np.sum(production), np.sum(revenue))
+        hp_mr = hydropower.hydropower_muddy_run(
+            q_pump,
+            q_rel,
+            level_Co[:HH],
+            level_mr[:HH],
+            prices,
+            self.turbine_curve_MR.arrays,
+            self.pump_curve_MR.arrays,
             self.turbines_Muddy,
-            self.energy_prices,
         )
         # Revenue s_rr.extend([hp[1], hp_mr[2], hp_mr[3]])
         # Production s_rr.extend([hp[0], hp_mr[0], hp_mr[1]])
@@ -860,22 +1830,13 @@ class SusquehannaModel:
         '''
         Calculate monthly average out of an array that is ordered by the number of days in one year.
 
+        Day i is counted in month i % 12, see metrics.month_of_day.
+
         :param x_input: array or list
-        :return: a list of length 12 corresponding to the month number. Each month has as an entry equal to
+        :return: an array of length 12 corresponding to the month number. Each month has as an entry equal to
         its monthly average
         '''
-
-        monthly_values = {}
-        monthly_average = []
-        for i, value in enumerate(x_input):
-            month = (i + 1) % 12 or 12  # calculate the month based on the index
-            if month not in monthly_values:
-                monthly_values[month] = []
-            monthly_values[month].append(value)
-
-        for month, value in monthly_values.items():
-            monthly_average.append(sum(value)/len(value))
-        return monthly_average
+        return metrics.monthly_average(x_input)
 
 
     @staticmethod
@@ -912,18 +1873,14 @@ class SusquehannaModel:
 
     @staticmethod
     def gini_coefficient_scipy(x_input):
-        two_dim_array = SusquehannaModel.array_results(x_input)
-        numerator_total_distance = pdist(two_dim_array, lambda u, v: np.abs((u-v)).sum())
-        # denominator is defined as 2 * length^2 * average array value
-        denominator = 2 * pow(len(x_input), 2) * np.average(x_input)  # (sum(x_input)/len(x_input))
-        gini_coeff = (numerator_total_distance/denominator).sum()
-        return gini_coeff
+        # sum of the pairwise distances divided by 2 * length^2 * average
+        # array value, formerly with scipy's pdist, see metrics
+        return metrics.gini_coefficient(x_input)
 
     @staticmethod
     def euclidean_distance_scipy(x_input):
-        two_dim_array = SusquehannaModel.array_results(x_input)
-        total_distance = pdist(two_dim_array, 'euclidean').sum()
-        return total_distance
+        # sum of the pairwise distances, formerly with scipy's pdist
+        return metrics.pairwise_distance_sum(x_input)
 
     # def sum_inequality_coefficient(objectives_input_array, inequality_metric):
     #     inequality_coefficient_array = np.empty()
@@ -934,6 +1891,32 @@ class SusquehannaModel:
     #     sum_inequality_coefficient_array = np.sum(inequality_coefficient_array)
     #     return sum_inequality_coefficient_array
 
+    @staticmethod
+    def monthly_average_batch(x_input):
+        '''
+        Population version of monthly_average
+
+        :param x_input: array of shape (n_policies, n_days)
+        :return: array of shape (n_policies, 12)
+        '''
+        return metrics.monthly_average(x_input)
+
+    @staticmethod
+    def euclidean_distance_batch(x_input):
+        '''
+        Population version of euclidean_distance_scipy, distances are taken
+        over the last axis.
+        '''
+        return metrics.pairwise_distance_sum(x_input)
+
+    @staticmethod
+    def gini_coefficient_batch(x_input):
+        '''
+        Population version of gini_coefficient_scipy, coefficients are taken
+        over the last axis.
+        '''
+        return metrics.gini_coefficient(x_input)
+
     @staticmethod
     def reliability_std(inequality_coefficient_array):
         array_dealer = np.std(inequality_coefficient_array)
@@ -948,55 +1931,79 @@ class SusquehannaModel:
         evap_CO_MC_e_co,
         evap_Muddy_MC_e_mr,
         opt_met,
+        objectives=None,
     ):
 
-        # Initializing daily variables
-        # storages and levels
-
-        reliability_gini = []
-        reliability_eucli = []
-
-        shape = (self.time_horizon_H + 1,)
-        storage_co = np.empty(shape)
-        level_co = np.empty(shape)
-        storage_mr = np.empty(shape)
-        level_mr = np.empty(shape)
-
-        # Conowingo actual releases
-        shape = (self.time_horizon_H,)
-        release_a = np.empty(shape)
-        release_b = np.empty(shape)
-        release_c = np.empty(shape)
-        release_d = np.empty(shape)
-
-        # hydropower production/revenue
-        hydropowerProduction_Co = []  # energy production at Conowingo
-        hydropowerProduction_MR = []  # energy production at Muddy Run
-        hydroPump_MR = []  # energy consumed for pumping at Muddy Run
-        hydropowerRevenue_Co = []  # energy revenue at Conowingo
-        hydropowerRevenue_MR = []  # energy revenue at Muddy Run
-        hydropowerPumpRevenue_MR = []  # energy revenue consumed for pumpingat Muddy Run
+        # objectives to compute, all of them if they are logged
+        log = getattr(self, "log_objectives", False)
+        if log:
+            objectives = None
+        compute = SusquehannaModel.objective_mask(objectives)
+
+        # Initializing daily variables, all buffers come from the
+        # workspace and are overwritten by every simulation
+        ws = self.workspace
+
+        # objectives are accumulated day by day, levels and releases are
+        # only kept for the log
+        accumulator = ObjectiveAccumulator(
+            self.w_atomic,
+            self.w_baltimore,
+            self.w_chester,
+            self.min_flow,
+            self.h_ref_rec,
+            simulation_kernel.hydro_reliability_target(),
+            self.n_days_in_year,
+        )
+        if log:
+            level_co = np.empty(self.time_horizon_H + 1)
+            level_mr = np.empty(self.time_horizon_H + 1)
+            releases = np.empty((4, self.time_horizon_H))
 
         # release decision variables ( AtomicPP, Baltimore, Chester ) only
         # Downstream in Baseline
         self.rbf.set_decision_vars(np.asarray(input_variable_list_var))
 
         # initial condition
-        level_co[0] = self.init_level
-        storage_co[0] = self.level_to_storage(level_co[0], 1)
-        level_mr[0] = self.init_level_MR
-        storage_mr[0] = self.level_to_storage(level_mr[0], 0)
+        storage_co = self.level_to_storage(self.init_level, 1)
+        storage_mr = self.level_to_storage(self.init_level_MR, 0)
+        level_co_t = self.init_level
+        level_mr_t = self.init_level_MR
+        accumulator.reset(storage_co, monthly=compute[9] or compute[10])
+        if log:
+            level_co[0] = level_co_t
+            level_mr[0] = level_mr_t
 
         # identification of the periodicity (365 x fdays)
         decision_steps_per_year = self.n_days_in_year * self.decisions_per_day
         year = 0
 
-        j_atom_yearly_array = []
-        j_balt_yearly_array = []
-        j_ches_yearly_array = []
-        j_env_yearly_array = []
-        # j_rec_yearly_array = []
-        storage_co_yearly = []
+        # the time input cycles through the same decision steps every year,
+        # so precompute its contribution to each basis function once; the
+        # compiled engine does not, see RBF.compile_policy
+        if opt_met == 1 and self.rbf.is_separable():
+            self.rbf.compile_policy(
+                np.arange(decision_steps_per_year) / self.input_max[0]
+            )
+        if opt_met == 1 and self.policy_tables is not None:
+            self.policy_table = self.policy_tables.get(
+                input_variable_list_var,
+                lambda: self.tabulate_policy(decision_steps_per_year),
+            )
+
+        # subdaily variables
+        daily_storage_co = ws.daily_storage_co
+        daily_level_co = ws.daily_level_co
+        daily_storage_mr = ws.daily_storage_mr
+        daily_level_mr = ws.daily_level_mr
+
+        daily_release_a = ws.daily_release_a
+        daily_release_b = ws.daily_release_b
+        daily_release_c = ws.daily_release_c
+        daily_release_d = ws.daily_release_d
+        daily_release = ws.daily_release
+
+        rbf_input = ws.rbf_input
 
         # run simulation
         for t in range(self.time_horizon_H):
@@ -1006,29 +2013,17 @@ class SusquehannaModel:
             if day_of_year % self.n_days_in_year == 0 and t != 0:
                 year = year + 1
 
-            # subdaily variables
-            shape = (self.decisions_per_day + 1,)
-            daily_storage_co = np.empty(shape)
-            daily_level_co = np.empty(shape)
-            daily_storage_mr = np.empty(shape)
-            daily_level_mr = np.empty(shape)
-
-            shape = (self.decisions_per_day,)
-            daily_release_a = np.empty(shape)
-            daily_release_b = np.empty(shape)
-            daily_release_c = np.empty(shape)
-            daily_release_d = np.empty(shape)
-
             # initialization of sub-daily cycle
-            daily_level_co[0] = level_co[t]  # level_co[day_of_year] <<< in flood
-            daily_storage_co[0] = storage_co[t]
-            daily_level_mr[0] = level_mr[t]
-            daily_storage_mr[0] = storage_mr[t]
-
-            # sub-daily cycle
+            daily_level_co[0] = level_co_t  # level_co[day_of_year] <<< in flood
+            daily_storage_co[0] = storage_co
+            daily_level_mr[0] = level_mr_t
+            daily_storage_mr[0] = storage_mr
 
-            counter = 0 # counter for hydro
+            # hydropower revenue / production of Conowingo over the day
+            daily_revenue_co = 0.0
+            daily_production_co = 0.0
 
+            # sub-daily cycle
             for j in range(self.decisions_per_day):
                 decision_step = t * self.decisions_per_day + j
 
@@ -1040,7 +2035,8 @@ class SusquehannaModel:
                     # FIXME will crash because uu is empty list
                     uu.append(uu[0])
                 elif opt_met == 1:  # RBF-PSO
-                    rbf_input = np.asarray([jj, daily_level_co[j]])
+                    rbf_input[0] = jj
+                    rbf_input[1] = daily_level_co[j]
                     uu = self.apply_rbf_policy(rbf_input)
 
                 # system transition
@@ -1073,137 +2069,317 @@ class SusquehannaModel:
                 daily_release_d[j] = ss_rr_hp[5]
 
                 # Hydropower revenue production
-                hydropowerRevenue_Co.append(
-                    ss_rr_hp[6]
-                )  # 6-hours energy revenue ($/6h)
-                hydropowerPumpRevenue_MR.append(
-                    ss_rr_hp[7]
-                )  # 6-hours energy revenue ($/6h) at MR
-                hydropowerRevenue_MR.append(
-                    ss_rr_hp[8]
-                )  # 6-hours energy revenue ($/6h) at MR
-                hydropowerProduction_Co.append(
-                    ss_rr_hp[9]
-                )  # 6-hours energy production (kWh/6h)
-                # print("the length" , len(hydropowerProduction_Co))
-                hydroPump_MR.append(
-                    ss_rr_hp[10]
-                )  # 6-hours energy production (kWh/6h) at MR
-                hydropowerProduction_MR.append(
-                    ss_rr_hp[11]
-                )  # 6-hours energy production (kWh/6h) at MR
-
-            if (len(hydropowerProduction_Co) == (self.decisions_per_day * self.n_days_in_year)):
-                j_hydro_production_daily_one_year = SusquehannaModel.daily_hydropower_average(hydropowerProduction_Co)
-
-
-            # daily values, need to convert to monthly values
-            level_co[day_of_year + 1] = daily_level_co[self.decisions_per_day]
-            storage_co[t + 1] = daily_storage_co[self.decisions_per_day]
-
-            storage_co_yearly.append(storage_co[t+1])
-
-            release_a[day_of_year] = np.mean(daily_release_a)
-            release_b[day_of_year] = np.mean(daily_release_b)
-            release_c[day_of_year] = np.mean(daily_release_c)
-            release_d[day_of_year] = np.mean(daily_release_d)
-            level_mr[t + 1] = daily_level_mr[self.decisions_per_day]
-            storage_mr[t + 1] = daily_storage_mr[self.decisions_per_day]
-
-
-            # # daily reliability values
-            j_atom_daily = self.g_vol_rel_daily(release_a[day_of_year], self.w_atomic)
-            j_balt_daily = self.g_vol_rel_daily(release_b[day_of_year], self.w_baltimore)
-            j_ches_daily = self.g_vol_rel_daily(release_c[day_of_year], self.w_chester)
-            j_env_daily = self.g_shortage_index_daily(release_d[day_of_year], self.min_flow)
-
-            # append daily results to empty yearly array
-            j_atom_yearly_array.append(j_atom_daily)
-            j_balt_yearly_array.append(j_balt_daily)
-            j_ches_yearly_array.append(j_ches_daily)
-            j_env_yearly_array.append(j_env_daily)
-            # j_rec_yearly_array.append(j_rec_daily)
-
-
-        # Calculate monthly averages from the yearly array
-        j_atom_monthly = SusquehannaModel.monthly_average(j_atom_yearly_array)
-        j_balt_monthly = SusquehannaModel.monthly_average(j_balt_yearly_array)
-        j_ches_monthly = SusquehannaModel.monthly_average(j_ches_yearly_array)
-        j_env_monthly = SusquehannaModel.monthly_average(j_env_yearly_array)
-        # j_rec_monthly = SusquehannaModel.monthly_average(j_rec_yearly_array) # not possible to do this because of the formulation of Giuliani et al. (2014)
-
-
-        # compute objectives
-        j_hyd = (
-            sum(hydropowerRevenue_Co) / self.n_years / pow(10, 6)
-        )  # GWh/year (M$/year)
-        j_atom = self.g_vol_rel(release_a, self.w_atomic)
-        j_balt = self.g_vol_rel(release_b, self.w_baltimore)
-        j_ches = self.g_vol_rel(release_c, self.w_chester)
-        j_env = self.g_shortage_index_daily(release_d, self.min_flow)
-        j_rec = self.g_storagereliability(storage_co, self.h_ref_rec)
-
-        # AND YOUUUUU ARE TROUBLE TROUBLE TROUBLEEEEE
-        j_rec_monthly = SusquehannaModel.g_storagereliability_monthly(j_rec)
-
-        ## Computing reliability of hydropower on aggregated yearly basis
-        hydropower_production_Co_mean = utils.computeMean(j_hydro_production_daily_one_year)
-        j_hydro_reliability_yearly_average = SusquehannaModel.j_hydro_reliability_energy(hydropower_production_Co_mean, 'yearly')
-
-
+                daily_revenue_co += ss_rr_hp[6]  # 6-hours energy revenue ($/6h)
+                daily_production_co += ss_rr_hp[9]  # 6-hours energy production (kWh/6h)
+
+            # daily values
+            level_co_t = daily_level_co[self.decisions_per_day]
+            storage_co = daily_storage_co[self.decisions_per_day]
+            level_mr_t = daily_level_mr[self.decisions_per_day]
+            storage_mr = daily_storage_mr[self.decisions_per_day]
+
+            daily_release[0] = np.mean(daily_release_a)
+            daily_release[1] = np.mean(daily_release_b)
+            daily_release[2] = np.mean(daily_release_c)
+            daily_release[3] = np.mean(daily_release_d)
+
+            accumulator.add_day(
+                daily_release,
+                storage_co,
+                daily_production_co / self.decisions_per_day,
+                daily_revenue_co,
+            )
+            if log:
+                level_co[t + 1] = level_co_t
+                level_mr[t + 1] = level_mr_t
+                releases[:, t] = daily_release
+
+        # compute objectives, nan for the ones not requested
+        objective_values, reliability_gini, reliability_eucli = (
+            accumulator.objectives(self.n_years, compute)
+        )
+        y = tuple(objective_values.tolist())
 
-        ## Going through some steps to get the reliability of Hydropower on a monthly basis, which is different to the situation above
+        # log level / release
+        if log:
+            self.blevel_CO.append(level_co)
+            self.blevel_MR.append(level_mr)
+            self.ratom.append(releases[0])
+            self.rbalt.append(releases[1])
+            self.rches.append(releases[2])
+            self.renv.append(releases[3])
+            self.gini_yearly_mean_coeff.append(y[7])
+            self.eucli_yearly_mean_coeff.append(y[8])
+            self.gini_monthly_std_coeff.append(y[9])
+            self.eucli_monthly_std_coeff.append(y[10])
+            self.j_hydro_reliability_yearly_mean.append(y[6])
+            self.gini_monthly.append(reliability_gini.tolist())
+            self.eucli_monthly.append(reliability_eucli.tolist())
+            self.gini_ratio.append(y[11])
+            self.eucli_ratio.append(y[12])
+
+        return y
+
+    def kernel_arguments(self, var, hydrology, objectives=None):
+        '''
+        Arguments of simulation_kernel.simulate and simulate_ensemble, up to
+        the objective mask
 
-        # First calculate hydro reliabity on a daily basis
-        j_hydro_reliability_yearly = SusquehannaModel.j_hydro_reliability_energy(j_hydro_production_daily_one_year,
-                                                                                 'daily')
+        :param var: decision variables of the policy
+        :param hydrology: inflow, lateral inflow, Muddy Run inflow,
+            Conowingo evaporation and Muddy Run evaporation
+        :return: list
+        '''
+        return [
+            np.asarray(var, dtype=np.float64),
+            self.rbf.c_i,
+            self.rbf.r_i,
+            self.rbf.w_i,
+            self.rbf.n_rbfs,
+            self.rbf.n_inputs,
+            self.rbf.n_outputs,
+            self.rbf_id,
+            np.asarray(self.input_max, dtype=np.float64),
+            np.asarray(self.output_max, dtype=np.float64),
+            float(self.init_level),
+            float(self.init_level_MR),
+            self.day0,
+            self.n_years,
+            *hydrology,
+            self.lsv_rel,
+            self.lsv_rel_Muddy,
+            self.tailwater,
+            self.lookup_table_rows,
+            self.turbines,
+            self.spillways,
+            self.energy_prices,
+            self.min_flow,
+            self.h_ref_rec,
+            self.w_atomic,
+            self.w_baltimore,
+            self.w_chester,
+            np.asarray(
+                [self.min_level_app, self.min_level_baltimore,
+                 self.min_level_chester]
+            ),
+            SusquehannaModel.objective_mask(objectives),
+        ]
+
+    def simulate_compiled(
+        self,
+        input_variable_list_var,
+        inflow_MC_n_sim,
+        inflowLateral_MC_n_lat,
+        inflow_Muddy_MC_n_mr,
+        evap_CO_MC_e_co,
+        evap_Muddy_MC_e_mr,
+        opt_met,
+        objectives=None,
+    ):
+        '''
+        Same as simulate, but runs the full simulation as a single call to
+        the compiled kernel in simulation_kernel. Only the RBF policy
+        (opt_met == 1) is supported.
 
-        # Now we can calculate the monthly average of hydropower reliability
-        j_hydro_monthly = SusquehannaModel.monthly_average(j_hydro_reliability_yearly)
+        :return: the 13 objectives in the same order as simulate
+        '''
+        if opt_met != 1:
+            raise ValueError("the compiled engine only supports opt_met=1")
+        log = getattr(self, "log_objectives", False)
+        if log:
+            objectives = None
+
+        (
+            objectives,
+            level_co,
+            level_mr,
+            releases,
+            reliability_gini,
+            reliability_eucli,
+        ) = simulation_kernel.simulate(
+            *self.kernel_arguments(
+                input_variable_list_var,
+                (
+                    inflow_MC_n_sim,
+                    inflowLateral_MC_n_lat,
+                    inflow_Muddy_MC_n_mr,
+                    evap_CO_MC_e_co,
+                    evap_Muddy_MC_e_mr,
+                ),
+                objectives,
+            ),
+            log,
+        )
 
-        # For reliability calculation of distances Euclidean and Gini:
-        n_months = 12 # total months
+        # log level / release
+        if log:
+            self.blevel_CO.append(level_co)
+            self.blevel_MR.append(level_mr)
+            self.ratom.append(releases[0])
+            self.rbalt.append(releases[1])
+            self.rches.append(releases[2])
+            self.renv.append(releases[3])
+            self.gini_yearly_mean_coeff.append(objectives[7])
+            self.eucli_yearly_mean_coeff.append(objectives[8])
+            self.gini_monthly_std_coeff.append(objectives[9])
+            self.eucli_monthly_std_coeff.append(objectives[10])
+            self.j_hydro_reliability_yearly_mean.append(objectives[6])
+            self.gini_monthly.append(list(reliability_gini))
+            self.eucli_monthly.append(list(reliability_eucli))
+            self.gini_ratio.append(objectives[11])
+            self.eucli_ratio.append(objectives[12])
+
+        return tuple(objectives.tolist())
+
+
+    def simulate_batch(
+        self,
+        input_variable_matrix,
+        inflow_MC_n_sim,
+        inflowLateral_MC_n_lat,
+        inflow_Muddy_MC_n_mr,
+        evap_CO_MC_e_co,
+        evap_Muddy_MC_e_mr,
+        opt_met,
+        objectives=None,
+    ):
+        '''
+        Population version of simulate. All policies advance through the
+        daily / 4-hourly loop together, every state variable carries a
+        leading policy axis and the objectives are accumulated day by day.
+        Levels and releases are not logged.
+
+        :param input_variable_matrix: shape (n_policies, n_decision_vars)
+        :param inflow_MC_n_sim: like the other hydrology arrays either
+            (n_years, 365), shared by all policies, or (n_policies, n_years,
+            365), a trace per policy as in evaluate_ensemble
+        :return: objectives, shape (n_policies, 13), in the order of simulate
+        '''
+        if opt_met != 1:
+            raise ValueError("batched simulation only supports opt_met=1")
+        compute = SusquehannaModel.objective_mask(objectives)
+        monthly = compute[9] or compute[10]
+
+        X = np.asarray(input_variable_matrix, dtype=float)
+        n_policies = X.shape[0]
+        inflow_MC_n_sim = np.asarray(inflow_MC_n_sim)
+        inflowLateral_MC_n_lat = np.asarray(inflowLateral_MC_n_lat)
+        inflow_Muddy_MC_n_mr = np.asarray(inflow_Muddy_MC_n_mr)
+        evap_CO_MC_e_co = np.asarray(evap_CO_MC_e_co)
+        evap_Muddy_MC_e_mr = np.asarray(evap_Muddy_MC_e_mr)
+        HH = self.hours_between_decisions
+        sim_step = 3600  # s/hour
+        leak = 800  # cfs
 
-        for i in range(n_months):
-            reliability_monthly = [j_atom_monthly[i], j_balt_monthly[i], j_ches_monthly[i], j_env_monthly[i], j_rec_monthly[i], j_hydro_monthly[i]]
-            reliability_euclidean_distance_monthly = SusquehannaModel.euclidean_distance_scipy(reliability_monthly)
-            reliability_gini_distance_monthly = SusquehannaModel.gini_coefficient_scipy(reliability_monthly)
+        centers, radii, weights = self.rbf.unpack_decision_vars_batch(X)
+        input_max = np.asarray(self.input_max, dtype=float)
+        output_max = np.asarray(self.output_max, dtype=float)
+
+        # objectives are accumulated day by day for all policies
+        accumulator = ObjectiveAccumulator(
+            self.w_atomic,
+            self.w_baltimore,
+            self.w_chester,
+            self.min_flow,
+            self.h_ref_rec,
+            simulation_kernel.hydro_reliability_target(),
+            self.n_days_in_year,
+            n_policies,
+        )
 
-            # Save everything to an empty list made at the beginning:
-            reliability_gini.append(reliability_gini_distance_monthly)
-            reliability_eucli.append(reliability_euclidean_distance_monthly)
+        # initial condition
+        s_co = np.full(n_policies, self.level_to_storage(self.init_level, 1))
+        s_mr = np.full(n_policies, self.level_to_storage(self.init_level_MR, 0))
+        h_co = np.full(n_policies, float(self.init_level))
+        accumulator.reset(s_co, monthly=monthly)
 
-        # calculate standard deviation between objectives
-        eucli_std = SusquehannaModel.reliability_std(reliability_eucli)
-        gini_std = SusquehannaModel.reliability_std(reliability_gini)
+        decision_steps_per_year = self.n_days_in_year * self.decisions_per_day
+        rbf_input = np.empty((n_policies, 2))
 
-        # reliability yearly
+        for t in range(self.time_horizon_H):
+            day_of_week = (self.day0 + t) % 7
+            day_of_year = t % self.n_days_in_year
+            year = t // self.n_days_in_year
+
+            n_sim = inflow_MC_n_sim[..., year, day_of_year]
+            n_lat = inflowLateral_MC_n_lat[..., year, day_of_year]
+            ev = utils.inchesToFeet(evap_CO_MC_e_co[..., year, day_of_year])
+            n_sim_mr = inflow_Muddy_MC_n_mr[..., year, day_of_year]
+            ev_mr = utils.inchesToFeet(
+                evap_Muddy_MC_e_mr[..., year, day_of_year]
+            )
 
-        reliability_yearly = [j_atom, j_balt, j_ches, j_env, j_rec, j_hydro_reliability_yearly_average]
+            daily_release = np.zeros((n_policies, 4))
+            production_co = np.zeros(n_policies)
+            revenue_co = np.zeros(n_policies)
 
-        gini_mean = SusquehannaModel.gini_coefficient_scipy(reliability_yearly)
-        eucli_mean = SusquehannaModel.euclidean_distance_scipy(reliability_yearly)
+            for j in range(self.decisions_per_day):
+                jj = (t * self.decisions_per_day + j) % decision_steps_per_year
 
-        gini_ratio_value = gini_std/gini_mean
-        eucli_ratio_value = eucli_std/eucli_mean
+                # compute decision
+                rbf_input[:, 0] = jj
+                rbf_input[:, 1] = h_co
+                uu = (
+                    self.rbf.apply_rbfs_batch(
+                        rbf_input / input_max, centers, radii, weights
+                    )
+                    * output_max
+                )
 
-        # log level / release
-        if self.log_objectives:
-            self.blevel_CO.append(level_co)
-            self.blevel_MR.append(level_mr)
-            self.ratom.append(release_a)
-            self.rbalt.append(release_b)
-            self.rches.append(release_c)
-            self.renv.append(release_d)
-            self.gini_yearly_mean_coeff.append(gini_mean)
-            self.eucli_yearly_mean_coeff.append(eucli_mean)
-            self.gini_monthly_std_coeff.append(gini_std)
-            self.eucli_monthly_std_coeff.append(eucli_std)
-            self.j_hydro_reliability_yearly_mean.append(j_hydro_reliability_yearly_average)
-            self.gini_monthly.append(reliability_gini)
-            self.eucli_monthly.append(reliability_eucli)
-            self.gini_ratio.append(gini_ratio_value)
-            self.eucli_ratio.append(eucli_ratio_value)
-
-        return j_hyd, j_atom, j_balt, j_ches, j_env, j_rec, j_hydro_reliability_yearly_average, gini_mean, eucli_mean, gini_std,  eucli_std, gini_ratio_value, eucli_ratio_value
+                # system transition
+                for i in range(HH):
+                    c_hour = HH * j + i
+                    h_co = self.storage_to_level_array(s_co, 1)
+                    h_mr = self.storage_to_level_array(s_mr, 0)
+
+                    # Muddy Run operation
+                    q_pump, q_rel = self.muddyrun_pumpturb_batch(
+                        day_of_week, c_hour, h_co, h_mr
+                    )
+
+                    # Compute actual release
+                    rr = self.actual_release_batch(uu, h_co, day_of_year)
+                    daily_release += rr
+                    WS = rr[:, 0] + rr[:, 1] + rr[:, 2]
+
+                    # Compute surface level and evaporation losses
+                    evaporation_losses_Co = (
+                        ev * self.level_to_surface_array(h_co, 1) / 86400
+                    )
+                    evaporation_losses_MR = (
+                        ev_mr * self.level_to_surface_array(h_mr, 0) / 86400
+                    )
+
+                    # hourly hydropower production/revenue
+                    production, revenue = self.g_hydRevCo_batch(
+                        rr[:, 3], h_co, c_hour, day_of_year
+                    )
+                    production_co += production
+                    revenue_co += revenue
+
+                    # System Transition
+                    s_mr = s_mr + sim_step * (
+                        q_pump - q_rel + n_sim_mr - evaporation_losses_MR
+                    )
+                    s_co = s_co + sim_step * (
+                        n_sim
+                        + n_lat
+                        - rr[:, 3]
+                        - WS
+                        - evaporation_losses_Co
+                        - q_pump
+                        + q_rel
+                        - leak
+                    )
+                h_co = self.storage_to_level_array(s_co, 1)
+
+            accumulator.add_day(
+                daily_release / (HH * self.decisions_per_day),
+                s_co,
+                production_co / self.decisions_per_day,
+                revenue_co,
+            )
 
+        # compute objectives, nan for the ones not requested
+        y, _, _ = accumulator.objectives(self.n_years, compute)
+        return y
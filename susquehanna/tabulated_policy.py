@@ -0,0 +1,166 @@
+"""
+Tabulated RBF policies.
+
+Re-evaluating a Pareto set over long records or many stochastic traces
+calls the same policy millions of times. A TabulatedPolicy samples the
+release policy once on a dense (decision step X Conowingo level) grid and
+afterwards evaluates it by bilinear interpolation instead of re-running the
+basis functions.
+
+Tabulating a policy costs more than a simulation with the exact policy, so
+it only pays off when a policy is evaluated many times. During an
+optimisation every candidate is a new policy evaluated once, the tables
+only slow it down; a PolicyTableCache warns when it is used that way.
+"""
+import warnings
+from collections import OrderedDict
+
+import numpy as np
+
+
+class TabulatedPolicy:
+    """
+    Release policy sampled on a (decision step X level) grid
+
+    Parameters
+    ----------
+    rbf : RBF
+          with decision variables set
+    input_max : array_like
+                normalization of the inputs (decision step, level)
+    output_max : array_like
+                 scaling of the outputs to releases (cfs)
+    n_steps : int
+              number of decision steps in a year
+    level_range : tuple of float, optional
+                  lowest and highest tabulated Conowingo level (ft)
+    n_levels : int, optional
+               number of tabulated levels
+    time_step : int, optional
+                number of decision steps between tabulated steps, with 1
+                the policy is exact in time
+
+    Attributes
+    ----------
+    table : numpy array
+            3-D, contiguous, releases (cfs) of shape
+            (n_times X n_levels X n_outputs)
+    """
+
+    def __init__(self, rbf, input_max, output_max, n_steps,
+                 level_range=(95.0, 115.0), n_levels=201, time_step=1):
+        self.rbf = rbf
+        self.input_max = np.asarray(input_max, dtype=float)
+        self.output_max = np.asarray(output_max, dtype=float)
+        self.n_steps = n_steps
+        self.time_step = time_step
+        self.level_min, self.level_max = level_range
+        self.n_levels = n_levels
+        self.dl = (self.level_max - self.level_min) / (n_levels - 1)
+
+        # include the last decision step so that interpolation in time never
+        # runs off the table
+        self.steps = np.arange(0, n_steps - 1 + time_step, time_step)
+        self.levels = np.linspace(self.level_min, self.level_max, n_levels)
+
+        steps, levels = np.meshgrid(self.steps, self.levels, indexing="ij")
+        inputs = np.stack([steps.ravel(), levels.ravel()], axis=1)
+        outputs = rbf.apply_rbfs_many(inputs / self.input_max)
+        self.table = np.ascontiguousarray(
+            (outputs * self.output_max).reshape(
+                (self.steps.size, n_levels, -1)
+            )
+        )
+
+    def in_range(self, level):
+        return self.level_min <= level <= self.level_max
+
+    def __call__(self, step, level):
+        """
+        Release (cfs) for decision step step at Conowingo level level, which
+        should be within level_range
+        """
+        t_position = step / self.time_step
+        i = min(int(t_position), self.steps.size - 2)
+        ft = t_position - i
+
+        l_position = (level - self.level_min) / self.dl
+        k = min(int(l_position), self.n_levels - 2)
+        fl = l_position - k
+
+        table = self.table
+        lower = table[i, k] + fl * (table[i, k + 1] - table[i, k])
+        if ft == 0.0:
+            return lower
+        upper = table[i + 1, k] + fl * (table[i + 1, k + 1] - table[i + 1, k])
+        return lower + ft * (upper - lower)
+
+    def exact(self, step, level):
+        """Release (cfs) of the underlying rbf policy"""
+        rbf_input = np.asarray([step, level]) / self.input_max
+        return self.rbf.apply_rbfs(rbf_input) * self.output_max
+
+    def max_deviation(self, n_samples=10000, seed=None):
+        """
+        Maximum absolute release deviation (cfs) per output of the table
+        against the exact policy, over random decision steps and levels
+        within the table
+
+        Returns
+        -------
+        numpy array
+        1-D, shape is (n_outputs,)
+        """
+        rng = np.random.default_rng(seed)
+        steps = rng.integers(0, self.n_steps, n_samples)
+        levels = rng.uniform(self.level_min, self.level_max, n_samples)
+
+        inputs = np.stack([steps, levels], axis=1).astype(float)
+        exact = self.rbf.apply_rbfs_many(inputs / self.input_max)
+        exact = exact * self.output_max
+        tabulated = np.asarray([self(s, h) for s, h in zip(steps, levels)])
+        return np.max(np.abs(tabulated - exact), axis=0)
+
+
+class PolicyTableCache:
+    """
+    Tabulated policies by decision vector, the least recently used table is
+    dropped once maxsize tables are stored
+
+    Warns once if more than maxsize tables were built without any of them
+    being used again, as happens when every policy is evaluated only once.
+    """
+
+    def __init__(self, maxsize=16):
+        self.maxsize = maxsize
+        self.tables = OrderedDict()
+        self.hits = 0
+        self.builds = 0
+
+    def get(self, decision_vars, build):
+        """
+        Return the table of decision_vars, calling build() to create it if
+        it is not cached yet
+        """
+        key = np.asarray(decision_vars, dtype=float).tobytes()
+        try:
+            self.tables.move_to_end(key)
+            self.hits += 1
+            return self.tables[key]
+        except KeyError:
+            table = build()
+            self.builds += 1
+            if self.builds == self.maxsize + 1 and self.hits == 0:
+                warnings.warn(
+                    f"{self.builds} policies were tabulated and none was "
+                    "evaluated again; tabulate_policy is meant for "
+                    "re-evaluating a fixed set of policies and slows down "
+                    "an optimisation"
+                )
+            self.tables[key] = table
+            if len(self.tables) > self.maxsize:
+                self.tables.popitem(last=False)
+            return table
+
+    def __len__(self):
+        return len(self.tables)
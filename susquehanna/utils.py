@@ -1,6 +1,6 @@
 import numpy as np
-import pandas as pd
-from numba import njit
+
+from kernels import f8, kernel, readonly_vector, vector
 
 # Can't load matrix with just numpy for some reason, troubleshoot later
 # # TODO: Set default values to take all rows and all columns
@@ -13,6 +13,10 @@ from numba import njit
 
 # TODO: Set default values to take all rows and all columns
 def loadMatrix(file_name, row, column):
+    # pandas is only needed to parse the data files, not in the workers,
+    # which load the parsed data from data_cache
+    import pandas as pd
+
     output = pd.read_csv(
         file_name,
         header=None,
@@ -63,7 +67,7 @@ def filterDictionaryPercentile(dictionary, percentile):  # Sahiti
     return dictionary
 
 
-@njit
+@kernel((vector, vector, f8), (readonly_vector, readonly_vector, f8))
 def interpolate_linear(X, Y, x):
     dim = len(X) - 1
     # if storage is less than
@@ -82,43 +86,62 @@ def interpolate_linear(X, Y, x):
     return y
 
 
-@njit
+@kernel((vector, vector, vector),
+        (readonly_vector, readonly_vector, vector))
+def interpolate_linear_flat(X, Y, x):
+    y = np.empty(x.size)
+    for i in range(x.size):
+        y[i] = interpolate_linear(X, Y, x[i])
+    return y
+
+
+def interpolate_linear_array(X, Y, x):
+    """
+    Array version of interpolate_linear, x can be of any shape. Values
+    outside of X are extrapolated from the first or last two values.
+    """
+    x = np.asarray(x, dtype=float)
+    y = interpolate_linear_flat(X, Y, x.ravel())
+    return y.reshape(x.shape)
+
+
+@kernel((f8,))
 def gallonToCubicFeet(x):
     conv = 0.13368  # 1 gallon = 0.13368 cf
     return x * conv
 
 
-@njit
+@kernel((f8,))
 def inchesToFeet(x):
     conv = 0.08333  # 1 inch = 0.08333 ft
     return x * conv
 
 
-@njit
+@kernel((f8,))
 def cubicFeetToCubicMeters(x):
     conv = 0.0283  # 1 cf = 0.0283 m3
     return x * conv
 
 
-@njit
+@kernel((f8,))
 def feetToMeters(x):
     conv = 0.3048  # 1 ft = 0.3048 m
     return x * conv
 
 
-@njit
+@kernel((f8,))
 def acreToSquaredFeet(x):
     conv = 43560  # 1 acre = 43560 feet2
     return x * conv
 
 
-@njit
+@kernel((f8,))
 def acreFeetToCubicFeet(x):
     conv = 43560  # 1 acre-feet = 43560 feet3
     return x * conv
 
 
-@njit
+@kernel((f8,))
 def cubicFeetToAcreFeet(x):
     conv = 43560  # 1 acre = 43560 feet2
     return x / conv
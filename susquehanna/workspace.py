@@ -0,0 +1,96 @@
+"""
+Preallocated buffers for SusquehannaModel.simulate.
+
+simulate used to allocate its daily arrays on every simulated day and
+res_transition_h its hourly arrays on every decision step. A
+SimulationWorkspace allocates all of them once and is reused for every
+evaluation. The objectives are accumulated day by day (see accumulators),
+so none of the buffers grows with the time horizon.
+"""
+import numpy as np
+
+
+class SimulationWorkspace:
+    """
+    Buffers for a single simulation, overwritten by every evaluation
+
+    Parameters
+    ----------
+    time_horizon_H : int
+                     number of simulated days, kept for reference
+    decisions_per_day : int
+    hours_between_decisions : int
+    """
+
+    __slots__ = (
+        "time_horizon_H",
+        "decisions_per_day",
+        "hours_between_decisions",
+        # per day, values per decision step
+        "daily_storage_co",
+        "daily_level_co",
+        "daily_storage_mr",
+        "daily_level_mr",
+        "daily_release_a",
+        "daily_release_b",
+        "daily_release_c",
+        "daily_release_d",
+        # per day, average releases
+        "daily_release",
+        # per decision step, hourly values
+        "step_storage_co",
+        "step_level_co",
+        "step_storage_mr",
+        "step_level_mr",
+        "step_release_a",
+        "step_release_b",
+        "step_release_c",
+        "step_release_d",
+        "step_q_pump",
+        "step_q_rel",
+        # rbf input
+        "rbf_input",
+    )
+
+    def __init__(self, time_horizon_H, decisions_per_day,
+                 hours_between_decisions):
+        self.time_horizon_H = time_horizon_H
+        self.decisions_per_day = decisions_per_day
+        self.hours_between_decisions = hours_between_decisions
+
+        shape = (decisions_per_day + 1,)
+        self.daily_storage_co = np.empty(shape)
+        self.daily_level_co = np.empty(shape)
+        self.daily_storage_mr = np.empty(shape)
+        self.daily_level_mr = np.empty(shape)
+
+        shape = (decisions_per_day,)
+        self.daily_release_a = np.empty(shape)
+        self.daily_release_b = np.empty(shape)
+        self.daily_release_c = np.empty(shape)
+        self.daily_release_d = np.empty(shape)
+        self.daily_release = np.empty(4)
+
+        shape = (hours_between_decisions + 1,)
+        self.step_storage_co = np.empty(shape)
+        self.step_level_co = np.empty(shape)
+        self.step_storage_mr = np.empty(shape)
+        self.step_level_mr = np.empty(shape)
+
+        shape = (hours_between_decisions,)
+        self.step_release_a = np.empty(shape)
+        self.step_release_b = np.empty(shape)
+        self.step_release_c = np.empty(shape)
+        self.step_release_d = np.empty(shape)
+        self.step_q_pump = np.empty(shape)
+        self.step_q_rel = np.empty(shape)
+
+        self.rbf_input = np.empty(2)
+
+    def nbytes(self):
+        """Total size of all buffers in bytes"""
+        return sum(
+            getattr(self, name).nbytes
+            for name in self.__slots__
+            if isinstance(getattr(self, name), np.ndarray)
+        )